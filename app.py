@@ -1,51 +1,379 @@
 # app.py (Version 1.8)
-from flask import Flask, request, render_template, jsonify, redirect, send_file
+from flask import Flask, Response, request, render_template, jsonify, redirect, url_for, g
 import json
 import re
 import logging
+import logging.handlers
+import queue
+import atexit
+import itertools
+import gc
 import os
-import tempfile
 import uuid
 import string
 import random
-from urllib.parse import urlparse
+from urllib.parse import urlparse, quote
 import sqlite3
-from io import BytesIO
+import zlib
+import zipfile
+import tarfile
+import hashlib
+import difflib
+import gzip
+import bisect
+import heapq
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+import time
+import functools
+import cProfile
+import pstats
+import marshal
+import hmac
+import io
+import sys
+import ipaddress
+from types import MappingProxyType
+from collections import OrderedDict, namedtuple
+from datetime import datetime, timezone
 
-# Configure logging
-for handler in logging.root.handlers[:]:
-    logging.root.handlers.remove(handler)
+# brotli is optional; without it responses are only gzip-compressed
+try:
+    import brotli
+except ImportError:
+    brotli = None
 
-logging.basicConfig(
-    level=logging.DEBUG,
-    format='%(asctime)s [%(levelname)s] %(message)s',
-    handlers=[logging.StreamHandler()]
-)
+# Logging. Records go through a queue to a listener thread, so request
+# threads never block on stream writes. Components log to children of 'fgc':
+#   fgc.http           request lines and headers
+#   fgc.parse          config parsing and parse jobs
+#   fgc.parse.objects  per-line and per-object parse events (sampled)
+#   fgc.generate       policy generation
+#   fgc.payload        full request/response bodies and generated scripts
+#   fgc.frontend       messages sent by the browser to /log
+# LOG_LEVEL sets the default; LOG_LEVELS overrides per component, e.g.
+# "parse=DEBUG,payload=DEBUG,werkzeug=WARNING" (names without a dot are taken under fgc).
+LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO').upper()
+LOG_LEVELS = os.getenv('LOG_LEVELS', '')
+LOG_FORMAT = os.getenv('LOG_FORMAT', 'text')
+LOG_SAMPLE_EVERY = max(int(os.getenv('LOG_SAMPLE_EVERY', '100')), 1)
+LOG_MAX_CHARS = int(os.getenv('LOG_MAX_CHARS', '2000'))
+
+# Secrets are masked in every log record, whatever logged them
+_SECRET_PATTERN = re.compile(r'''(?i)((?:x-admin-token|admin_token|authorization|cookie)['"]?\s*[:=]\s*['"]?)[^'"&\s,}]+''')
+_LOG_RECORD_FIELDS = set(vars(logging.LogRecord('', 0, '', 0, '', None, None))) | {'message', 'asctime'}
+
+class RedactingFilter(logging.Filter):
+    def filter(self, record):
+        message = _SECRET_PATTERN.sub(r'\1***', record.getMessage())
+        if len(message) > LOG_MAX_CHARS:
+            message = f"{message[:LOG_MAX_CHARS]}... [{len(message) - LOG_MAX_CHARS} more chars]"
+        record.msg, record.args = message, None
+        return True
+
+# Passes one record in every `every`, for events logged once per line or object
+class SamplingFilter(logging.Filter):
+    def __init__(self, every):
+        super().__init__()
+        self.every = every
+        self.counter = itertools.count()
+
+    def filter(self, record):
+        return next(self.counter) % self.every == 0
+
+# One JSON object per line; fields passed with extra={...} are included
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            'time': self.formatTime(record),
+            'level': record.levelname,
+            'component': record.name,
+            'message': record.getMessage()
+        }
+        entry.update({key: value for key, value in vars(record).items() if key not in _LOG_RECORD_FIELDS})
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+def _log_output_handler():
+    handler = logging.StreamHandler()
+    if LOG_FORMAT == 'json':
+        handler.setFormatter(JsonFormatter())
+    else:
+        handler.setFormatter(logging.Formatter('%(asctime)s [%(levelname)s] %(name)s: %(message)s'))
+    handler.addFilter(RedactingFilter())
+    return handler
 
-logger = logging.getLogger(__name__)
+def _parse_log_levels(spec):
+    levels = {}
+    for item in spec.split(','):
+        if '=' not in item:
+            continue
+        name, level = (part.strip() for part in item.split('=', 1))
+        if name not in ('flask', 'werkzeug') and not name.startswith('fgc'):
+            name = f'fgc.{name}'
+        levels[name] = level.upper()
+    return levels
+
+logger = logging.getLogger('fgc')
+http_logger = logging.getLogger('fgc.http')
+parse_logger = logging.getLogger('fgc.parse')
+object_logger = logging.getLogger('fgc.parse.objects')
+generate_logger = logging.getLogger('fgc.generate')
+payload_logger = logging.getLogger('fgc.payload')
+frontend_logger = logging.getLogger('fgc.frontend')
 flask_logger = logging.getLogger('flask')
 werkzeug_logger = logging.getLogger('werkzeug')
 
-for handler in flask_logger.handlers[:]:
-    flask_logger.handlers.remove(handler)
-for handler in werkzeug_logger.handlers[:]:
-    werkzeug_logger.handlers.remove(handler)
+object_logger.addFilter(SamplingFilter(LOG_SAMPLE_EVERY))
+
+# Queue and listener thread of the current process
+_log_state = {'queue': None, 'listener': None}
+
+def _start_log_listener():
+    for handler in logging.root.handlers[:]:
+        logging.root.removeHandler(handler)
+    _log_state['queue'] = queue.SimpleQueue()
+    _log_state['listener'] = logging.handlers.QueueListener(_log_state['queue'], _log_output_handler(),
+                                                            respect_handler_level=True)
+    _log_state['listener'].start()
+    logging.root.addHandler(logging.handlers.QueueHandler(_log_state['queue']))
 
-flask_logger.setLevel(logging.DEBUG)
-werkzeug_logger.setLevel(logging.DEBUG)
-stream_handler = logging.StreamHandler()
-stream_handler.setFormatter(logging.Formatter('%(asctime)s [%(levelname)s] %(message)s'))
-flask_logger.addHandler(stream_handler)
-werkzeug_logger.addHandler(stream_handler)
+# Install handlers and levels; called by create_app, does nothing the second time.
+# Threads do not survive fork, so forked children (pre-fork web workers, parse pool
+# workers) start their own listener.
+def configure_logging():
+    if _log_state['listener'] is not None:
+        return
+    _start_log_listener()
+    atexit.register(lambda: _log_state['listener'].stop())
+    if hasattr(os, 'register_at_fork'):
+        os.register_at_fork(after_in_child=_start_log_listener)
+    logging.root.setLevel(logging.WARNING)
+    for handler in flask_logger.handlers[:] + werkzeug_logger.handlers[:]:
+        flask_logger.removeHandler(handler)
+        werkzeug_logger.removeHandler(handler)
+    for name, level in {'fgc': LOG_LEVEL, 'flask': LOG_LEVEL, 'werkzeug': LOG_LEVEL, **_parse_log_levels(LOG_LEVELS)}.items():
+        logging.getLogger(name).setLevel(level)
+
+REDACTED_HEADERS = {'authorization', 'cookie', 'x-admin-token'}
+
+# Short stand-in for a large payload (form field, uploaded config) in log messages
+def summarize_payload(value, limit=200):
+    return value if len(value) <= limit else f'<{len(value)} chars>'
 
 app = Flask(__name__)
 
-# SQLite database setup
-DB_PATH = '/app/data/database.db'
+# Settings are read from the environment at import into app.config, where
+# create_app(config) may override them; helpers read them from there at call time.
+app.config.update(
+    # SQLite database setup
+    DB_PATH=os.getenv('DB_PATH', '/app/data/database.db'),
+    # Allowed domain for short URLs; required, checked by create_app
+    TRUSTED_DOMAIN=os.getenv('TRUSTED_DOMAIN'),
+    # Alternative locations of the Jinja templates and static assets
+    TEMPLATE_FOLDER=os.getenv('TEMPLATE_FOLDER'),
+    STATIC_FOLDER=os.getenv('STATIC_FOLDER'),
+    # Warm caches in create_app, before a pre-fork server forks its workers
+    PRELOAD=os.getenv('PRELOAD', '').lower() in ('1', 'true', 'yes'),
+    # Store a full template snapshot after this many consecutive delta revisions
+    REVISION_SNAPSHOT_INTERVAL=int(os.getenv('REVISION_SNAPSHOT_INTERVAL', '10')),
+    # Seconds between checks of the shared state_versions counters by in-memory snapshots
+    STATE_VERSION_CHECK_INTERVAL=float(os.getenv('STATE_VERSION_CHECK_INTERVAL', '1.0')),
+    # Number of decoded per-device parsed configs kept in memory
+    DEVICE_CACHE_SIZE=int(os.getenv('DEVICE_CACHE_SIZE', '8')),
+    # Background parse jobs: worker processes, and how many more jobs may wait for one
+    PARSE_WORKERS=int(os.getenv('PARSE_WORKERS', '2')),
+    PARSE_QUEUE_LIMIT=int(os.getenv('PARSE_QUEUE_LIMIT', '8')),
+    # Seconds without an update after which a queued or running parse job counts as lost
+    PARSE_JOB_STALE_SECONDS=float(os.getenv('PARSE_JOB_STALE_SECONDS', '900')),
+    # Firewall policies per template created by /import_policies
+    POLICY_IMPORT_CHUNK=int(os.getenv('POLICY_IMPORT_CHUNK', '500')),
+    # Above this many names, /catalog leaves a picker's lists out and the UI queries /search
+    REMOTE_SEARCH_THRESHOLD=int(os.getenv('REMOTE_SEARCH_THRESHOLD', '1000')),
+    # Admin token for /admin endpoints and opt-in request profiling; both are off when unset
+    ADMIN_TOKEN=os.getenv('ADMIN_TOKEN', ''),
+    PROFILE_SAMPLE_INTERVAL=float(os.getenv('PROFILE_SAMPLE_INTERVAL', '0.005')),
+    PROFILE_KEEP=int(os.getenv('PROFILE_KEEP', '50')),
+    # Templates per bulk import bundle
+    BULK_IMPORT_MAX_TEMPLATES=int(os.getenv('BULK_IMPORT_MAX_TEMPLATES', '5000')),
+    # Frontend log ingestion: each client may post FRONTEND_LOG_RATE batches per minute
+    # (with a burst of as many), of at most FRONTEND_LOG_MAX_BYTES and
+    # FRONTEND_LOG_MAX_ENTRIES entries
+    FRONTEND_LOG_RATE=float(os.getenv('FRONTEND_LOG_RATE', '30')),
+    FRONTEND_LOG_MAX_BYTES=int(os.getenv('FRONTEND_LOG_MAX_BYTES', '65536')),
+    FRONTEND_LOG_MAX_ENTRIES=int(os.getenv('FRONTEND_LOG_MAX_ENTRIES', '100'))
+)
+
+PARSE_PROGRESS_INTERVAL = 0.5
+PROFILE_REPORT_LINES = 40
+
+# Bulk template import: bytes per zip member, templates per INSERT batch
+BULK_IMPORT_MAX_MEMBER_BYTES = int(os.getenv('BULK_IMPORT_MAX_MEMBER_BYTES', str(16 * 1024 * 1024)))
+BULK_IMPORT_BATCH = 200
+
+# Templates read per query by the library export. Each page is read and the connection
+# closed before its archive members are sent, so a slow download never holds a read lock.
+EXPORT_PAGE_SIZE = 50
+
+FRONTEND_LOG_CLIENTS = 1024
+
+# Metrics: kept in process memory and served at /metrics in the Prometheus text format.
+# Only clients in METRICS_ALLOWED_NETWORKS (loopback by default) may read them.
+METRICS_ALLOWED_NETWORKS = [
+    ipaddress.ip_network(network.strip(), strict=False)
+    for network in os.getenv('METRICS_ALLOWED_NETWORKS', '127.0.0.0/8,::1/128').split(',') if network.strip()
+]
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+BYTES_BUCKETS = (1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216, 67108864)
+
+# name -> {'type', 'help', 'labels', 'buckets', 'series': {label values: value}}.
+# Counter series hold a number; histogram series hold [per-bucket counts..., sum, count].
+_metrics = OrderedDict()
+_metrics_lock = threading.Lock()
+
+def register_metric(name, metric_type, help_text, labels=(), buckets=None):
+    _metrics[name] = {'type': metric_type, 'help': help_text, 'labels': labels, 'buckets': buckets, 'series': {}}
+
+def inc_counter(name, label_values=(), amount=1):
+    series = _metrics[name]['series']
+    with _metrics_lock:
+        series[label_values] = series.get(label_values, 0) + amount
+
+def observe(name, value, label_values=()):
+    metric = _metrics[name]
+    buckets = metric['buckets']
+    bucket = bisect.bisect_left(buckets, value)
+    with _metrics_lock:
+        series = metric['series'].get(label_values)
+        if series is None:
+            series = metric['series'][label_values] = [0] * (len(buckets) + 2)
+        if bucket < len(buckets):
+            series[bucket] += 1
+        series[-2] += value
+        series[-1] += 1
+
+# Time the wrapped SQLite helper into fgc_db_query_duration_seconds
+def timed_query(func):
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            observe('fgc_db_query_duration_seconds', time.perf_counter() - started, (func.__name__,))
+    return wrapper
+
+def _format_labels(pairs):
+    if not pairs:
+        return ''
+    escaped = []
+    for name, value in pairs:
+        value = str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+        escaped.append(f'{name}="{value}"')
+    return '{' + ','.join(escaped) + '}'
+
+def render_metrics():
+    with _metrics_lock:
+        snapshot = [(name, metric, {labels: list(value) if isinstance(value, list) else value
+                                    for labels, value in metric['series'].items()})
+                    for name, metric in _metrics.items()]
+    lines = []
+    for name, metric, series in snapshot:
+        lines.append(f"# HELP {name} {metric['help']}")
+        lines.append(f"# TYPE {name} {metric['type']}")
+        for label_values, value in sorted(series.items()):
+            pairs = list(zip(metric['labels'], label_values))
+            if metric['type'] != 'histogram':
+                lines.append(f"{name}{_format_labels(pairs)} {value}")
+                continue
+            cumulative = 0
+            for bound, count in zip(metric['buckets'], value):
+                cumulative += count
+                lines.append(f"{name}_bucket{_format_labels(pairs + [('le', bound)])} {cumulative}")
+            lines.append(f"{name}_bucket{_format_labels(pairs + [('le', '+Inf')])} {value[-1]}")
+            lines.append(f"{name}_sum{_format_labels(pairs)} {value[-2]}")
+            lines.append(f"{name}_count{_format_labels(pairs)} {value[-1]}")
+
+    # Hit ratios derived from the lookup counters, for dashboards that do not compute them
+    lookups = {}
+    for name, _, series in snapshot:
+        if name == 'fgc_cache_lookups_total':
+            for (cache, result), count in series.items():
+                lookups.setdefault(cache, {'hit': 0, 'miss': 0})[result] += count
+    lines.append("# HELP fgc_cache_hit_ratio Share of cache lookups served from memory")
+    lines.append("# TYPE fgc_cache_hit_ratio gauge")
+    for cache, counts in sorted(lookups.items()):
+        lines.append(f"fgc_cache_hit_ratio{_format_labels([('cache', cache)])} {counts['hit'] / (counts['hit'] + counts['miss'])}")
+    return '\n'.join(lines) + '\n'
+
+register_metric('fgc_http_requests_total', 'counter', 'HTTP requests by route and status', ('method', 'route', 'status'))
+register_metric('fgc_http_request_duration_seconds', 'histogram', 'HTTP request latency by route',
+                ('method', 'route'), LATENCY_BUCKETS)
+register_metric('fgc_parse_section_duration_seconds', 'histogram', 'Time spent per parse_config extraction stage',
+                ('section',), LATENCY_BUCKETS)
+register_metric('fgc_parse_objects_total', 'counter', 'Objects extracted by parse_config by kind', ('kind',))
+register_metric('fgc_parse_input_bytes', 'histogram', 'Size of parsed config files', (), BYTES_BUCKETS)
+register_metric('fgc_generate_render_duration_seconds', 'histogram', 'generate_policy CLI render time', (), LATENCY_BUCKETS)
+register_metric('fgc_generate_output_bytes', 'histogram', 'Size of CLI rendered by generate_policy', (), BYTES_BUCKETS)
+register_metric('fgc_db_query_duration_seconds', 'histogram', 'SQLite time per helper', ('helper',), LATENCY_BUCKETS)
+register_metric('fgc_cache_lookups_total', 'counter', 'In-memory cache lookups by cache and result', ('cache', 'result'))
+register_metric('fgc_frontend_log_batches_total', 'counter', 'Frontend log batches by outcome', ('result',))
+register_metric('fgc_frontend_log_entries_total', 'counter', 'Frontend log entries logged or dropped', ('result',))
+
+# Compact storage encoding for templates.data and device_configs.config_data.
+# Top-level lists of records (policies, services) are stored column-wise so their
+# repeated keys appear once, then the document is zlib-compressed. Cells are kept as
+# plain JSON so decoding stays in json.loads/zip. Rows written before this encoding
+# existed are plain JSON text and are still decoded transparently.
+STORAGE_MAGIC = b'FGC1'
+_COLUMNS_MARKER = '\x00columns'
+
+def _to_columns(records):
+    keys = list(dict.fromkeys(k for record in records for k in record))
+    missing = {}
+    for index, key in enumerate(keys):
+        absent = [row for row, record in enumerate(records) if key not in record]
+        if absent:
+            missing[str(index)] = absent
+    columns = [[record.get(key) for record in records] for key in keys]
+    return {_COLUMNS_MARKER: keys, 'rows': len(records), 'data': columns, 'missing': missing}
+
+def _from_columns(encoded):
+    keys = encoded[_COLUMNS_MARKER]
+    if keys:
+        records = [dict(zip(keys, cells)) for cells in zip(*encoded['data'])]
+    else:
+        records = [{} for _ in range(encoded['rows'])]
+    for index, absent in encoded['missing'].items():
+        key = keys[int(index)]
+        for row in absent:
+            del records[row][key]
+    return records
+
+def encode_document(document):
+    columnar = {}
+    for key, value in document.items():
+        if isinstance(value, list) and value and all(isinstance(item, dict) for item in value):
+            value = _to_columns(value)
+        columnar[key] = value
+    payload = json.dumps(columnar, separators=(',', ':')).encode('utf-8')
+    return STORAGE_MAGIC + zlib.compress(payload, 6)
+
+def decode_document(stored):
+    if not isinstance(stored, (bytes, memoryview)) or bytes(stored[:len(STORAGE_MAGIC)]) != STORAGE_MAGIC:
+        return json.loads(stored)
+    document = json.loads(zlib.decompress(bytes(stored[len(STORAGE_MAGIC):])))
+    for key, value in document.items():
+        if isinstance(value, dict) and _COLUMNS_MARKER in value:
+            document[key] = _from_columns(value)
+    return document
 
 def init_db():
-    os.makedirs(os.path.dirname(DB_PATH), exist_ok=True)
-    conn = sqlite3.connect(DB_PATH)
+    os.makedirs(os.path.dirname(app.config['DB_PATH']), exist_ok=True)
+    conn = sqlite3.connect(app.config['DB_PATH'])
     cursor = conn.cursor()
     cursor.execute('''
         CREATE TABLE IF NOT EXISTS templates (
@@ -65,26 +393,415 @@ def init_db():
             config_data TEXT NOT NULL
         )
     ''')
+    cursor.execute('PRAGMA table_info(templates)')
+    if 'summary' not in [row[1] for row in cursor.fetchall()]:
+        # Materialized object summary; NULL until the template is next saved or read
+        cursor.execute('ALTER TABLE templates ADD COLUMN summary TEXT')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS device_configs (
+            device TEXT PRIMARY KEY,
+            config_data TEXT NOT NULL,
+            updated_at TEXT NOT NULL
+        )
+    ''')
+    # Move a parsed config from the old single-row last_config table into the device store
+    cursor.execute('SELECT COUNT(*) FROM device_configs')
+    if cursor.fetchone()[0] == 0:
+        cursor.execute('SELECT config_data FROM last_config ORDER BY id DESC LIMIT 1')
+        legacy = cursor.fetchone()
+        if legacy:
+            cursor.execute('INSERT INTO device_configs (device, config_data, updated_at) VALUES (?, ?, ?)',
+                           ('default', legacy[0], datetime.now(timezone.utc).isoformat()))
+            cursor.execute('DELETE FROM last_config')
+            logger.info("Migrated last_config row to device 'default'")
+    # Re-encode rows still stored as JSON text
+    for table, key_column, data_column in (('templates', 'name', 'data'), ('device_configs', 'device', 'config_data')):
+        cursor.execute(f"SELECT {key_column}, {data_column} FROM {table} WHERE typeof({data_column}) = 'text'")
+        legacy_rows = cursor.fetchall()
+        for row_key, text in legacy_rows:
+            try:
+                encoded = encode_document(json.loads(text))
+            except ValueError as e:
+                logger.warning("Leaving undecodable %s row '%s' as text: %s", table, row_key, e)
+                continue
+            cursor.execute(f"UPDATE {table} SET {data_column} = ? WHERE {key_column} = ?", (encoded, row_key))
+        if legacy_rows:
+            logger.info("Migrated %d %s rows to compact storage encoding", len(legacy_rows), table)
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS state_versions (
+            key TEXT PRIMARY KEY,
+            version INTEGER NOT NULL
+        )
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS parse_jobs (
+            job_id TEXT PRIMARY KEY,
+            device TEXT NOT NULL,
+            status TEXT NOT NULL,
+            progress TEXT,
+            result TEXT,
+            error TEXT,
+            created_at TEXT NOT NULL,
+            updated_at TEXT NOT NULL
+        )
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS template_revisions (
+            template_name TEXT NOT NULL,
+            revision INTEGER NOT NULL,
+            kind TEXT NOT NULL,
+            checksum TEXT NOT NULL,
+            data BLOB NOT NULL,
+            created_at TEXT NOT NULL,
+            PRIMARY KEY (template_name, revision)
+        )
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS template_references (
+            name TEXT NOT NULL,
+            kind TEXT NOT NULL,
+            template_name TEXT NOT NULL,
+            policy_id TEXT NOT NULL,
+            field TEXT NOT NULL,
+            policy_name TEXT NOT NULL,
+            PRIMARY KEY (name, kind, template_name, policy_id, field)
+        ) WITHOUT ROWID
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS template_references_by_template ON template_references (template_name)')
+    # (Re)build the index when it is new or was built by an older template_reference_rows
+    cursor.execute("SELECT version FROM state_versions WHERE key = 'reference_index'")
+    built = cursor.fetchone()
+    if not built or built[0] != REFERENCE_INDEX_VERSION:
+        cursor.execute('DELETE FROM template_references')
+        cursor.execute('SELECT name, data FROM templates')
+        rows = cursor.fetchall()
+        for template_name, data in rows:
+            update_template_references(cursor, template_name, decode_document(data))
+        cursor.execute('''
+            INSERT INTO state_versions (key, version) VALUES ('reference_index', ?)
+            ON CONFLICT(key) DO UPDATE SET version = excluded.version
+        ''', (REFERENCE_INDEX_VERSION,))
+        if rows:
+            logger.info("Built object reference index for %d templates", len(rows))
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS drift_reports (
+            device TEXT PRIMARY KEY,
+            report BLOB NOT NULL,
+            created_at TEXT NOT NULL
+        )
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS policy_analyses (
+            device TEXT PRIMARY KEY,
+            rulebase BLOB NOT NULL,
+            report BLOB NOT NULL,
+            created_at TEXT NOT NULL
+        )
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS device_backups (
+            backup_id INTEGER PRIMARY KEY AUTOINCREMENT,
+            device TEXT NOT NULL,
+            root TEXT NOT NULL,
+            lines INTEGER NOT NULL,
+            objects INTEGER NOT NULL,
+            bytes INTEGER NOT NULL,
+            created_at TEXT NOT NULL
+        )
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS device_backups_by_device ON device_backups (device, backup_id)')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS backup_nodes (
+            hash TEXT PRIMARY KEY,
+            data BLOB NOT NULL
+        ) WITHOUT ROWID
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS request_profiles (
+            profile_id TEXT PRIMARY KEY,
+            method TEXT NOT NULL,
+            path TEXT NOT NULL,
+            mode TEXT NOT NULL,
+            status INTEGER,
+            duration_ms REAL,
+            report TEXT,
+            data BLOB,
+            created_at TEXT NOT NULL
+        )
+    ''')
     conn.commit()
     conn.close()
-    logger.debug("SQLite database initialized at %s", DB_PATH)
+    logger.debug("SQLite database initialized at %s", app.config['DB_PATH'])
+
+CONFIG_KEYS = (
+    'DB_PATH', 'TRUSTED_DOMAIN', 'TEMPLATE_FOLDER', 'STATIC_FOLDER', 'PRELOAD', 'REVISION_SNAPSHOT_INTERVAL',
+    'STATE_VERSION_CHECK_INTERVAL', 'DEVICE_CACHE_SIZE', 'PARSE_WORKERS', 'PARSE_QUEUE_LIMIT', 'ADMIN_TOKEN',
+    'PARSE_JOB_STALE_SECONDS', 'PROFILE_SAMPLE_INTERVAL', 'PROFILE_KEEP', 'BULK_IMPORT_MAX_TEMPLATES', 'POLICY_IMPORT_CHUNK', 'REMOTE_SEARCH_THRESHOLD', 'FRONTEND_LOG_RATE', 'FRONTEND_LOG_MAX_BYTES', 'FRONTEND_LOG_MAX_ENTRIES'
+)
+_app_state = {'configured': False}
+_app_state_lock = threading.RLock()
+
+# Application factory. Applies `config` overrides of the settings in CONFIG_KEYS, then
+# sets up logging and the database. With preload (or PRELOAD=1) it also warms the
+# caches; run it in the master of a pre-fork server, e.g.
+#   gunicorn --preload -w 4 'app:create_app(preload=True)'
+# so workers inherit warm state copy-on-write and serve their first request at once.
+def create_app(config=None, preload=None):
+    for key in config or {}:
+        if key not in CONFIG_KEYS:
+            raise ValueError(f"Unknown setting: {key}")
+    with _app_state_lock:
+        app.config.update(config or {})
+        if not app.config['TRUSTED_DOMAIN']:
+            logger.error("TRUSTED_DOMAIN environment variable not set")
+            raise ValueError("TRUSTED_DOMAIN environment variable is required")
+        if app.config['TEMPLATE_FOLDER']:
+            app.template_folder = app.config['TEMPLATE_FOLDER']
+        if app.config['STATIC_FOLDER']:
+            app.static_folder = app.config['STATIC_FOLDER']
+
+        configure_logging()
+        init_db()
+        fail_interrupted_parse_jobs()
+        reset_caches()
+        _app_state['configured'] = True
+        if app.config['PRELOAD'] if preload is None else preload:
+            preload_app()
+    return app
+
+# Plain `app:app` imports (no factory call) are configured from the environment on the
+# first request; concurrent first requests wait for one of them to do it
+@app.before_request
+def ensure_configured():
+    if not _app_state['configured']:
+        with _app_state_lock:
+            if not _app_state['configured']:
+                create_app()
+
+# Small config touching every section parse_config_content looks for, parsed once by
+# preload_app so the parser's regular expressions are compiled before workers fork
+PRELOAD_SAMPLE_CONFIG = """config system global
+    set hostname "preload"
+end
+config system interface
+    edit "port1"
+    next
+end
+config firewall address
+    edit "a1"
+    next
+end
+config firewall addrgrp
+    edit "g1"
+        set member "a1"
+    next
+end
+config firewall internet-service-name
+    edit "isdb1"
+    next
+end
+config firewall vip
+    edit "v1"
+    next
+end
+config firewall ippool
+    edit "p1"
+    next
+end
+config firewall service custom
+    edit "s1"
+        set tcp-portrange 80
+    next
+end
+config firewall service group
+    edit "sg1"
+        set member "s1"
+    next
+end
+config user local
+    edit "u1"
+    next
+end
+config user group
+    edit "ug1"
+    next
+end
+config firewall ssl-ssh-profile
+    edit "ssl1"
+    next
+end
+config webfilter profile
+    edit "wf1"
+    next
+end
+config antivirus profile
+    edit "av1"
+    next
+end
+config application list
+    edit "app1"
+    next
+end
+config ips sensor
+    edit "ips1"
+    next
+end
+config firewall policy
+    edit 1
+        set srcaddr "a1"
+        set dstaddr "v1"
+        set service "s1"
+        set poolname "p1"
+        set internet-service-id "isdb1"
+    next
+end
+"""
+
+# Warm everything a worker would otherwise build on its first requests. Every SQLite
+# helper closes its connection, so no database handle is open when the server forks.
+def preload_app():
+    started = time.perf_counter()
+    parse_config_content(PRELOAD_SAMPLE_CONFIG)
+    app.jinja_env.get_template('index.html')
+    for filename in os.listdir(app.static_folder):
+        if os.path.isfile(os.path.join(app.static_folder, filename)):
+            static_file_hash(filename)
+    template_names = get_template_names_snapshot()
+    devices = get_devices_snapshot()
+    get_last_config_snapshot()
+    for device in devices[:app.config['DEVICE_CACHE_SIZE']]:
+        get_device_config_snapshot(device)
+    get_search_index()
+    # Keep the collector from touching (and so copying) the preloaded objects after fork
+    gc.collect()
+    gc.freeze()
+    logger.info("Preloaded %d templates and %d devices in %.0f ms", len(template_names), len(devices),
+                1000 * (time.perf_counter() - started))
+
+# Drop in-memory state, e.g. after create_app switched to another database
+def reset_caches():
+    with _snapshot_lock:
+        _snapshots.clear()
+        _device_snapshots.clear()
+        _search_indexes.clear()
+        _state_versions['checked_at'] = None
+        _state_versions['versions'] = {}
+
+# Opt-in request profiling. With ADMIN_TOKEN set, a request carrying the token
+# (X-Admin-Token header or admin_token query arg) and a mode (X-Profile header or
+# profile query arg: 'cprofile' or 'sample') runs under that profiler. Results are
+# stored in request_profiles by id, returned in X-Profile-Id and served from
+# /admin/profiles. Without ADMIN_TOKEN, requests only pay a single falsy check.
+PROFILE_MODES = ('cprofile', 'sample')
+
+def _requested_profile_mode():
+    mode = request.headers.get('X-Profile') or request.args.get('profile')
+    if not mode:
+        return None
+    token = request.headers.get('X-Admin-Token') or request.args.get('admin_token') or ''
+    if not hmac.compare_digest(token.encode('utf-8'), app.config['ADMIN_TOKEN'].encode('utf-8')):
+        logger.warning("Ignoring profile request with invalid admin token from %s", request.remote_addr)
+        return None
+    if mode not in PROFILE_MODES:
+        logger.warning("Ignoring unknown profile mode '%s'", mode)
+        return None
+    return mode
+
+# Sampling profiler: snapshots the request thread's stack into collapsed-stack counts
+def _sample_stacks(thread_id, stop_event, samples):
+    while not stop_event.wait(app.config['PROFILE_SAMPLE_INTERVAL']):
+        frame = sys._current_frames().get(thread_id)
+        stack = []
+        while frame is not None:
+            code = frame.f_code
+            stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+            frame = frame.f_back
+        if stack:
+            key = ';'.join(reversed(stack))
+            samples[key] = samples.get(key, 0) + 1
+
+@app.before_request
+def start_request_profile():
+    if not app.config['ADMIN_TOKEN']:
+        return
+    mode = _requested_profile_mode()
+    if not mode:
+        return
+    g.profile = {'id': uuid.uuid4().hex, 'mode': mode, 'started': time.perf_counter()}
+    if mode == 'cprofile':
+        g.profile['profiler'] = cProfile.Profile()
+        g.profile['profiler'].enable()
+    else:
+        g.profile['samples'] = {}
+        g.profile['stop'] = threading.Event()
+        threading.Thread(target=_sample_stacks, name='request-sampler', daemon=True,
+                         args=(threading.get_ident(), g.profile['stop'], g.profile['samples'])).start()
+
+def _stop_request_profile(profile):
+    duration_ms = 1000 * (time.perf_counter() - profile['started'])
+    if profile['mode'] == 'cprofile':
+        profiler = profile.pop('profiler')
+        profiler.disable()
+        report = io.StringIO()
+        pstats.Stats(profiler, stream=report).sort_stats('cumulative').print_stats(PROFILE_REPORT_LINES)
+        profiler.create_stats()
+        return duration_ms, report.getvalue(), marshal.dumps(profiler.stats)
+    profile['stop'].set()
+    samples = profile['samples']
+    top = sorted(samples.items(), key=lambda item: -item[1])[:PROFILE_REPORT_LINES]
+    report = f"{sum(samples.values())} samples every {app.config['PROFILE_SAMPLE_INTERVAL'] * 1000:g} ms\n" + \
+        '\n'.join(f"{count:6d}  {stack.rsplit(';', 1)[-1]}" for stack, count in top)
+    collapsed = '\n'.join(f"{stack} {count}" for stack, count in samples.items())
+    return duration_ms, report, collapsed.encode('utf-8')
 
-# Initialize database
-init_db()
+@app.after_request
+def finish_request_profile(response):
+    profile = g.pop('profile', None)
+    if profile is None:
+        return response
+    duration_ms, report, data = _stop_request_profile(profile)
+    save_request_profile(profile['id'], request.method, request.full_path.rstrip('?'), profile['mode'],
+                         response.status_code, duration_ms, report, data)
+    response.headers['X-Profile-Id'] = profile['id']
+    logger.info("Profiled %s %s (%s, %.1f ms) as %s", request.method, request.path, profile['mode'],
+                duration_ms, profile['id'])
+    return response
 
-# Get TRUSTED_DOMAIN from environment variable
-TRUSTED_DOMAIN = os.getenv('TRUSTED_DOMAIN')
-if not TRUSTED_DOMAIN:
-    logger.error("TRUSTED_DOMAIN environment variable not set")
-    raise ValueError("TRUSTED_DOMAIN environment variable is required")
+# Make sure a profiler never outlives its request, even if after_request did not run
+@app.teardown_request
+def discard_request_profile(exc):
+    profile = g.pop('profile', None)
+    if profile is not None:
+        if profile['mode'] == 'cprofile':
+            profile['profiler'].disable()
+        else:
+            profile['stop'].set()
 
 # Log all incoming requests
 @app.before_request
 def log_request_info():
-    logger.debug('Incoming request: %s %s from %s', request.method, request.path, request.remote_addr)
-    logger.debug('Headers: %s', request.headers)
+    http_logger.debug('Incoming request: %s %s from %s', request.method, request.path, request.remote_addr)
+    # Checked up front: reading request.form parses the whole body even if nothing is logged
+    if not http_logger.isEnabledFor(logging.DEBUG):
+        return
+    http_logger.debug('Headers: %s', {name: '***' if name.lower() in REDACTED_HEADERS else value
+                                      for name, value in request.headers.items()})
     if request.form:
-        logger.debug('Form data: %s', dict(request.form))
+        http_logger.debug('Form data: %s', {key: summarize_payload(value) for key, value in request.form.items()})
+
+# Per-route request counts and latency; routes are labelled by their rule, not the raw path
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+
+@app.after_request
+def record_request_metrics(response):
+    started = g.get('request_started')
+    if started is not None:
+        route = request.url_rule.rule if request.url_rule else 'unmatched'
+        observe('fgc_http_request_duration_seconds', time.perf_counter() - started, (request.method, route))
+        inc_counter('fgc_http_requests_total', (request.method, route, str(response.status_code)))
+    return response
 
 # Log errors
 @app.errorhandler(Exception)
@@ -92,6 +809,112 @@ def handle_exception(e):
     logger.error('Unhandled exception: %s', str(e), exc_info=True)
     return jsonify({"error": "Internal server error"}), 500
 
+# Response compression: bodies of these types are compressed when large enough
+COMPRESS_MIN_SIZE = 1024
+COMPRESSIBLE_MIMETYPES = {
+    'application/json', 'application/javascript', 'text/javascript',
+    'text/plain', 'text/html', 'text/css'
+}
+STATIC_MAX_AGE = 31536000
+
+# Compressed static files keyed by (path, file ETag, encoding), so each asset is compressed once
+_static_compressed = {}
+
+# Preferred content encoding accepted by the client, or None
+def negotiate_encoding():
+    if brotli is not None and request.accept_encodings['br']:
+        return 'br'
+    if request.accept_encodings['gzip']:
+        return 'gzip'
+    return None
+
+def compress_body(body, encoding):
+    if encoding == 'br':
+        return brotli.compress(body, quality=5)
+    return gzip.compress(body, 6)
+
+# True when the request's conditional headers match the given validators
+def not_modified(etag, last_modified=None):
+    if request.if_none_match:
+        return request.if_none_match.contains_weak(etag)
+    if last_modified is not None and request.if_modified_since is not None:
+        return last_modified.replace(microsecond=0) <= request.if_modified_since
+    return False
+
+def not_modified_response(etag, last_modified=None):
+    return with_validators(app.response_class(status=304), etag, last_modified)
+
+# Attach validators; clients must revalidate, which costs a 304 at most
+def with_validators(response, etag, last_modified=None):
+    response.set_etag(etag)
+    if last_modified is not None:
+        response.last_modified = last_modified
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+# Static asset URL carrying a content hash, so it can be cached forever
+_static_hashes = {}
+
+@app.template_global()
+def static_url(filename):
+    digest = static_file_hash(filename)
+    if digest is None:
+        return url_for('static', filename=filename)
+    return url_for('static', filename=filename, v=digest)
+
+def static_file_hash(filename):
+    path = os.path.join(app.static_folder, filename)
+    try:
+        mtime = os.path.getmtime(path)
+    except OSError:
+        return None
+    cached = _static_hashes.get(filename)
+    if cached is None or cached[0] != mtime:
+        with open(path, 'rb') as f:
+            cached = (mtime, hashlib.sha1(f.read()).hexdigest()[:12])
+        _static_hashes[filename] = cached
+    return cached[1]
+
+@app.after_request
+def cache_and_compress(response):
+    is_static = request.endpoint == 'static'
+    if is_static and request.args.get('v') and response.status_code in (200, 304):
+        response.headers['Cache-Control'] = f'public, max-age={STATIC_MAX_AGE}, immutable'
+
+    if response.mimetype not in COMPRESSIBLE_MIMETYPES or 'Content-Encoding' in response.headers:
+        return response
+    response.vary.add('Accept-Encoding')
+    # Streamed bodies (server-sent events) are left alone; static files are read in full
+    if response.status_code != 200 or (response.is_streamed and not (is_static and response.direct_passthrough)):
+        return response
+    encoding = negotiate_encoding()
+    if encoding is None:
+        return response
+
+    etag, weak = response.get_etag()
+    if is_static:
+        cache_key = (request.path, etag, encoding)
+        body = _static_compressed.get(cache_key)
+        response.direct_passthrough = False
+        if body is None:
+            raw = response.get_data()
+            if len(raw) < COMPRESS_MIN_SIZE:
+                return response
+            body = compress_body(raw, encoding)
+            _static_compressed[cache_key] = body
+    else:
+        raw = response.get_data()
+        if len(raw) < COMPRESS_MIN_SIZE:
+            return response
+        body = compress_body(raw, encoding)
+
+    response.set_data(body)
+    response.headers['Content-Encoding'] = encoding
+    # The encoded body differs byte-wise from the identity one, so only a weak ETag still holds
+    if etag and not weak:
+        response.set_etag(etag, weak=True)
+    return response
+
 # Predefined service templates
 SERVICE_TEMPLATES = {
     "HTTP": {"protocol": "TCP", "port": "80"},
@@ -129,8 +952,9 @@ KNOWN_SERVICES = {
 }
 
 # Load templates from SQLite
+@timed_query
 def load_templates():
-    conn = sqlite3.connect(DB_PATH)
+    conn = sqlite3.connect(app.config['DB_PATH'])
     cursor = conn.cursor()
     cursor.execute('SELECT name, data FROM templates')
     rows = cursor.fetchall()
@@ -139,39 +963,285 @@ def load_templates():
         try:
             # Validate template name: ensure it doesn't contain invalid characters
             if not isinstance(name, str) or not name.strip() or any(c in name for c in '"\n\r\t'):
-                logger.warning(f"Skipping template with invalid name: {name}")
+                logger.warning("Skipping template with invalid name: %s", name)
                 continue
-            # Parse the JSON data
-            parsed_data = json.loads(data)
+            # Decode the stored data (compact encoding or legacy JSON)
+            parsed_data = decode_document(data)
             if not isinstance(parsed_data, dict):
-                logger.warning(f"Skipping template '{name}' due to invalid data format: {data}")
+                logger.warning("Skipping template '%s' due to invalid data format: %s", name, data)
                 continue
             templates.append({'name': name, 'data': parsed_data})
         except json.JSONDecodeError as e:
-            logger.error(f"Failed to parse JSON data for template '{name}': {str(e)}")
+            logger.error("Failed to parse JSON data for template '%s': %s", name, e)
             continue
         except Exception as e:
-            logger.error(f"Unexpected error while processing template '{name}': {str(e)}")
+            logger.error("Unexpected error while processing template '%s': %s", name, e)
             continue
     conn.close()
     logger.debug("Loaded %d templates from SQLite", len(templates))
     return templates
 
+# Load template names from SQLite without decoding template data
+@timed_query
+def load_template_names():
+    conn = sqlite3.connect(app.config['DB_PATH'])
+    cursor = conn.cursor()
+    cursor.execute('SELECT name FROM templates')
+    names = [name for (name,) in cursor.fetchall()
+             if isinstance(name, str) and name.strip() and not any(c in name for c in '"\n\r\t')]
+    conn.close()
+    logger.debug("Loaded %d template names from SQLite", len(names))
+    return names
+
+# Load a single template and its materialized summary from SQLite
+@timed_query
+def load_template(template_name):
+    conn = sqlite3.connect(app.config['DB_PATH'])
+    cursor = conn.cursor()
+    cursor.execute('SELECT data, summary FROM templates WHERE name = ?', (template_name,))
+    row = cursor.fetchone()
+    conn.close()
+    if not row:
+        logger.debug("Template '%s' not found in SQLite", template_name)
+        return None
+    data, summary = row
+    return {'name': template_name, 'data': decode_document(data), 'summary': json.loads(summary) if summary else None}
+
 # Save templates to SQLite
+@timed_query
 def save_templates(templates):
-    conn = sqlite3.connect(DB_PATH)
+    conn = sqlite3.connect(app.config['DB_PATH'])
     cursor = conn.cursor()
     cursor.execute('DELETE FROM templates')  # Clear existing templates
+    cursor.execute('DELETE FROM template_references')
     for template in templates:
-        cursor.execute('INSERT INTO templates (name, data) VALUES (?, ?)',
-                       (template['name'], json.dumps(template['data'])))
+        cursor.execute('INSERT INTO templates (name, data, summary) VALUES (?, ?, ?)',
+                       (template['name'], encode_document(template['data']),
+                        json.dumps(build_template_summary(template['data']))))
+        update_template_references(cursor, template['name'], template['data'])
+    bump_state_version(cursor, 'templates')
     conn.commit()
     conn.close()
+    invalidate_state_versions()
     logger.debug("Saved %d templates to SQLite", len(templates))
 
+# Rename a template row, keeping its data and summary, and move its references, revisions
+# and short URLs (old_url to new_url) with it in the same transaction
+@timed_query
+def rename_template_in_db(old_name, new_name, old_url, new_url):
+    conn = sqlite3.connect(app.config['DB_PATH'])
+    cursor = conn.cursor()
+    try:
+        cursor.execute('UPDATE templates SET name = ? WHERE name = ?', (new_name, old_name))
+        renamed = cursor.rowcount
+        cursor.execute('UPDATE template_references SET template_name = ? WHERE template_name = ?', (new_name, old_name))
+        cursor.execute('UPDATE template_revisions SET template_name = ? WHERE template_name = ?', (new_name, old_name))
+        cursor.execute('UPDATE short_urls SET url = ? WHERE url = ?', (new_url, old_url))
+        bump_state_version(cursor, 'templates')
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+    invalidate_state_versions()
+    logger.debug("Renamed template '%s' to '%s' in SQLite", old_name, new_name)
+    return renamed > 0
+
+# Delete a template row together with its references, revisions and short URLs
+@timed_query
+def delete_template_from_db(template_name, template_url):
+    conn = sqlite3.connect(app.config['DB_PATH'])
+    cursor = conn.cursor()
+    try:
+        cursor.execute('DELETE FROM templates WHERE name = ?', (template_name,))
+        deleted = cursor.rowcount
+        cursor.execute('DELETE FROM template_references WHERE template_name = ?', (template_name,))
+        cursor.execute('DELETE FROM template_revisions WHERE template_name = ?', (template_name,))
+        cursor.execute('DELETE FROM short_urls WHERE url = ?', (template_url,))
+        bump_state_version(cursor, 'templates')
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+    invalidate_state_versions()
+    logger.debug("Deleted template '%s' from SQLite", template_name)
+    return deleted > 0
+
+# Build the object summary ('config' of get_template) referenced by a template's policies
+def build_template_summary(template_data):
+    interfaces = set()
+    addresses = set()
+    address_groups = set()
+    internet_services = set()
+    vips = set()
+    ip_pools = set()
+    services = []
+    seen_services = set()
+    service_groups = {}
+    ssl_ssh_profiles = set()
+    webfilter_profiles = set()
+    av_profiles = set()
+    application_lists = set()
+    ips_sensors = set()
+    users = set()
+    groups = set()
+
+    for policy in template_data.get('policies', []):
+        interfaces.update(policy.get('src_interfaces', []))
+        interfaces.update(policy.get('dst_interfaces', []))
+        addresses.update(policy.get('src_addresses', []))
+        addresses.update(policy.get('dst_addresses', []))
+        address_groups.update(policy.get('src_address_groups', []))
+        address_groups.update(policy.get('dst_address_groups', []))
+        internet_services.update(policy.get('src_internet_services', []))
+        internet_services.update(policy.get('dst_internet_services', []))
+        vips.update(policy.get('src_vips', []))
+        vips.update(policy.get('dst_vips', []))
+        if policy.get('ip_pool'):
+            ip_pools.add(policy['ip_pool'])
+        for svc in policy.get('services', []):
+            svc_type = svc.get('type', '')
+            svc_name = svc.get('name', '')
+            if svc_type == 'group' and svc_name not in service_groups:
+                service_groups[svc_name] = []
+            elif svc_type == 'template' or svc_type == 'custom':
+                svc_info = {
+                    'name': svc_name,
+                    'protocol': svc.get('protocol', 'TCP'),
+                    'port': svc.get('port', '0')
+                }
+                if svc_type == 'template' and svc_name in KNOWN_SERVICES:
+                    svc_info.update(KNOWN_SERVICES[svc_name])
+                svc_key = (svc_info['name'], svc_info['protocol'], svc_info['port'])
+                if svc_key not in seen_services:
+                    seen_services.add(svc_key)
+                    services.append(svc_info)
+        not_deny = policy.get('action', '').lower() != 'deny'
+        if policy.get('ssl_ssh_profile') and not_deny:
+            ssl_ssh_profiles.add(policy['ssl_ssh_profile'])
+        if policy.get('webfilter_profile') and policy.get('webfilter_enabled') and not_deny:
+            webfilter_profiles.add(policy['webfilter_profile'])
+        if policy.get('av_profile') and policy.get('av_enabled') and not_deny:
+            av_profiles.add(policy['av_profile'])
+        if policy.get('application_list') and policy.get('application_list_enabled') and not_deny:
+            application_lists.add(policy['application_list'])
+        if policy.get('ips_sensor') and policy.get('ips_sensor_enabled') and not_deny:
+            ips_sensors.add(policy['ips_sensor'])
+        users.update(policy.get('users', []))
+        groups.update(policy.get('groups', []))
+
+    return {
+        "interfaces": sorted(interfaces),
+        "addresses": sorted(addresses),
+        "address_groups": sorted(address_groups),
+        "internet_services": sorted(internet_services),
+        "vips": sorted(vips),
+        "ip_pools": sorted(ip_pools),
+        "services": services,
+        "service_groups": service_groups,
+        "ssl_ssh_profiles": sorted(ssl_ssh_profiles),
+        "webfilter_profiles": sorted(webfilter_profiles),
+        "av_profiles": sorted(av_profiles),
+        "application_lists": sorted(application_lists),
+        "ips_sensors": sorted(ips_sensors),
+        "users": sorted(users),
+        "groups": sorted(groups)
+    }
+
+# Inverted object-reference index: one template_references row per (object name, kind,
+# template, policy, policy field). Rows are kept in step with the templates table in
+# the same transaction, so where-used lookups never have to decode templates.
+# Bump REFERENCE_INDEX_VERSION when template_reference_rows changes; init_db rebuilds.
+REFERENCE_INDEX_VERSION = 2
+REFERENCE_LIST_FIELDS = {
+    'src_interfaces': 'interface', 'dst_interfaces': 'interface',
+    'src_addresses': 'address', 'dst_addresses': 'address',
+    'src_address_groups': 'address_group', 'dst_address_groups': 'address_group',
+    'src_internet_services': 'internet_service', 'dst_internet_services': 'internet_service',
+    'src_vips': 'vip', 'dst_vips': 'vip',
+    'users': 'user', 'groups': 'group'
+}
+# Profiles count as referenced only where generate_policy would emit them
+REFERENCE_PROFILE_FIELDS = {
+    'ssl_ssh_profile': None, 'webfilter_profile': 'webfilter_enabled', 'av_profile': 'av_enabled',
+    'application_list': 'application_list_enabled', 'ips_sensor': 'ips_sensor_enabled'
+}
+REFERENCE_KINDS = sorted(set(REFERENCE_LIST_FIELDS.values()) | set(REFERENCE_PROFILE_FIELDS) |
+                         {'ip_pool', 'service', 'service_group', 'custom_service'})
+# Service kinds by policy service type; custom services are defined by the generated CLI
+REFERENCE_SERVICE_KINDS = {'group': 'service_group', 'custom': 'custom_service'}
+
+def template_reference_rows(template_data):
+    rows = set()
+    for policy in template_data.get('policies', []):
+        policy_id = str(policy.get('policy_id', ''))
+        policy_name = policy.get('policy_name', '')
+        for field, kind in REFERENCE_LIST_FIELDS.items():
+            for name in policy.get(field, []):
+                if name:
+                    rows.add((name, kind, policy_id, field, policy_name))
+        for svc in policy.get('services', []):
+            if svc.get('name'):
+                kind = REFERENCE_SERVICE_KINDS.get(svc.get('type'), 'service')
+                rows.add((svc['name'], kind, policy_id, 'services', policy_name))
+        if policy.get('ip_pool'):
+            rows.add((policy['ip_pool'], 'ip_pool', policy_id, 'ip_pool', policy_name))
+        if policy.get('action', '').lower() != 'deny':
+            for field, enabled in REFERENCE_PROFILE_FIELDS.items():
+                if policy.get(field) and policy[field] != 'disable' and (enabled is None or policy.get(enabled)):
+                    rows.add((policy[field], field, policy_id, field, policy_name))
+    return rows
+
+# Apply only the difference between the indexed and the new references of a template
+def update_template_references(cursor, template_name, template_data):
+    cursor.execute('SELECT name, kind, policy_id, field, policy_name FROM template_references WHERE template_name = ?',
+                   (template_name,))
+    old_rows = set(cursor.fetchall())
+    new_rows = template_reference_rows(template_data)
+    cursor.executemany('''
+        DELETE FROM template_references
+        WHERE name = ? AND kind = ? AND template_name = ? AND policy_id = ? AND field = ?
+    ''', [(name, kind, template_name, policy_id, field) for name, kind, policy_id, field, _ in old_rows - new_rows])
+    cursor.executemany('''
+        INSERT OR REPLACE INTO template_references (name, kind, template_name, policy_id, field, policy_name)
+        VALUES (?, ?, ?, ?, ?, ?)
+    ''', [(name, kind, template_name, policy_id, field, policy_name)
+          for name, kind, policy_id, field, policy_name in sorted(new_rows - old_rows)])
+
+@timed_query
+def find_references(name, kind=None, template_name=None):
+    conn = sqlite3.connect(app.config['DB_PATH'])
+    cursor = conn.cursor()
+    query = 'SELECT kind, template_name, policy_id, policy_name, field FROM template_references WHERE name = ?'
+    params = [name]
+    if kind:
+        query += ' AND kind = ?'
+        params.append(kind)
+    if template_name:
+        query += ' AND template_name = ?'
+        params.append(template_name)
+    cursor.execute(query + ' ORDER BY kind, template_name, policy_id, field', params)
+    rows = cursor.fetchall()
+    conn.close()
+    return rows
+
+# Persist a freshly computed summary for a template saved before summaries existed
+@timed_query
+def save_template_summary(template_name, summary):
+    conn = sqlite3.connect(app.config['DB_PATH'])
+    cursor = conn.cursor()
+    cursor.execute('UPDATE templates SET summary = ? WHERE name = ?', (json.dumps(summary), template_name))
+    conn.commit()
+    conn.close()
+    logger.debug("Backfilled summary for template '%s'", template_name)
+
 # Load short URL mappings from SQLite
+@timed_query
 def load_short_urls():
-    conn = sqlite3.connect(DB_PATH)
+    conn = sqlite3.connect(app.config['DB_PATH'])
     cursor = conn.cursor()
     cursor.execute('SELECT short_code, url FROM short_urls')
     short_urls = {short_code: url for short_code, url in cursor.fetchall()}
@@ -180,8 +1250,9 @@ def load_short_urls():
     return short_urls
 
 # Save short URL mappings to SQLite
+@timed_query
 def save_short_urls(short_urls):
-    conn = sqlite3.connect(DB_PATH)
+    conn = sqlite3.connect(app.config['DB_PATH'])
     cursor = conn.cursor()
     cursor.execute('DELETE FROM short_urls')  # Clear existing short URLs
     for short_code, url in short_urls.items():
@@ -191,28 +1262,169 @@ def save_short_urls(short_urls):
     conn.close()
     logger.debug("Saved %d short URLs to SQLite", len(short_urls))
 
-# Load last config from SQLite
+# Load the most recently parsed config of any device from SQLite
+@timed_query
 def load_last_config():
-    conn = sqlite3.connect(DB_PATH)
+    conn = sqlite3.connect(app.config['DB_PATH'])
     cursor = conn.cursor()
-    cursor.execute('SELECT config_data FROM last_config ORDER BY id DESC LIMIT 1')
+    cursor.execute('SELECT config_data FROM device_configs ORDER BY updated_at DESC LIMIT 1')
     result = cursor.fetchone()
     conn.close()
     if result:
         logger.debug("Loaded last config from SQLite")
-        return json.loads(result[0])
+        return decode_document(result[0])
     logger.debug("No last config found in SQLite")
     return None
 
-# Save last config to SQLite
-def save_last_config(config):
-    conn = sqlite3.connect(DB_PATH)
+# Load the parsed config of one device from SQLite
+@timed_query
+def load_device_config(device):
+    conn = sqlite3.connect(app.config['DB_PATH'])
+    cursor = conn.cursor()
+    cursor.execute('SELECT config_data FROM device_configs WHERE device = ?', (device,))
+    result = cursor.fetchone()
+    conn.close()
+    if result:
+        logger.debug("Loaded config for device '%s' from SQLite", device)
+        return decode_document(result[0])
+    logger.debug("No config found for device '%s' in SQLite", device)
+    return None
+
+# List devices with a stored parsed config, most recently updated first
+@timed_query
+def load_devices():
+    conn = sqlite3.connect(app.config['DB_PATH'])
+    cursor = conn.cursor()
+    cursor.execute('SELECT device, updated_at FROM device_configs ORDER BY updated_at DESC')
+    devices = [{'device': device, 'updated_at': updated_at} for device, updated_at in cursor.fetchall()]
+    conn.close()
+    return devices
+
+# Save the parsed config of one device to SQLite, replacing its previous config
+@timed_query
+def save_device_config(device, config):
+    conn = sqlite3.connect(app.config['DB_PATH'])
     cursor = conn.cursor()
-    cursor.execute('DELETE FROM last_config')  # Keep only the latest config
-    cursor.execute('INSERT INTO last_config (config_data) VALUES (?)', (json.dumps(config),))
+    cursor.execute('''
+        INSERT INTO device_configs (device, config_data, updated_at) VALUES (?, ?, ?)
+        ON CONFLICT(device) DO UPDATE SET config_data = excluded.config_data, updated_at = excluded.updated_at
+    ''', (device, encode_document(config), datetime.now(timezone.utc).isoformat()))
+    bump_state_version(cursor, f'device:{device}')
+    bump_state_version(cursor, 'last_config')
+    bump_state_version(cursor, 'devices')
     conn.commit()
     conn.close()
-    logger.debug("Saved last config to SQLite")
+    invalidate_state_versions()
+    logger.debug("Saved config for device '%s' to SQLite", device)
+
+# Bump a shared version counter; call inside the transaction that changes the state
+# and invalidate_state_versions() once it is committed
+def bump_state_version(cursor, key):
+    cursor.execute('''
+        INSERT INTO state_versions (key, version) VALUES (?, 1)
+        ON CONFLICT(key) DO UPDATE SET version = version + 1
+    ''', (key,))
+
+# Load all shared version counters from SQLite
+@timed_query
+def load_state_versions():
+    conn = sqlite3.connect(app.config['DB_PATH'])
+    cursor = conn.cursor()
+    cursor.execute('SELECT key, version FROM state_versions')
+    versions = dict(cursor.fetchall())
+    conn.close()
+    return versions
+
+# Decoded, immutable snapshots of rarely-changing state, keyed by state_versions key.
+# Each entry is (version, value); the versions themselves are re-read from SQLite at
+# most every STATE_VERSION_CHECK_INTERVAL seconds so other workers' writes are seen.
+_snapshot_lock = threading.Lock()
+_snapshots = {}
+_state_versions = {'checked_at': None, 'versions': {}}
+
+def invalidate_state_versions():
+    with _snapshot_lock:
+        _state_versions['checked_at'] = None
+
+def _current_state_versions():
+    now = time.monotonic()
+    with _snapshot_lock:
+        checked_at = _state_versions['checked_at']
+        if checked_at is not None and now - checked_at < app.config['STATE_VERSION_CHECK_INTERVAL']:
+            return _state_versions['versions']
+    versions = load_state_versions()
+    with _snapshot_lock:
+        _state_versions['versions'] = versions
+        _state_versions['checked_at'] = now
+    return versions
+
+def _freeze(value):
+    if isinstance(value, dict):
+        return MappingProxyType({k: _freeze(v) for k, v in value.items()})
+    if isinstance(value, list):
+        return tuple(_freeze(v) for v in value)
+    return value
+
+def _thaw(value):
+    if isinstance(value, MappingProxyType):
+        return {k: _thaw(v) for k, v in value.items()}
+    if isinstance(value, tuple):
+        return [_thaw(v) for v in value]
+    return value
+
+def get_snapshot(key, loader):
+    version = _current_state_versions().get(key, 0)
+    with _snapshot_lock:
+        cached = _snapshots.get(key)
+    if cached and cached[0] == version:
+        inc_counter('fgc_cache_lookups_total', (key, 'hit'))
+        return cached[1]
+    inc_counter('fgc_cache_lookups_total', (key, 'miss'))
+    value = _freeze(loader())
+    with _snapshot_lock:
+        _snapshots[key] = (version, value)
+    logger.debug("Refreshed '%s' snapshot at version %d", key, version)
+    return value
+
+def get_last_config_snapshot():
+    return get_snapshot('last_config', load_last_config)
+
+def get_template_names_snapshot():
+    return get_snapshot('templates', load_template_names)
+
+def get_devices_snapshot():
+    return get_snapshot('devices', lambda: [d['device'] for d in load_devices()])
+
+# LRU working set of decoded per-device configs: device -> (version, frozen config)
+_device_snapshots = OrderedDict()
+
+def get_device_config_snapshot(device):
+    version = _current_state_versions().get(f'device:{device}', 0)
+    with _snapshot_lock:
+        cached = _device_snapshots.get(device)
+        if cached and cached[0] == version:
+            _device_snapshots.move_to_end(device)
+            inc_counter('fgc_cache_lookups_total', ('device_config', 'hit'))
+            return cached[1]
+    inc_counter('fgc_cache_lookups_total', ('device_config', 'miss'))
+    config = load_device_config(device)
+    if config is None:
+        return None
+    value = _freeze(config)
+    with _snapshot_lock:
+        _device_snapshots[device] = (version, value)
+        _device_snapshots.move_to_end(device)
+        while len(_device_snapshots) > app.config['DEVICE_CACHE_SIZE']:
+            evicted, _ = _device_snapshots.popitem(last=False)
+            logger.debug("Evicted device '%s' from config cache", evicted)
+    logger.debug("Loaded device '%s' config snapshot at version %d", device, version)
+    return value
+
+# Parsed config for the requested device, or the most recently parsed one if none is given
+def resolve_device_config(device=None):
+    if device:
+        return get_device_config_snapshot(device)
+    return get_last_config_snapshot()
 
 # Generate a random short code
 def generate_short_code(length=6):
@@ -226,9 +1438,9 @@ def is_trusted_domain(url):
         domain = parsed_url.netloc.lower()
         if not domain:
             return parsed_url.path.startswith('/') and not parsed_url.path.startswith('//')
-        return domain == TRUSTED_DOMAIN.lower() or domain.endswith('.' + TRUSTED_DOMAIN.lower())
+        return domain == app.config['TRUSTED_DOMAIN'].lower() or domain.endswith('.' + app.config['TRUSTED_DOMAIN'].lower())
     except Exception as e:
-        logger.error(f"Error parsing URL {url}: {e}")
+        logger.error("Error parsing URL %s: %s", url, e)
         return False
 
 # Endpoint to shorten a URL (only for templates)
@@ -245,22 +1457,22 @@ def shorten_url():
     # If the URL is relative and starts with /get_template/, prepend request.host_url
     if original_url.startswith('/get_template/'):
         original_url = f"{request.host_url.rstrip('/')}{original_url}"
-        logger.debug(f"Constructed full URL: {original_url}")
+        logger.debug("Constructed full URL: %s", original_url)
     
     # Check if URL is related to templates
     if not original_url.startswith(f"{request.host_url}get_template/"):
-        logger.warning(f"URL {original_url} is not a template URL")
+        logger.warning("URL %s is not a template URL", original_url)
         return jsonify({"error": "Short URLs are only allowed for templates"}), 403
 
     if not is_trusted_domain(original_url):
-        logger.warning(f"URL {original_url} does not match TRUSTED_DOMAIN {TRUSTED_DOMAIN}")
-        return jsonify({"error": f"URL must belong to trusted domain: {TRUSTED_DOMAIN}"}), 403
+        logger.warning("URL %s does not match TRUSTED_DOMAIN %s", original_url, app.config['TRUSTED_DOMAIN'])
+        return jsonify({"error": f"URL must belong to trusted domain: {app.config['TRUSTED_DOMAIN']}"}), 403
 
     short_urls = load_short_urls()
 
     for short_code, url in short_urls.items():
         if url == original_url:
-            logger.debug(f"Found existing short URL for {original_url}")
+            logger.debug("Found existing short URL for %s", original_url)
             return jsonify({"status": "success", "short_code": short_code})
 
     while True:
@@ -270,76 +1482,225 @@ def shorten_url():
 
     short_urls[short_code] = original_url
     save_short_urls(short_urls)
-    logger.debug(f"Generated short URL with code: {short_code} for {original_url}")
+    logger.debug("Generated short URL with code: %s for %s", short_code, original_url)
     return jsonify({"status": "success", "short_code": short_code})
 
 # Endpoint to redirect short URLs
 @app.route('/s/<short_code>')
 def redirect_short_url(short_code):
-    logger.debug(f"Processing short URL redirect for code: {short_code}")
+    logger.debug("Processing short URL redirect for code: %s", short_code)
     try:
         short_urls = load_short_urls()
-        logger.debug(f"Loaded short URLs: {len(short_urls)} entries")
+        logger.debug("Loaded short URLs: %s entries", len(short_urls))
         # Log anonymized short_urls keys for debugging (avoid logging full URLs)
-        logger.debug(f"Available short codes: {list(short_urls.keys())}")
+        logger.debug("Available short codes: %s", list(short_urls.keys()))
         original_url = short_urls.get(short_code)
         if not original_url:
-            logger.error(f"Short code {short_code} not found in short_urls")
+            logger.error("Short code %s not found in short_urls", short_code)
             return jsonify({"error": "Short URL not found"}), 404
         
         # Normalize original_url to handle trailing slashes
         original_url = original_url.rstrip('/')
-        logger.debug(f"Found original URL: {original_url} for short code: {short_code}")
+        logger.debug("Found original URL: %s for short code: %s", original_url, short_code)
         if not is_trusted_domain(original_url):
-            logger.warning(f"Stored URL {original_url} for short code {short_code} does not match TRUSTED_DOMAIN {TRUSTED_DOMAIN}")
-            return jsonify({"error": f"Redirect URL does not belong to trusted domain: {TRUSTED_DOMAIN}"}), 403
+            logger.warning("Stored URL %s for short code %s does not match TRUSTED_DOMAIN %s", original_url, short_code, app.config['TRUSTED_DOMAIN'])
+            return jsonify({"error": f"Redirect URL does not belong to trusted domain: {app.config['TRUSTED_DOMAIN']}"}), 403
 
         # Extract template name from the URL (e.g., /get_template/Test2 -> Test2)
         template_name = None
         expected_prefix = f"{request.host_url.rstrip('/')}/get_template/"
         if original_url.startswith(expected_prefix):
             template_name = original_url[len(expected_prefix):].lstrip('/')
-            logger.debug(f"Extracted template name: {template_name} from URL: {original_url}")
+            logger.debug("Extracted template name: %s from URL: %s", template_name, original_url)
         else:
-            logger.error(f"Invalid template URL format: {original_url}. Expected prefix: {expected_prefix}")
+            logger.error("Invalid template URL format: %s. Expected prefix: %s", original_url, expected_prefix)
             return jsonify({"error": "Invalid template URL format in short URL"}), 400
 
         if not template_name:
-            logger.error(f"Could not extract template name from URL: {original_url}")
+            logger.error("Could not extract template name from URL: %s", original_url)
             return jsonify({"error": "Invalid template URL in short URL"}), 400
 
         # Verify template exists
         try:
-            templates = load_templates()
-            template_names = [t['name'] for t in templates]
+            template_names = get_template_names_snapshot()
             if template_name not in template_names:
-                logger.warning(f"Template '{template_name}' not found in available templates: {template_names}")
+                logger.warning("Template '%s' not found in available templates: %s", template_name, template_names)
                 return jsonify({"error": f"Template '{template_name}' not found"}), 404
         except Exception as e:
-            logger.error(f"Failed to load templates for verification: {str(e)}")
+            logger.error("Failed to load templates for verification: %s", e)
             return jsonify({"error": "Failed to verify template existence due to database error"}), 500
 
-        logger.debug(f"Rendering index page with pre-selected template: {template_name}")
+        logger.debug("Rendering index page with pre-selected template: %s", template_name)
         return index(preselected_template=template_name)
     except Exception as e:
-        logger.error(f"Unexpected error in redirect_short_url for code {short_code}: {str(e)}", exc_info=True)
+        logger.error("Unexpected error in redirect_short_url for code %s: %s", short_code, e, exc_info=True)
         return jsonify({"error": "Internal server error during short URL redirect"}), 500
 
-# Endpoint to receive frontend logs
+# Token bucket per client address; the least recently seen clients are forgotten first
+_frontend_log_buckets = OrderedDict()
+_frontend_log_lock = threading.Lock()
+
+def frontend_log_allowed(client):
+    now = time.monotonic()
+    with _frontend_log_lock:
+        tokens, updated = _frontend_log_buckets.pop(client, (app.config['FRONTEND_LOG_RATE'], now))
+        tokens = min(app.config['FRONTEND_LOG_RATE'], tokens + (now - updated) * app.config['FRONTEND_LOG_RATE'] / 60)
+        allowed = tokens >= 1
+        _frontend_log_buckets[client] = (tokens - 1 if allowed else tokens, now)
+        while len(_frontend_log_buckets) > FRONTEND_LOG_CLIENTS:
+            _frontend_log_buckets.popitem(last=False)
+    return allowed
+
+FRONTEND_LOG_LEVELS = {'debug': logging.DEBUG, 'info': logging.INFO, 'warn': logging.WARNING,
+                       'warning': logging.WARNING, 'error': logging.ERROR}
+
+# Endpoint to receive frontend logs. Accepts a batch {"entries": [{"level", "message", "time"}, ...]}
+# or a single {"message": ...}; entries beyond FRONTEND_LOG_MAX_ENTRIES are dropped.
 @app.route('/log', methods=['POST'])
 def log_frontend():
-    logger.debug("Received frontend log request")
-    data = request.get_json()
-    if not data:
-        logger.warning("No JSON data in frontend log request")
-        return jsonify({"status": "error", "message": "No data provided"}), 400
-    message = data.get('message', 'No message provided')
-    logger.debug('Frontend log: %s', message)
-    return jsonify({"status": "logged"})
+    if request.content_length is None:
+        inc_counter('fgc_frontend_log_batches_total', ('rejected',))
+        return jsonify({"error": "Content-Length required"}), 411
+    if request.content_length > app.config['FRONTEND_LOG_MAX_BYTES']:
+        inc_counter('fgc_frontend_log_batches_total', ('rejected',))
+        return jsonify({"error": f"Log batch exceeds {app.config['FRONTEND_LOG_MAX_BYTES']} bytes"}), 413
+    if not frontend_log_allowed(request.remote_addr or 'unknown'):
+        inc_counter('fgc_frontend_log_batches_total', ('rate_limited',))
+        return jsonify({"error": "Too many log batches, try again later"}), 429, {'Retry-After': str(max(int(60 / app.config['FRONTEND_LOG_RATE']), 1))}
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict) or not (data.get('entries') or data.get('message')):
+        inc_counter('fgc_frontend_log_batches_total', ('rejected',))
+        frontend_logger.warning("No log entries in frontend log request")
+        return jsonify({"error": "No log entries provided"}), 400
+    entries = data.get('entries') or [data]
+    if not isinstance(entries, list):
+        inc_counter('fgc_frontend_log_batches_total', ('rejected',))
+        return jsonify({"error": "entries must be a list"}), 400
+    accepted = entries[:app.config['FRONTEND_LOG_MAX_ENTRIES']]
+    # The client reports entries it discarded itself when its buffer overflowed
+    client_dropped = data.get('dropped')
+    dropped = len(entries) - len(accepted) + (client_dropped if isinstance(client_dropped, int) and client_dropped > 0 else 0)
+    inc_counter('fgc_frontend_log_batches_total', ('accepted',))
+    for entry in accepted:
+        if not isinstance(entry, dict):
+            continue
+        level = FRONTEND_LOG_LEVELS.get(str(entry.get('level', 'debug')).lower(), logging.DEBUG)
+        if frontend_logger.isEnabledFor(level):
+            frontend_logger.log(level, 'Frontend log [%s]: %s', entry.get('time', '-'), entry.get('message', ''))
+    inc_counter('fgc_frontend_log_entries_total', ('accepted',), len(accepted))
+    if dropped:
+        inc_counter('fgc_frontend_log_entries_total', ('dropped',), dropped)
+        frontend_logger.debug('Frontend dropped %d log entries', dropped)
+    return jsonify({"status": "logged", "accepted": len(accepted), "dropped": dropped})
+
+@app.route('/metrics', methods=['GET'])
+def metrics_endpoint():
+    try:
+        client = ipaddress.ip_address(request.remote_addr or '')
+    except ValueError:
+        client = None
+    if client is None or not any(client in network for network in METRICS_ALLOWED_NETWORKS):
+        logger.warning("Rejected metrics request from %s", request.remote_addr)
+        return jsonify({"error": "Not found"}), 404
+    return Response(render_metrics(), mimetype='text/plain', headers={'Cache-Control': 'no-store'})
+
+@timed_query
+def save_request_profile(profile_id, method, path, mode, status, duration_ms, report, data):
+    conn = sqlite3.connect(app.config['DB_PATH'])
+    cursor = conn.cursor()
+    cursor.execute('''
+        INSERT INTO request_profiles (profile_id, method, path, mode, status, duration_ms, report, data, created_at)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ''', (profile_id, method, path, mode, status, duration_ms, report, data, datetime.now(timezone.utc).isoformat()))
+    cursor.execute('''
+        DELETE FROM request_profiles WHERE profile_id NOT IN (
+            SELECT profile_id FROM request_profiles ORDER BY created_at DESC LIMIT ?
+        )
+    ''', (app.config['PROFILE_KEEP'],))
+    conn.commit()
+    conn.close()
+
+@timed_query
+def list_request_profiles():
+    conn = sqlite3.connect(app.config['DB_PATH'])
+    cursor = conn.cursor()
+    cursor.execute('''
+        SELECT profile_id, method, path, mode, status, duration_ms, created_at
+        FROM request_profiles ORDER BY created_at DESC
+    ''')
+    profiles = [
+        {'profile_id': profile_id, 'method': method, 'path': path, 'mode': mode, 'status': status,
+         'duration_ms': duration_ms, 'created_at': created_at}
+        for profile_id, method, path, mode, status, duration_ms, created_at in cursor.fetchall()
+    ]
+    conn.close()
+    return profiles
+
+@timed_query
+def load_request_profile(profile_id):
+    conn = sqlite3.connect(app.config['DB_PATH'])
+    cursor = conn.cursor()
+    cursor.execute('''
+        SELECT profile_id, method, path, mode, status, duration_ms, report, data, created_at
+        FROM request_profiles WHERE profile_id = ?
+    ''', (profile_id,))
+    row = cursor.fetchone()
+    conn.close()
+    if not row:
+        return None
+    keys = ('profile_id', 'method', 'path', 'mode', 'status', 'duration_ms', 'report', 'data', 'created_at')
+    return dict(zip(keys, row))
+
+# Error response unless the request carries the admin token; admin endpoints do not exist without one
+def admin_required():
+    if not app.config['ADMIN_TOKEN']:
+        return jsonify({"error": "Not found"}), 404
+    token = request.headers.get('X-Admin-Token') or request.args.get('admin_token') or ''
+    if not hmac.compare_digest(token.encode('utf-8'), app.config['ADMIN_TOKEN'].encode('utf-8')):
+        logger.warning("Rejected admin request from %s", request.remote_addr)
+        return jsonify({"error": "Forbidden"}), 403
+    return None
+
+@app.route('/admin/profiles', methods=['GET'])
+def list_profiles_endpoint():
+    denied = admin_required()
+    if denied:
+        return denied
+    return jsonify({"status": "success", "profiles": list_request_profiles()})
+
+# Stored profile: JSON with the text report by default; format=pstats downloads cProfile
+# stats (snakeviz, pstats), format=collapsed returns sampled stacks (flamegraph.pl, speedscope)
+@app.route('/admin/profiles/<profile_id>', methods=['GET'])
+def get_profile_endpoint(profile_id):
+    denied = admin_required()
+    if denied:
+        return denied
+    profile = load_request_profile(profile_id)
+    if not profile:
+        logger.error("Profile '%s' not found", profile_id)
+        return jsonify({"error": "Profile not found"}), 404
+
+    output_format = request.args.get('format', 'json')
+    if output_format == 'json':
+        profile.pop('data')
+        return jsonify({"status": "success", "profile": profile})
+    if output_format == 'pstats' and profile['mode'] == 'cprofile':
+        response = app.response_class(profile['data'], mimetype='application/octet-stream')
+        response.headers['Content-Disposition'] = f'attachment; filename="{profile_id}.prof"'
+        return response
+    if output_format == 'collapsed' and profile['mode'] == 'sample':
+        return Response(profile['data'].decode('utf-8'), mimetype='text/plain')
+    return jsonify({"error": f"Format '{output_format}' is not available for {profile['mode']} profiles"}), 400
+
+@app.route('/devices', methods=['GET'])
+def devices_endpoint():
+    logger.debug("Received request to list devices")
+    return jsonify({"devices": load_devices()})
 
 @app.route('/')
 def index(preselected_template=None):
-    logger.debug("Rendering index page with preselected_template: %s", preselected_template)
+    device = request.args.get('device') or None
+    logger.debug("Rendering index page with preselected_template: %s, device: %s", preselected_template, device)
     # Initialize empty lists for profiles and config data
     ssl_ssh_profiles = []
     webfilter_profiles = []
@@ -357,8 +1718,10 @@ def index(preselected_template=None):
     users = []
     groups = []
     
-    # Load profiles from the last parsed config (if available)
-    config = load_last_config()
+    # Load profiles from the in-memory snapshot of the device's parsed config (if available)
+    config = resolve_device_config(device)
+    if device and config is None:
+        logger.warning("No parsed config stored for device '%s'", device)
     if config:
         ssl_ssh_profiles = config.get('ssl_ssh_profiles', [])
         webfilter_profiles = config.get('webfilter_profiles', [])
@@ -375,7 +1738,7 @@ def index(preselected_template=None):
         service_groups = config.get('service_groups', {})
         users = config.get('users', [])
         groups = config.get('groups', [])
-        logger.debug("Loaded last config from SQLite")
+        logger.debug("Using last config snapshot")
     
     # Explicitly create context dictionary to ensure all variables are passed
     context = {
@@ -397,21 +1760,198 @@ def index(preselected_template=None):
         'users': users,
         'groups': groups,
         'preselected_template': preselected_template,
-        'templates': [t['name'] for t in load_templates()]
+        'templates': get_template_names_snapshot(),
+        'devices': get_devices_snapshot(),
+        'selected_device': device
     }
-    logger.debug("Template context: %s", context)
+    logger.debug("Rendering index with %d templates, %d interfaces, %d addresses",
+                 len(context['templates']), len(interfaces), len(addresses))
     return render_template('index.html', **context)
 
-def save_template_to_db(template_name, template_data):
-    conn = sqlite3.connect(DB_PATH)
+# Template revision history: each save stores either a full snapshot or a
+# zlib-compressed delta (one JSON line per policy) against the previous revision.
+def _template_revision_lines(template_data):
+    header = {k: v for k, v in template_data.items() if k != 'policies'}
+    lines = [json.dumps(header, sort_keys=True)]
+    lines.extend(json.dumps(policy, sort_keys=True) for policy in template_data.get('policies', []))
+    return lines
+
+def _template_from_revision_lines(lines):
+    template_data = json.loads(lines[0])
+    template_data['policies'] = [json.loads(line) for line in lines[1:]]
+    return template_data
+
+def _revision_checksum(lines):
+    return hashlib.sha1('\n'.join(lines).encode('utf-8')).hexdigest()
+
+# Copy and insert ops turning old_lines into new_lines. Lines are policies (after the
+# header), so each new line is looked up whole in the old revision and copied from there,
+# runs of lines that follow each other in both becoming one copy; anything else is
+# inserted. Linear in the number of lines, where a longest-match diff is quadratic in the
+# worst case on templates with thousands of policies.
+def _encode_revision_delta(old_lines, new_lines):
+    positions = {}
+    for i, line in enumerate(old_lines):
+        positions.setdefault(line, i)
+    ops = []
+    for line in new_lines:
+        last = ops[-1] if ops else None
+        if last and last[0] == 'c' and last[2] < len(old_lines) and old_lines[last[2]] == line:
+            last[2] += 1
+            continue
+        i = positions.get(line)
+        if i is not None:
+            ops.append(['c', i, i + 1])
+        elif last and last[0] == 'i':
+            last[1].append(line)
+        else:
+            ops.append(['i', [line]])
+    return ops
+
+def _apply_revision_delta(old_lines, ops):
+    lines = []
+    for op in ops:
+        if op[0] == 'c':
+            lines.extend(old_lines[op[1]:op[2]])
+        else:
+            lines.extend(op[1])
+    return lines
+
+def _pack_revision(payload):
+    return zlib.compress(json.dumps(payload, separators=(',', ':')).encode('utf-8'), 6)
+
+def _unpack_revision(blob):
+    return json.loads(zlib.decompress(blob).decode('utf-8'))
+
+# Record the next revision of a template; call inside a BEGIN IMMEDIATE transaction, as the
+# revision number is read and then inserted
+def record_template_revision(cursor, template_name, template_data):
+    new_lines = _template_revision_lines(template_data)
+    checksum = _revision_checksum(new_lines)
+
+    cursor.execute('''
+        SELECT revision, checksum FROM template_revisions
+        WHERE template_name = ? ORDER BY revision DESC LIMIT 1
+    ''', (template_name,))
+    latest = cursor.fetchone()
+    if latest and latest[1] == checksum:
+        logger.debug("Template '%s' unchanged since revision %d; no revision recorded", template_name, latest[0])
+        return latest[0]
+    revision = latest[0] + 1 if latest else 1
+
+    kind = 'full'
+    payload = new_lines
+    if latest:
+        cursor.execute('''
+            SELECT MAX(revision) FROM template_revisions
+            WHERE template_name = ? AND kind = 'full'
+        ''', (template_name,))
+        last_full = cursor.fetchone()[0] or 0
+        cursor.execute('SELECT data FROM templates WHERE name = ?', (template_name,))
+        row = cursor.fetchone()
+        if row and revision - last_full < app.config['REVISION_SNAPSHOT_INTERVAL']:
+            old_lines = _template_revision_lines(decode_document(row[0]))
+            # Only diff against the stored row if it really is the latest revision
+            if _revision_checksum(old_lines) == latest[1]:
+                kind = 'delta'
+                payload = _encode_revision_delta(old_lines, new_lines)
+
+    cursor.execute('''
+        INSERT INTO template_revisions (template_name, revision, kind, checksum, data, created_at)
+        VALUES (?, ?, ?, ?, ?, ?)
+    ''', (template_name, revision, kind, checksum, _pack_revision(payload),
+          datetime.now(timezone.utc).isoformat()))
+    logger.debug("Recorded %s revision %d for template '%s'", kind, revision, template_name)
+    return revision
+
+@timed_query
+def list_template_revisions(template_name):
+    conn = sqlite3.connect(app.config['DB_PATH'])
     cursor = conn.cursor()
     cursor.execute('''
-        INSERT INTO templates (name, data) VALUES (?, ?)
-        ON CONFLICT(name) DO UPDATE SET data = excluded.data
-    ''', (template_name, json.dumps(template_data)))
-    conn.commit()
+        SELECT revision, kind, checksum, length(data), created_at FROM template_revisions
+        WHERE template_name = ? ORDER BY revision
+    ''', (template_name,))
+    revisions = [
+        {'revision': revision, 'kind': kind, 'checksum': checksum, 'stored_bytes': size, 'created_at': created_at}
+        for revision, kind, checksum, size, created_at in cursor.fetchall()
+    ]
+    conn.close()
+    return revisions
+
+# HTTP validators (ETag, Last-Modified) of a template, taken from its latest revision.
+# Templates stored before revisions existed fall back to a hash of the stored row.
+# Returns None if the template does not exist.
+@timed_query
+def template_validators(template_name):
+    conn = sqlite3.connect(app.config['DB_PATH'])
+    cursor = conn.cursor()
+    cursor.execute('''
+        SELECT revision, checksum, created_at FROM template_revisions
+        WHERE template_name = ? ORDER BY revision DESC LIMIT 1
+    ''', (template_name,))
+    latest = cursor.fetchone()
+    if latest:
+        conn.close()
+        revision, checksum, created_at = latest
+        return f"r{revision}-{checksum[:16]}", datetime.fromisoformat(created_at)
+
+    cursor.execute('SELECT data FROM templates WHERE name = ?', (template_name,))
+    row = cursor.fetchone()
+    conn.close()
+    if not row:
+        return None
+    data = row[0].encode('utf-8') if isinstance(row[0], str) else row[0]
+    return hashlib.sha1(data).hexdigest()[:20], None
+
+@timed_query
+def load_template_revision(template_name, revision):
+    conn = sqlite3.connect(app.config['DB_PATH'])
+    cursor = conn.cursor()
+    cursor.execute('''
+        SELECT revision, kind, data FROM template_revisions
+        WHERE template_name = ? AND revision <= ? AND revision >= (
+            SELECT MAX(revision) FROM template_revisions
+            WHERE template_name = ? AND kind = 'full' AND revision <= ?
+        )
+        ORDER BY revision
+    ''', (template_name, revision, template_name, revision))
+    rows = cursor.fetchall()
     conn.close()
-    logger.debug(f"Template '{template_name}' saved or updated in SQLite")
+    if not rows or rows[-1][0] != revision:
+        return None
+
+    lines = None
+    for _, kind, blob in rows:
+        payload = _unpack_revision(blob)
+        lines = payload if kind == 'full' else _apply_revision_delta(lines, payload)
+    logger.debug("Reconstructed revision %d of template '%s' from %d stored rows", revision, template_name, len(rows))
+    return _template_from_revision_lines(lines)
+
+@timed_query
+def save_template_to_db(template_name, template_data):
+    summary = build_template_summary(template_data)
+    conn = sqlite3.connect(app.config['DB_PATH'])
+    cursor = conn.cursor()
+    try:
+        # Take the write lock before reading the latest revision, so concurrent saves of
+        # one template cannot both claim the next revision number
+        cursor.execute('BEGIN IMMEDIATE')
+        record_template_revision(cursor, template_name, template_data)
+        cursor.execute('''
+            INSERT INTO templates (name, data, summary) VALUES (?, ?, ?)
+            ON CONFLICT(name) DO UPDATE SET data = excluded.data, summary = excluded.summary
+        ''', (template_name, encode_document(template_data), json.dumps(summary)))
+        update_template_references(cursor, template_name, template_data)
+        bump_state_version(cursor, 'templates')
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+    invalidate_state_versions()
+    logger.debug("Template '%s' saved or updated in SQLite", template_name)
 
 @app.route('/save_template', methods=['POST'])
 def save_template():
@@ -473,19 +2013,51 @@ def save_template():
             policy_data['application_list'] = ''
             policy_data['ips_sensor_enabled'] = False
             policy_data['ips_sensor'] = ''
-        logger.debug(f"Saving policy '{policy_data['policy_name']}': users={policy_data['users']}, groups={policy_data['groups']}, "
-                     f"webfilter_enabled={policy_data['webfilter_enabled']}, application_list_enabled={policy_data['application_list_enabled']}, "
-                     f"av_enabled={policy_data['av_enabled']}, ips_sensor_enabled={policy_data['ips_sensor_enabled']}, "
-                     f"inspection_mode={policy_data['inspection_mode']}, ip_pool={policy_data['ip_pool']}")
+        logger.debug("Saving policy '%s': users=%s, groups=%s, webfilter_enabled=%s, application_list_enabled=%s, "
+                     "av_enabled=%s, ips_sensor_enabled=%s, inspection_mode=%s, ip_pool=%s",
+                     policy_data['policy_name'], policy_data['users'], policy_data['groups'],
+                     policy_data['webfilter_enabled'], policy_data['application_list_enabled'],
+                     policy_data['av_enabled'], policy_data['ips_sensor_enabled'],
+                     policy_data['inspection_mode'], policy_data['ip_pool'])
         template_data['policies'].append(policy_data)
 
     try:
         save_template_to_db(template_name, template_data)
         return jsonify({"status": "success", "message": f"Template '{template_name}' saved"})
     except Exception as e:
-        logger.error(f"Failed to save template '{template_name}': {str(e)}")
+        logger.error("Failed to save template '%s': %s", template_name, e)
         return jsonify({"error": "Failed to save template"}), 500
 
+IMPORTED_POLICY_DEFAULTS = {
+    'policy_name': '', 'policy_comment': '', 'src_interfaces': [], 'dst_interfaces': [],
+    'src_addresses': [], 'src_address_groups': [], 'src_internet_services': [], 'src_vips': [],
+    'dst_addresses': [], 'dst_address_groups': [], 'dst_internet_services': [], 'dst_vips': [],
+    'services': [], 'action': '', 'inspection_mode': 'flow', 'ssl_ssh_profile': '', 'webfilter_profile': '',
+    'webfilter_enabled': True, 'av_profile': '', 'av_enabled': False, 'application_list': '',
+    'application_list_enabled': True, 'ips_sensor': '', 'ips_sensor_enabled': True, 'logtraffic': '',
+    'logtraffic_start': '', 'auto_asic_offload': '', 'nat': '', 'ip_pool': '', 'users': [], 'groups': []
+}
+
+# Fill missing policy fields with their defaults, give the policy a fresh id and clear
+# the security profiles of deny policies. Raises ValueError for malformed policies.
+def normalize_imported_policy(policy):
+    if not isinstance(policy, dict):
+        raise ValueError("Policy must be an object")
+    normalized = dict(policy)
+    for field, default in IMPORTED_POLICY_DEFAULTS.items():
+        if field not in normalized:
+            normalized[field] = list(default) if isinstance(default, list) else default
+        elif isinstance(default, list) and not isinstance(normalized[field], list):
+            raise ValueError(f"Policy field '{field}' must be a list")
+    if not isinstance(normalized['action'], str):
+        raise ValueError("Policy field 'action' must be a string")
+    normalized['policy_id'] = str(uuid.uuid4())
+    if normalized['action'].lower() == 'deny':
+        normalized.update(ssl_ssh_profile='', webfilter_enabled=False, webfilter_profile='', av_enabled=False,
+                          av_profile='', application_list_enabled=False, application_list='',
+                          ips_sensor_enabled=False, ips_sensor='')
+    return normalized
+
 @app.route('/import_template', methods=['POST'])
 def import_template():
     logger.debug("Received request to import template")
@@ -505,187 +2077,638 @@ def import_template():
             logger.error("Invalid template data format")
             return jsonify({"error": "Invalid template data format: Must contain policies"}), 400
 
-        required_policy_fields = [
-            'policy_id', 'policy_name', 'policy_comment', 'src_interfaces', 'dst_interfaces',
-            'src_addresses', 'src_address_groups', 'src_internet_services', 'src_vips',
-            'dst_addresses', 'dst_address_groups', 'dst_internet_services', 'dst_vips',
-            'services', 'action', 'inspection_mode', 'ssl_ssh_profile', 'webfilter_profile',
-            'webfilter_enabled', 'av_profile', 'av_enabled', 'application_list',
-            'application_list_enabled', 'ips_sensor', 'ips_sensor_enabled', 'logtraffic',
-            'logtraffic_start', 'auto_asic_offload', 'nat', 'ip_pool', 'users', 'groups'
-        ]
-        for policy in template_data['policies']:
-            for field in required_policy_fields:
-                if field not in policy:
-                    if field in ['webfilter_enabled', 'application_list_enabled', 'ips_sensor_enabled']:
-                        policy[field] = True
-                    elif field == 'av_enabled':
-                        policy[field] = False
-                    elif field == 'inspection_mode':
-                        policy[field] = 'flow'
-                    elif field in ['policy_name', 'policy_comment', 'action', 'ssl_ssh_profile',
-                                   'webfilter_profile', 'av_profile', 'application_list', 'ips_sensor',
-                                   'logtraffic', 'logtraffic_start', 'auto_asic_offload', 'nat', 'ip_pool']:
-                        policy[field] = ''
-                    else:
-                        policy[field] = []
-            policy['policy_id'] = str(uuid.uuid4())
-            if policy['action'].lower() == 'deny':
-                policy['ssl_ssh_profile'] = ''
-                policy['webfilter_enabled'] = False
-                policy['webfilter_profile'] = ''
-                policy['av_enabled'] = False
-                policy['av_profile'] = ''
-                policy['application_list_enabled'] = False
-                policy['application_list'] = ''
-                policy['ips_sensor_enabled'] = False
-                policy['ips_sensor'] = ''
-
+        template_data['policies'] = [normalize_imported_policy(policy) for policy in template_data['policies']]
         save_template_to_db(template_name, template_data)
         return jsonify({"status": "success", "message": f"Template '{template_name}' imported"})
     except json.JSONDecodeError as e:
-        logger.error(f"Failed to parse template data: {str(e)}")
+        logger.error("Failed to parse template data: %s", e)
         return jsonify({"error": "Invalid JSON format"}), 400
+    except ValueError as e:
+        logger.error("Invalid policy in template '%s': %s", template_name, e)
+        return jsonify({"error": str(e)}), 400
     except Exception as e:
-        logger.error(f"Failed to import template '{template_name}': {str(e)}")
+        logger.error("Failed to import template '%s': %s", template_name, e)
         return jsonify({"error": "Failed to import template"}), 500
 
+# Yield (source, entry) for every template in a bundle, where entry is the parsed
+# export_template document or an Exception explaining why it could not be read.
+# A bundle is a zip of exported .json files or JSON Lines with one export per line;
+# both are read one template at a time.
+def iter_template_bundle(stream):
+    if stream.read(4) == b'PK\x03\x04':
+        stream.seek(0)
+        with zipfile.ZipFile(stream) as archive:
+            for member in archive.infolist():
+                if member.is_dir() or not member.filename.lower().endswith('.json') or member.filename == 'manifest.json':
+                    continue
+                if member.file_size > BULK_IMPORT_MAX_MEMBER_BYTES:
+                    yield member.filename, ValueError(f"File exceeds {BULK_IMPORT_MAX_MEMBER_BYTES} bytes")
+                    continue
+                try:
+                    with archive.open(member) as f:
+                        entry = json.loads(f.read(BULK_IMPORT_MAX_MEMBER_BYTES + 1))
+                    if isinstance(entry, dict) and 'name' not in entry and 'policies' in entry:
+                        entry = {'name': os.path.splitext(os.path.basename(member.filename))[0], 'data': entry}
+                    yield member.filename, entry
+                except (ValueError, zipfile.BadZipFile, zlib.error) as e:
+                    yield member.filename, e
+        return
+    stream.seek(0)
+    for line_number, line in enumerate(io.TextIOWrapper(stream, encoding='utf-8', errors='replace'), 1):
+        if not line.strip():
+            continue
+        try:
+            yield f'line {line_number}', json.loads(line)
+        except ValueError as e:
+            yield f'line {line_number}', e
+
+# Validate and normalize one bundle entry into (template_name, template_data)
+def prepare_bundle_template(entry):
+    if isinstance(entry, Exception):
+        raise ValueError(f"Unreadable entry: {entry}")
+    if not isinstance(entry, dict) or not isinstance(entry.get('data'), dict):
+        raise ValueError("Entry must be an exported template with 'name' and 'data'")
+    name = entry.get('name')
+    if not isinstance(name, str) or not name.strip():
+        raise ValueError("Template name is required")
+    policies = entry['data'].get('policies')
+    if not isinstance(policies, list) or not policies:
+        raise ValueError("Template must contain at least one policy")
+    template_data = dict(entry['data'])
+    template_data['policies'] = [normalize_imported_policy(policy) for policy in policies]
+    return name.strip(), template_data
+
+# Write prepared templates in one transaction: revisions are recorded against the rows
+# as they were before the import, then the rows are upserted BULK_IMPORT_BATCH at a time
+@timed_query
+def bulk_save_templates(templates, replace=True):
+    conn = sqlite3.connect(app.config['DB_PATH'])
+    cursor = conn.cursor()
+    try:
+        cursor.execute('BEGIN IMMEDIATE')
+        existing = set()
+        names = [name for name, _ in templates]
+        for start in range(0, len(names), 500):
+            chunk = names[start:start + 500]
+            cursor.execute(f"SELECT name FROM templates WHERE name IN ({','.join('?' * len(chunk))})", chunk)
+            existing.update(row[0] for row in cursor.fetchall())
+        written = {}
+        for start in range(0, len(templates), BULK_IMPORT_BATCH):
+            rows = []
+            for name, template_data in templates[start:start + BULK_IMPORT_BATCH]:
+                if name in existing and not replace:
+                    written[name] = 'skipped'
+                    continue
+                record_template_revision(cursor, name, template_data)
+                update_template_references(cursor, name, template_data)
+                rows.append((name, encode_document(template_data), json.dumps(build_template_summary(template_data))))
+                written[name] = 'updated' if name in existing else 'created'
+            cursor.executemany('''
+                INSERT INTO templates (name, data, summary) VALUES (?, ?, ?)
+                ON CONFLICT(name) DO UPDATE SET data = excluded.data, summary = excluded.summary
+            ''', rows)
+        if any(result != 'skipped' for result in written.values()):
+            bump_state_version(cursor, 'templates')
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+    invalidate_state_versions()
+    return written
+
+# Import many templates from a bundle (form field `bundle`). on_conflict=replace|skip
+# decides what happens to existing templates; with strict=true nothing is written
+# unless every entry is valid. Results are reported per bundle entry.
+@app.route('/import_templates', methods=['POST'])
+def import_templates():
+    logger.debug("Received request to bulk import templates")
+    bundle = request.files.get('bundle')
+    if bundle is None:
+        logger.error("No bundle uploaded")
+        return jsonify({"error": "No bundle uploaded"}), 400
+    on_conflict = request.form.get('on_conflict', 'replace')
+    if on_conflict not in ('replace', 'skip'):
+        return jsonify({"error": "on_conflict must be 'replace' or 'skip'"}), 400
+    strict = request.form.get('strict', '').lower() in ('1', 'true', 'yes')
+
+    results = []
+    prepared = {}
+    try:
+        for source, entry in iter_template_bundle(bundle.stream):
+            if len(results) >= app.config['BULK_IMPORT_MAX_TEMPLATES']:
+                return jsonify({"error": f"Bundle exceeds {app.config['BULK_IMPORT_MAX_TEMPLATES']} templates"}), 413
+            try:
+                name, template_data = prepare_bundle_template(entry)
+                if name in prepared:
+                    raise ValueError(f"Template '{name}' appears more than once in the bundle")
+            except ValueError as e:
+                results.append({"source": source, "name": entry.get('name') if isinstance(entry, dict) else None,
+                                "status": "error", "error": str(e)})
+                continue
+            prepared[name] = template_data
+            results.append({"source": source, "name": name, "status": "pending"})
+    except zipfile.BadZipFile as e:
+        logger.error("Invalid bundle archive: %s", e)
+        return jsonify({"error": "Invalid zip archive"}), 400
+
+    errors = sum(1 for result in results if result['status'] == 'error')
+    if not results:
+        return jsonify({"error": "Bundle contains no templates"}), 400
+    if strict and errors:
+        for result in results:
+            if result['status'] == 'pending':
+                result['status'] = 'not_imported'
+        logger.error("Bulk import rejected: %d of %d entries invalid", errors, len(results))
+        return jsonify({"error": "Bundle contains invalid templates; nothing was imported", "results": results}), 400
+
+    try:
+        written = bulk_save_templates(list(prepared.items()), replace=on_conflict == 'replace')
+    except sqlite3.Error as e:
+        logger.error("Bulk import failed: %s", e)
+        return jsonify({"error": "Failed to import templates; nothing was imported"}), 500
+    for result in results:
+        if result['status'] == 'pending':
+            result['status'] = written[result['name']]
+    counts = {}
+    for result in results:
+        counts[result['status']] = counts.get(result['status'], 0) + 1
+    logger.info("Bulk imported templates: %s", counts)
+    return jsonify({"status": "success", "counts": counts, "results": results})
+
 @app.route('/export_template/<template_name>', methods=['GET'])
 def export_template(template_name):
-    logger.debug(f"Received request to export template: {template_name}")
-    templates = load_templates()
-    for template in templates:
-        if template['name'] == template_name:
-            export_data = {
-                'name': template_name,
-                'data': template['data']
-            }
-            buffer = BytesIO()
-            buffer.write(json.dumps(export_data, indent=2).encode('utf-8'))
-            buffer.seek(0)
-            logger.debug(f"Template '{template_name}' exported as JSON")
-            return send_file(
-                buffer,
-                as_attachment=True,
-                download_name=f"{template_name}.json",
-                mimetype='application/json'
-            )
-    logger.error(f"Template '{template_name}' not found for export")
-    return jsonify({"error": "Template not found"}), 404
+    logger.debug("Received request to export template: %s", template_name)
+    validators = template_validators(template_name)
+    if validators is None:
+        logger.error("Template '%s' not found for export", template_name)
+        return jsonify({"error": "Template not found"}), 404
+    etag, last_modified = validators
+    if not_modified(etag, last_modified):
+        logger.debug("Template '%s' export not modified", template_name)
+        return not_modified_response(etag, last_modified)
 
-@app.route('/load_templates', methods=['GET'])
-def load_templates_endpoint():
-    logger.debug("Received request to load templates")
-    templates = load_templates()
-    template_names = [t['name'] for t in templates]
-    response = {"templates": template_names}
-    logger.debug(f"Sending response: {json.dumps(response)}")
-    return jsonify(response)
+    template = load_template(template_name)
+    export_data = {
+        'name': template_name,
+        'data': template['data']
+    }
+    response = app.response_class(json.dumps(export_data, indent=2), mimetype='application/json')
+    response.headers['Content-Disposition'] = f'attachment; filename="{template_name}.json"'
+    logger.debug("Template '%s' exported as JSON", template_name)
+    return with_validators(response, etag, last_modified)
+
+# Collects what zipfile/tarfile write so a generator can hand it out chunk by chunk.
+# It is not seekable, so zipfile writes data descriptors instead of seeking back.
+class _ArchiveStream(io.RawIOBase):
+    def __init__(self):
+        self.chunks = []
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def drain(self):
+        data = b''.join(self.chunks)
+        self.chunks = []
+        return data
+
+# Yield (name, data, summary, revisions) for every template in name order, one
+# EXPORT_PAGE_SIZE page per query; revisions are raw (revision, kind, checksum, blob,
+# created_at) rows and only fetched when asked for
+def iter_template_library(with_revisions):
+    last_name = ''
+    while True:
+        conn = sqlite3.connect(app.config['DB_PATH'])
+        cursor = conn.cursor()
+        cursor.execute('SELECT name, data, summary FROM templates WHERE name > ? ORDER BY name LIMIT ?',
+                       (last_name, EXPORT_PAGE_SIZE))
+        rows = cursor.fetchall()
+        revisions = {}
+        if rows and with_revisions:
+            cursor.execute(f'''
+                SELECT template_name, revision, kind, checksum, data, created_at FROM template_revisions
+                WHERE template_name IN ({','.join('?' * len(rows))}) ORDER BY template_name, revision
+            ''', [row[0] for row in rows])
+            for template_name, *revision in cursor:
+                revisions.setdefault(template_name, []).append(revision)
+        conn.close()
+        if not rows:
+            return
+        for name, data, summary in rows:
+            yield name, data, summary, revisions.get(name, [])
+        last_name = rows[-1][0]
+
+# Full revision history of one template as JSON Lines, replaying deltas in order
+def _revision_history_lines(revision_rows):
+    lines = None
+    for revision, kind, checksum, blob, created_at in revision_rows:
+        payload = _unpack_revision(blob)
+        lines = payload if kind == 'full' else _apply_revision_delta(lines, payload)
+        yield json.dumps({'revision': revision, 'checksum': checksum, 'created_at': created_at,
+                          'data': _template_from_revision_lines(lines)}) + '\n'
+
+# Archive members are templates/<name>.json in the export_template format (which
+# /import_templates reads back), revisions/<name>.jsonl and a closing manifest.json.
+# Only one member is held in memory at a time.
+def stream_template_archive(archive_format, with_summaries, with_revisions):
+    stream = _ArchiveStream()
+    started = time.time()
+    if archive_format == 'zip':
+        archive = zipfile.ZipFile(stream, 'w', compression=zipfile.ZIP_DEFLATED)
+
+        def add_member(member_name, body):
+            archive.writestr(zipfile.ZipInfo(member_name, time.localtime(started)[:6]), body,
+                             compress_type=zipfile.ZIP_DEFLATED)
+    else:
+        archive = tarfile.open(fileobj=stream, mode='w|gz')
+
+        def add_member(member_name, body):
+            info = tarfile.TarInfo(member_name)
+            info.size = len(body)
+            info.mtime = started
+            archive.addfile(info, io.BytesIO(body))
+
+    count = 0
+    revision_count = 0
+    try:
+        for name, data, summary, revision_rows in iter_template_library(with_revisions):
+            export_data = {'name': name, 'data': decode_document(data)}
+            if with_summaries:
+                export_data['summary'] = json.loads(summary) if summary else build_template_summary(export_data['data'])
+            file_name = quote(name, safe=' ')
+            add_member(f'templates/{file_name}.json', json.dumps(export_data, indent=2).encode('utf-8'))
+            if revision_rows:
+                add_member(f'revisions/{file_name}.jsonl',
+                           ''.join(_revision_history_lines(revision_rows)).encode('utf-8'))
+                revision_count += len(revision_rows)
+            count += 1
+            yield stream.drain()
+        manifest = {
+            'exported_at': datetime.fromtimestamp(started, timezone.utc).isoformat(),
+            'templates': count,
+            'revisions': revision_count,
+            'summaries': with_summaries
+        }
+        add_member('manifest.json', json.dumps(manifest, indent=2).encode('utf-8'))
+    finally:
+        archive.close()
+    yield stream.drain()
+    logger.info("Exported %d templates (%d revisions) as %s in %.1f s",
+                count, revision_count, archive_format, time.time() - started)
+
+# Download every template as one archive: format=zip (default) or tar (tar.gz), with
+# summaries=true and revisions=true adding summaries and full revision history
+@app.route('/export_templates', methods=['GET'])
+def export_templates():
+    archive_format = request.args.get('format', 'zip')
+    if archive_format not in ('zip', 'tar'):
+        return jsonify({"error": "format must be 'zip' or 'tar'"}), 400
+    with_summaries = request.args.get('summaries', '').lower() in ('1', 'true', 'yes')
+    with_revisions = request.args.get('revisions', '').lower() in ('1', 'true', 'yes')
+    logger.debug("Exporting template library as %s (summaries=%s, revisions=%s)",
+                 archive_format, with_summaries, with_revisions)
+    file_name = f"templates-{datetime.now(timezone.utc).strftime('%Y%m%d-%H%M%S')}.{'zip' if archive_format == 'zip' else 'tar.gz'}"
+    return Response(stream_template_archive(archive_format, with_summaries, with_revisions),
+                    mimetype='application/zip' if archive_format == 'zip' else 'application/gzip',
+                    headers={'Content-Disposition': f'attachment; filename="{file_name}"',
+                             'Cache-Control': 'no-store'})
+
+@app.route('/load_templates', methods=['GET'])
+def load_templates_endpoint():
+    logger.debug("Received request to load templates")
+    etag = f"templates-{_current_state_versions().get('templates', 0)}"
+    if not_modified(etag):
+        return not_modified_response(etag)
+    template_names = list(get_template_names_snapshot())
+    response = {"templates": template_names}
+    payload_logger.debug("Sending response: %s", response)
+    return with_validators(jsonify(response), etag)
 
 @app.route('/get_template/<template_name>', methods=['GET'])
 def get_template(template_name):
-    logger.debug(f"Received request to get template: {template_name}")
-    templates = load_templates()
-    for template in templates:
-        if template['name'] == template_name:
-            interfaces = set()
-            addresses = set()
-            address_groups = set()
-            internet_services = set()
-            vips = set()
-            ip_pools = set()
-            services = []
-            service_groups = {}
-            ssl_ssh_profiles = set()
-            webfilter_profiles = set()
-            av_profiles = set()
-            application_lists = set()
-            ips_sensors = set()
-            users = set()
-            groups = set()
-
-            for policy in template['data']['policies']:
-                interfaces.update(policy.get('src_interfaces', []))
-                interfaces.update(policy.get('dst_interfaces', []))
-                addresses.update(policy.get('src_addresses', []))
-                addresses.update(policy.get('dst_addresses', []))
-                address_groups.update(policy.get('src_address_groups', []))
-                address_groups.update(policy.get('dst_address_groups', []))
-                internet_services.update(policy.get('src_internet_services', []))
-                internet_services.update(policy.get('dst_internet_services', []))
-                vips.update(policy.get('src_vips', []))
-                vips.update(policy.get('dst_vips', []))
-                ip_pools.add(policy.get('ip_pool', '')) if policy.get('ip_pool') else None
-                for svc in policy.get('services', []):
-                    svc_type = svc.get('type', '')
-                    svc_name = svc.get('name', '')
-                    if svc_type == 'group' and svc_name not in service_groups:
-                        service_groups[svc_name] = []
-                    elif svc_type == 'template' or svc_type == 'custom':
-                        svc_info = {
-                            'name': svc_name,
-                            'protocol': svc.get('protocol', 'TCP'),
-                            'port': svc.get('port', '0')
-                        }
-                        if svc_type == 'template' and svc_name in KNOWN_SERVICES:
-                            svc_info.update(KNOWN_SERVICES[svc_name])
-                        if svc_info not in services:
-                            services.append(svc_info)
-                if policy.get('ssl_ssh_profile') and policy.get('action', '').lower() != 'deny':
-                    ssl_ssh_profiles.add(policy['ssl_ssh_profile'])
-                if policy.get('webfilter_profile') and policy.get('webfilter_enabled') and policy.get('action', '').lower() != 'deny':
-                    webfilter_profiles.add(policy['webfilter_profile'])
-                if policy.get('av_profile') and policy.get('av_enabled') and policy.get('action', '').lower() != 'deny':
-                    av_profiles.add(policy['av_profile'])
-                if policy.get('application_list') and policy.get('application_list_enabled') and policy.get('action', '').lower() != 'deny':
-                    application_lists.add(policy['application_list'])
-                if policy.get('ips_sensor') and policy.get('ips_sensor_enabled') and policy.get('action', '').lower() != 'deny':
-                    ips_sensors.add(policy['ips_sensor'])
-                users.update(policy.get('users', []))
-                groups.update(policy.get('groups', []))
-
-            logger.debug(f"Template '{template_name}' found")
-            return jsonify({
-                "status": "success",
-                "data": template['data'],
-                "config": {
-                    "interfaces": list(interfaces),
-                    "addresses": list(addresses),
-                    "address_groups": list(address_groups),
-                    "internet_services": list(internet_services),
-                    "vips": list(vips),
-                    "ip_pools": list(ip_pools),
-                    "services": services,
-                    "service_groups": service_groups,
-                    "ssl_ssh_profiles": list(ssl_ssh_profiles),
-                    "webfilter_profiles": list(webfilter_profiles),
-                    "av_profiles": list(av_profiles),
-                    "application_lists": list(application_lists),
-                    "ips_sensors": list(ips_sensors),
-                    "users": list(users),
-                    "groups": list(groups)
-                }
-            })
-    logger.error(f"Template '{template_name}' not found")
-    return jsonify({"error": "Template not found"}), 404
+    logger.debug("Received request to get template: %s", template_name)
+    validators = template_validators(template_name)
+    if validators is None:
+        logger.error("Template '%s' not found", template_name)
+        return jsonify({"error": "Template not found"}), 404
+    etag, last_modified = validators
+    device = request.args.get('device')
+    if device:
+        # The attached device config has its own version, so only the ETag can cover both
+        etag = f"{etag}-{catalog_version_tag(device)}"
+        last_modified = None
+    if not_modified(etag, last_modified):
+        logger.debug("Template '%s' not modified (ETag %s)", template_name, etag)
+        return not_modified_response(etag, last_modified)
+
+    template = load_template(template_name)
+    if not template:
+        logger.error("Template '%s' not found", template_name)
+        return jsonify({"error": "Template not found"}), 404
+
+    summary = template['summary']
+    if summary is None:
+        summary = build_template_summary(template['data'])
+        save_template_summary(template_name, summary)
+
+    response = {
+        "status": "success",
+        "data": template['data'],
+        "config": summary
+    }
+    if device:
+        device_config = get_device_config_snapshot(device)
+        if device_config is None:
+            logger.error("Device '%s' not found", device)
+            return jsonify({"error": "Device not found"}), 404
+        response["device"] = device
+        response["device_config"] = _thaw(device_config)
+
+    logger.debug("Template '%s' found", template_name)
+    return with_validators(jsonify(response), etag, last_modified)
+
+@app.route('/template_revisions/<template_name>', methods=['GET'])
+def get_template_revisions(template_name):
+    logger.debug("Received request to list revisions of template: %s", template_name)
+    revisions = list_template_revisions(template_name)
+    if not revisions:
+        logger.error("No revisions found for template '%s'", template_name)
+        return jsonify({"error": "No revisions found for template"}), 404
+    return jsonify({"status": "success", "template_name": template_name, "revisions": revisions})
+
+@app.route('/template_revisions/<template_name>/<int:revision>', methods=['GET'])
+def get_template_revision(template_name, revision):
+    logger.debug("Received request to get revision %s of template: %s", revision, template_name)
+    template_data = load_template_revision(template_name, revision)
+    if template_data is None:
+        logger.error("Revision %s of template '%s' not found", revision, template_name)
+        return jsonify({"error": "Revision not found"}), 404
+    return jsonify({"status": "success", "template_name": template_name, "revision": revision, "data": template_data})
+
+# Keys of a parsed catalog (parse_config response) that hold plain name lists
+CATALOG_LIST_KEYS = (
+    'interfaces', 'addresses', 'address_groups', 'internet_services', 'vips', 'ip_pools',
+    'ssl_ssh_profiles', 'webfilter_profiles', 'av_profiles', 'application_lists', 'ips_sensors',
+    'users', 'groups'
+)
+
+# Merge a template summary with a parsed catalog, keeping the template's entries first
+def merge_catalogs(template_summary, config):
+    merged = {}
+    for key in CATALOG_LIST_KEYS:
+        merged[key] = list(dict.fromkeys(list(template_summary.get(key, ())) + list(config.get(key, ()))))
+    services = []
+    service_names = set()
+    for svc in list(template_summary.get('services', ())) + list(config.get('services', ())):
+        if svc['name'] not in service_names:
+            service_names.add(svc['name'])
+            services.append(dict(svc))
+    merged['services'] = services
+    merged['service_groups'] = {name: list(members) for name, members in template_summary.get('service_groups', {}).items()}
+    merged['service_groups'].update({name: list(members) for name, members in config.get('service_groups', {}).items()})
+    merged['address_group_members'] = {name: list(members)
+                                       for name, members in config.get('address_group_members', {}).items()}
+    return merged
+
+# Version tag of the catalog for a device/template pair, taken from state versions alone
+def catalog_version_tag(device=None, template_name=None):
+    versions = _current_state_versions()
+    version_key = f'device:{device}' if device else 'last_config'
+    tag_source = f"{device}:{versions.get(version_key, 0)}:{template_name}:{versions.get('templates', 0) if template_name else ''}"
+    return hashlib.sha1(tag_source.encode('utf-8')).hexdigest()[:20]
+
+# Parsed catalog of a device (or the most recent import), merged with a template's summary.
+# Returns (catalog, error message).
+def load_catalog(device=None, template_name=None):
+    config = resolve_device_config(device)
+    if device and config is None:
+        return None, "Device not found"
+    config = _thaw(config) if config is not None else {}
+
+    if not template_name:
+        return merge_catalogs({}, config), None
+    template = load_template(template_name)
+    if not template:
+        return None, "Template not found"
+    summary = template['summary'] if template['summary'] is not None else build_template_summary(template['data'])
+    return merge_catalogs(summary, config), None
+
+# Catalog lists behind each searchable picker of the UI: picker -> catalog keys
+REMOTE_SEARCH_PICKERS = OrderedDict([
+    ('addresses', ('addresses', 'address_groups', 'internet_services', 'vips')),
+    ('users', ('users', 'groups'))
+])
+
+# Catalog as sent to the UI. A picker whose lists together hold more than
+# REMOTE_SEARCH_THRESHOLD names is flagged in `remote_search`, and its lists are
+# replaced by their lengths in `counts`; the picker then pages through /search.
+def compact_catalog(catalog):
+    threshold = app.config['REMOTE_SEARCH_THRESHOLD']
+    catalog['remote_search'] = {}
+    catalog['counts'] = {}
+    for picker, keys in REMOTE_SEARCH_PICKERS.items():
+        remote = sum(len(catalog.get(key, ())) for key in keys) > threshold
+        catalog['remote_search'][picker] = remote
+        if remote:
+            for key in keys:
+                catalog['counts'][key] = len(catalog.pop(key, ()))
+    if catalog['remote_search']['addresses']:
+        catalog.pop('address_group_members', None)
+    return catalog
+
+@app.route('/catalog', methods=['GET'])
+def get_catalog():
+    device = request.args.get('device') or None
+    template_name = request.args.get('template') or None
+    logger.debug("Received request for catalog: device=%s, template=%s", device, template_name)
+
+    # The ETag is derived from state versions alone, so revalidation needs no decoding
+    etag = catalog_version_tag(device, template_name)
+    if not_modified(etag):
+        logger.debug("Catalog not modified (ETag %s)", etag)
+        return not_modified_response(etag)
+
+    catalog, error = load_catalog(device, template_name)
+    if error:
+        logger.error("Catalog request failed: %s", error)
+        return jsonify({"error": error}), 404
+
+    return with_validators(jsonify(compact_catalog(catalog)), etag)
+
+# Searchable object kinds: kind -> (catalog key, option group label used by the UI)
+SEARCH_KINDS = OrderedDict([
+    ('address', ('addresses', 'Addresses')),
+    ('address_group', ('address_groups', 'Address Groups')),
+    ('isdb', ('internet_services', 'Internet Services')),
+    ('vip', ('vips', 'Virtual IPs')),
+    ('service', ('services', 'Services')),
+    ('service_group', ('service_groups', 'Service Groups')),
+    ('user', ('users', 'Users')),
+    ('group', ('groups', 'Groups'))
+])
+
+# Search index over a catalog: a sorted name list for prefix lookups via bisect and
+# trigram posting lists for substring lookups
+def build_search_index(catalog):
+    entries = []
+    for kind, (key, _) in SEARCH_KINDS.items():
+        values = catalog.get(key, ())
+        if key == 'services':
+            names = [svc['name'] for svc in values]
+        else:
+            names = list(values)
+        entries.extend((kind, name) for name in names)
+    lowered = [name.lower() for _, name in entries]
+    prefix_ids = sorted(range(len(entries)), key=lowered.__getitem__)
+    trigrams = {}
+    for entry_id, text in enumerate(lowered):
+        for gram in {text[i:i + 3] for i in range(len(text) - 2)}:
+            trigrams.setdefault(gram, []).append(entry_id)
+    return {
+        'entries': entries,
+        'lowered': lowered,
+        'prefix_ids': prefix_ids,
+        'prefix_keys': [lowered[i] for i in prefix_ids],
+        'trigrams': trigrams
+    }
+
+# Ranked matches for a query: exact, then prefix, then substring; shorter names first.
+# Returns (total matches, entry ids of the first `count` ranked matches).
+def search_index(index, query, kinds=None, count=50):
+    query = query.strip().lower()
+    lowered = index['lowered']
+    if not query:
+        candidates = index['prefix_ids']
+    else:
+        lo = bisect.bisect_left(index['prefix_keys'], query)
+        hi = bisect.bisect_left(index['prefix_keys'], query + '\uffff')
+        candidates = set(index['prefix_ids'][lo:hi])
+        if len(query) >= 3:
+            postings = sorted((index['trigrams'].get(query[i:i + 3], ()) for i in range(len(query) - 2)), key=len)
+            if postings[0]:
+                matched = set(postings[0])
+                for posting in postings[1:]:
+                    matched.intersection_update(posting)
+                    if not matched:
+                        break
+                candidates.update(i for i in matched if query in lowered[i])
+
+    entries = index['entries']
+    if kinds:
+        candidates = [i for i in candidates if entries[i][0] in kinds]
+    if not query:
+        return len(candidates), list(candidates[:count])
+    ranked = heapq.nsmallest(count, candidates, key=lambda i: (
+        0 if lowered[i] == query else 1 if lowered[i].startswith(query) else 2, len(lowered[i]), lowered[i]))
+    return len(candidates), ranked
+
+# LRU of search indexes keyed by catalog version tag
+_search_indexes = OrderedDict()
+
+def get_search_index(device=None, template_name=None):
+    tag = catalog_version_tag(device, template_name)
+    with _snapshot_lock:
+        index = _search_indexes.get(tag)
+        if index is not None:
+            _search_indexes.move_to_end(tag)
+            inc_counter('fgc_cache_lookups_total', ('search_index', 'hit'))
+            return index, None
+    inc_counter('fgc_cache_lookups_total', ('search_index', 'miss'))
+    catalog, error = load_catalog(device, template_name)
+    if error:
+        return None, error
+    started = time.perf_counter()
+    index = build_search_index(catalog)
+    logger.debug("Built search index with %d entries in %.1f ms", len(index['entries']), 1000 * (time.perf_counter() - started))
+    with _snapshot_lock:
+        _search_indexes[tag] = index
+        while len(_search_indexes) > app.config['DEVICE_CACHE_SIZE']:
+            _search_indexes.popitem(last=False)
+    return index, None
+
+# Where-used lookup over the reference index: every policy referencing object `name`,
+# optionally narrowed to one `kind` (see REFERENCE_KINDS) and one `template`. At most
+# `limit` references are listed; the totals always cover all of them.
+@app.route('/where_used', methods=['GET'])
+def where_used():
+    name = request.args.get('name', '')
+    kind = request.args.get('kind', '')
+    template_name = request.args.get('template', '')
+    if not name:
+        return jsonify({"error": "name is required"}), 400
+    if kind and kind not in REFERENCE_KINDS:
+        return jsonify({"error": f"kind must be one of: {', '.join(REFERENCE_KINDS)}"}), 400
+    try:
+        limit = min(max(int(request.args.get('limit', 1000)), 1), 10000)
+    except ValueError:
+        return jsonify({"error": "limit must be an integer"}), 400
+    etag = f"references-{_current_state_versions().get('templates', 0)}"
+    if not_modified(etag):
+        return not_modified_response(etag)
+
+    started = time.perf_counter()
+    references = [
+        {"kind": ref_kind, "template": ref_template, "policy_id": policy_id, "policy_name": policy_name, "field": field}
+        for ref_kind, ref_template, policy_id, policy_name, field in find_references(name, kind, template_name)
+    ]
+    return with_validators(jsonify({
+        "status": "success",
+        "name": name,
+        "references": references[:limit],
+        "total": len(references),
+        "templates": sorted({ref['template'] for ref in references}),
+        "policies": len({(ref['template'], ref['policy_id']) for ref in references}),
+        "took_ms": round(1000 * (time.perf_counter() - started), 2)
+    }), etag)
+
+@app.route('/search', methods=['GET'])
+def search_objects():
+    query = request.args.get('q', '')
+    device = request.args.get('device') or None
+    template_name = request.args.get('template') or None
+    kinds = {kind for kind in request.args.get('kinds', '').split(',') if kind}
+    unknown_kinds = kinds - set(SEARCH_KINDS)
+    if unknown_kinds:
+        logger.warning("Unknown search kinds requested: %s", sorted(unknown_kinds))
+        return jsonify({"error": f"Unknown kinds: {', '.join(sorted(unknown_kinds))}"}), 400
+    try:
+        limit = min(max(int(request.args.get('limit', 50)), 1), 500)
+        offset = max(int(request.args.get('offset', 0)), 0)
+    except ValueError:
+        return jsonify({"error": "limit and offset must be integers"}), 400
+
+    started = time.perf_counter()
+    index, error = get_search_index(device, template_name)
+    if error:
+        logger.error("Search failed: %s", error)
+        return jsonify({"error": error}), 404
+    total, matches = search_index(index, query, kinds, offset + limit)
+    results = []
+    for entry_id in matches[offset:offset + limit]:
+        kind, name = index['entries'][entry_id]
+        results.append({"kind": kind, "name": name, "value": f"{kind}:{name}", "label": SEARCH_KINDS[kind][1]})
+    return jsonify({
+        "query": query,
+        "total": total,
+        "offset": offset,
+        "limit": limit,
+        "results": results,
+        "took_ms": round(1000 * (time.perf_counter() - started), 2)
+    })
 
 @app.route('/delete_template/<template_name>', methods=['DELETE'])
 def delete_template(template_name):
-    logger.debug(f"Received request to delete template: {template_name}")
-    templates = load_templates()
-    original_length = len(templates)
-    templates = [t for t in templates if t['name'] != template_name]
-    
-    short_urls = load_short_urls()
+    logger.debug("Received request to delete template: %s", template_name)
     template_url = f"{request.host_url}get_template/{template_name}"
-    short_urls = {k: v for k, v in short_urls.items() if v != template_url}
-    
-    if len(templates) < original_length:
-        save_templates(templates)
-        save_short_urls(short_urls)
-        logger.debug(f"Template '{template_name}' and its short URLs deleted")
+    if delete_template_from_db(template_name, template_url):
+        logger.debug("Template '%s' and its short URLs deleted", template_name)
         return jsonify({"status": "success", "message": f"Template '{template_name}' deleted"})
-    logger.error(f"Template '{template_name}' not found")
+    logger.error("Template '%s' not found", template_name)
     return jsonify({"error": "Template not found"}), 404
 
 @app.route('/rename_template', methods=['POST'])
@@ -705,67 +2728,54 @@ def rename_template():
         logger.warning("Old and new template names are the same")
         return jsonify({"error": "New template name must be different from the old name"}), 400
 
-    templates = load_templates()
-    template_to_rename = None
-    for template in templates:
-        if template['name'] == old_name:
-            template_to_rename = template
-            break
-
-    if not template_to_rename:
-        logger.error(f"Template '{old_name}' not found for renaming")
+    template_names = set(load_template_names())
+    if old_name not in template_names:
+        logger.error("Template '%s' not found for renaming", old_name)
         return jsonify({"error": "Template not found"}), 404
 
-    for template in templates:
-        if template['name'] == new_name:
-            logger.error(f"Template '{new_name}' already exists")
-            return jsonify({"error": "A template with the new name already exists"}), 400
-
-    templates = [t for t in templates if t['name'] != old_name]
-    template_to_rename['name'] = new_name
-    templates.append(template_to_rename)
+    if new_name in template_names:
+        logger.error("Template '%s' already exists", new_name)
+        return jsonify({"error": "A template with the new name already exists"}), 400
 
-    short_urls = load_short_urls()
     old_url = f"{request.host_url}get_template/{old_name}"
     new_url = f"{request.host_url}get_template/{new_name}"
-    for short_code, url in list(short_urls.items()):
-        if url == old_url:
-            short_urls[short_code] = new_url
-            logger.debug(f"Updated short URL for {short_code}: {old_url} to {new_url}")
-
     try:
-        save_templates(templates)
-        save_short_urls(short_urls)
-        logger.debug(f"Template renamed from '{old_name}' to '{new_name}'")
+        rename_template_in_db(old_name, new_name, old_url, new_url)
+        logger.debug("Template renamed from '%s' to '%s'", old_name, new_name)
         return jsonify({"status": "success", "message": f"Template renamed to '{new_name}'"})
     except Exception as e:
-        logger.error(f"Failed to rename template from '{old_name}' to '{new_name}': {str(e)}")
+        logger.error("Failed to rename template from '%s' to '%s': %s", old_name, new_name, e)
         return jsonify({"error": "Failed to rename template"}), 500
 
 @app.route('/clone_template/<template_name>', methods=['POST'])
 def clone_template(template_name):
-    logger.debug(f"Received request to clone template: {template_name}")
-    templates = load_templates()
-    for template in templates:
-        if template['name'] == template_name:
-            new_template_name = f"{template_name}_clone_{uuid.uuid4().hex[:6]}"
-            new_template_data = template['data'].copy()
-            for policy in new_template_data['policies']:
-                policy['policy_id'] = str(uuid.uuid4())
-            save_template_to_db(new_template_name, new_template_data)
-            logger.debug(f"Template '{template_name}' cloned as '{new_template_name}'")
-            return jsonify({"status": "success", "new_template_name": new_template_name})
-    logger.error(f"Template '{template_name}' not found for cloning")
-    return jsonify({"error": "Template not found"}), 404
+    logger.debug("Received request to clone template: %s", template_name)
+    template = load_template(template_name)
+    if not template:
+        logger.error("Template '%s' not found for cloning", template_name)
+        return jsonify({"error": "Template not found"}), 404
+    new_template_name = f"{template_name}_clone_{uuid.uuid4().hex[:6]}"
+    new_template_data = template['data'].copy()
+    for policy in new_template_data['policies']:
+        policy['policy_id'] = str(uuid.uuid4())
+    save_template_to_db(new_template_name, new_template_data)
+    logger.debug("Template '%s' cloned as '%s'", template_name, new_template_name)
+    return jsonify({"status": "success", "new_template_name": new_template_name})
 
+# Clone a policy within its template. The client names the template it has loaded
+# (`template_name`); without it the templates are searched one at a time.
 @app.route('/clone_policy', methods=['POST'])
 def clone_policy():
     logger.debug("Received request to clone policy")
     data = request.get_json()
     policy_id = data.get('policy_id')
-    templates = load_templates()
-    
-    for template in templates:
+    template_name = data.get('template_name')
+    template_names = [template_name] if template_name else load_template_names()
+
+    for name in template_names:
+        template = load_template(name)
+        if not template:
+            continue
         for policy in template['data']['policies']:
             if policy['policy_id'] == policy_id:
                 new_policy = policy.copy()
@@ -773,27 +2783,56 @@ def clone_policy():
                 new_policy['policy_name'] = f"{policy['policy_name']}_clone_{uuid.uuid4().hex[:6]}"[:32]
                 template['data']['policies'].append(new_policy)
                 save_template_to_db(template['name'], template['data'])
-                logger.debug(f"Policy '{policy_id}' cloned")
+                logger.debug("Policy '%s' cloned", policy_id)
                 return jsonify({"status": "success", "new_policy": new_policy})
-    logger.error(f"Policy '{policy_id}' not found for cloning")
+    logger.error("Policy '%s' not found for cloning", policy_id)
     return jsonify({"error": "Policy not found"}), 404
 
 @app.route('/generate_policy', methods=['POST'])
 def generate_policy():
-    logger.debug("Received request to generate policy")
+    generate_logger.debug("Received request to generate policy")
     data = request.form
     policies = json.loads(data.get('policies', '[]')) or []
     if not policies:
-        logger.error("No policies provided")
+        generate_logger.error("No policies provided")
         return jsonify({"error": "At least one policy is required"}), 400
 
+    # Custom services that already exist in the target VDOM of the device (`vdom`, by
+    # default root) are referenced, not redefined: by name, or (unless reuse_services=false)
+    # by an existing service with the same ports. Policies are checked for shadowing once
+    # the device's rulebase has been analyzed.
+    device = data.get('device')
+    vdom = data.get('vdom') or None
+    existing_services = set()
+    port_index = None
+    rulebase = None
+    if device:
+        device_config = get_device_config_snapshot(device)
+        rulebase = get_rulebase_snapshot(device)
+        if device_config is None and rulebase is None:
+            generate_logger.error("Device '%s' not found", device)
+            return jsonify({"error": "Device not found"}), 404
+        if rulebase:
+            vdom = vdom or ('root' if 'root' in rulebase['vdoms'] else next(iter(rulebase['vdoms'])))
+            if vdom not in rulebase['vdoms']:
+                generate_logger.error("VDOM '%s' not found in rulebase of device '%s'", vdom, device)
+                return jsonify({"error": "VDOM not found in analyzed rulebase"}), 400
+        if device_config is not None:
+            service_vdom = vdom or 'root'
+            existing_services = {svc['name'] for svc in device_config.get('services', ())
+                                 if svc.get('vdom') in (None, service_vdom)}
+            if data.get('reuse_services', 'true').lower() not in ('0', 'false', 'no'):
+                port_index = get_service_port_index(device, service_vdom)
+    reused_services = {}
+    render_started = time.perf_counter()
+
     def generate_single_policy(policy_name, policy_comment, src_intfs, dst_intfs, src_addrs, src_agrps, src_isdbs, src_vips, dst_addrs, dst_agrps, dst_isdbs, dst_vips, svc_names, action, inspection_mode, ssl_ssh_profile, webfilter_profile, av_profile, application_list, ips_sensor, logtraffic, logtraffic_start, auto_asic_offload, nat, ip_pool, services, users, groups, include_custom_services=True):
         if not src_intfs or not dst_intfs or (not src_addrs and not src_agrps and not src_isdbs and not src_vips) or (not dst_addrs and not dst_agrps and not dst_isdbs and not dst_vips) or not svc_names:
-            logger.warning(f"Skipping policy generation for {policy_name} due to missing required fields")
+            generate_logger.warning("Skipping policy generation for %s due to missing required fields", policy_name)
             return ""
 
         if len(policy_name) > 32:
-            logger.debug(f"Policy name '{policy_name}' exceeds 32 characters; truncating to 32 characters")
+            generate_logger.debug("Policy name '%s' exceeds 32 characters; truncating to 32 characters", policy_name)
             policy_name = policy_name[:32]
 
         cli_commands = "config firewall policy\n"
@@ -822,6 +2861,8 @@ def generate_policy():
             for svc in services:
                 if svc['type'] == 'custom' and f"custom_{svc['name']}" in svc_names:
                     svc_name = f"custom_{svc['name']}"
+                    if svc_name in existing_services:
+                        continue
                     cli_commands += "config firewall service custom\n"
                     cli_commands += f'edit "{svc_name}"\n'
                     cli_commands += f"set {svc['protocol'].lower()} {svc['port']}\n"
@@ -883,33 +2924,33 @@ def generate_policy():
         users = policy.get('users', [])
         groups = policy.get('groups', [])
 
-        logger.debug(f"Generating policy: {policy_name}")
-        logger.debug(f"Policy Comment: {policy_comment}")
-        logger.debug(f"Source Interfaces: {src_interfaces}")
-        logger.debug(f"Destination Interfaces: {dst_interfaces}")
-        logger.debug(f"Source Addresses: {src_addresses}")
-        logger.debug(f"Source Address Groups: {src_address_groups}")
-        logger.debug(f"Source Internet Services: {src_internet_services}")
-        logger.debug(f"Source VIPs: {src_vips}")
-        logger.debug(f"Destination Addresses: {dst_addresses}")
-        logger.debug(f"Destination Address Groups: {dst_address_groups}")
-        logger.debug(f"Destination Internet Services: {dst_internet_services}")
-        logger.debug(f"Destination VIPs: {dst_vips}")
-        logger.debug(f"Services: {services}")
-        logger.debug(f"Action: {action}")
-        logger.debug(f"Inspection Mode: {inspection_mode}")
-        logger.debug(f"SSL/SSH Profile: {ssl_ssh_profile}")
-        logger.debug(f"Webfilter Profile: {webfilter_profile}")
-        logger.debug(f"Antivirus Profile: {av_profile}")
-        logger.debug(f"Application List: {application_list}")
-        logger.debug(f"IPS Sensor: {ips_sensor}")
-        logger.debug(f"Log Traffic: {logtraffic}")
-        logger.debug(f"Log Traffic Start: {logtraffic_start}")
-        logger.debug(f"Auto ASIC Offload: {auto_asic_offload}")
-        logger.debug(f"NAT: {nat}")
-        logger.debug(f"IP Pool: {ip_pool}")
-        logger.debug(f"Users: {users}")
-        logger.debug(f"Groups: {groups}")
+        generate_logger.debug("Generating policy: %s", policy_name)
+        generate_logger.debug("Policy Comment: %s", policy_comment)
+        generate_logger.debug("Source Interfaces: %s", src_interfaces)
+        generate_logger.debug("Destination Interfaces: %s", dst_interfaces)
+        generate_logger.debug("Source Addresses: %s", src_addresses)
+        generate_logger.debug("Source Address Groups: %s", src_address_groups)
+        generate_logger.debug("Source Internet Services: %s", src_internet_services)
+        generate_logger.debug("Source VIPs: %s", src_vips)
+        generate_logger.debug("Destination Addresses: %s", dst_addresses)
+        generate_logger.debug("Destination Address Groups: %s", dst_address_groups)
+        generate_logger.debug("Destination Internet Services: %s", dst_internet_services)
+        generate_logger.debug("Destination VIPs: %s", dst_vips)
+        generate_logger.debug("Services: %s", services)
+        generate_logger.debug("Action: %s", action)
+        generate_logger.debug("Inspection Mode: %s", inspection_mode)
+        generate_logger.debug("SSL/SSH Profile: %s", ssl_ssh_profile)
+        generate_logger.debug("Webfilter Profile: %s", webfilter_profile)
+        generate_logger.debug("Antivirus Profile: %s", av_profile)
+        generate_logger.debug("Application List: %s", application_list)
+        generate_logger.debug("IPS Sensor: %s", ips_sensor)
+        generate_logger.debug("Log Traffic: %s", logtraffic)
+        generate_logger.debug("Log Traffic Start: %s", logtraffic_start)
+        generate_logger.debug("Auto ASIC Offload: %s", auto_asic_offload)
+        generate_logger.debug("NAT: %s", nat)
+        generate_logger.debug("IP Pool: %s", ip_pool)
+        generate_logger.debug("Users: %s", users)
+        generate_logger.debug("Groups: %s", groups)
 
         service_names = []
         for svc in services:
@@ -919,6 +2960,11 @@ def generate_policy():
                 service_names.append(svc['name'])
             elif svc['type'] == 'custom':
                 svc_name = f"custom_{svc['name']}"
+                if port_index is not None and svc_name not in existing_services:
+                    existing = port_index.find_definition(service_from_port_spec(svc.get('protocol'), svc.get('port')))
+                    if existing:
+                        reused_services[svc_name] = existing
+                        svc_name = existing
                 service_names.append(svc_name)
 
         output1 = generate_single_policy(
@@ -951,7 +2997,7 @@ def generate_policy():
             users=users,
             groups=groups
         )
-        logger.debug("Output 1 (All in one policy):\n%s", output1)
+        payload_logger.debug("Output 1 (All in one policy):\n%s", output1)
 
         output2 = ""
         if service_names:
@@ -990,7 +3036,7 @@ def generate_policy():
                 output2 += "\n" if output2 else ""
         else:
             output2 = "No services defined for this policy."
-        logger.debug("Output 2 (One policy per service):\n%s", output2)
+        payload_logger.debug("Output 2 (One policy per service):\n%s", output2)
 
         output3 = ""
         if src_interfaces and dst_interfaces and service_names:
@@ -1037,7 +3083,7 @@ def generate_policy():
                         output3 += "\n" if output3 else ""
         else:
             output3 = "No valid source interfaces, destination interfaces, or services defined for this policy."
-        logger.debug("Output 3 (One policy per src interface, dst interface, and service):\n%s", output3)
+        payload_logger.debug("Output 3 (One policy per src interface, dst interface, and service):\n%s", output3)
 
         all_outputs.append({
             "policy_id": policy.get('policy_id', str(uuid.uuid4())),
@@ -1047,31 +3093,1121 @@ def generate_policy():
             "output3": output3 if output3 else "No policy generated due to missing interfaces or services."
         })
 
+    observe('fgc_generate_render_duration_seconds', time.perf_counter() - render_started)
+    observe('fgc_generate_output_bytes', sum(len(output[key]) for output in all_outputs
+                                             for key in ('output1', 'output2', 'output3')))
     response = {"outputs": all_outputs}
-    logger.debug("Returning response with all outputs")
+    if device:
+        response["device"] = device
+    if reused_services:
+        response["reused_services"] = reused_services
+    if rulebase:
+        for output, check in zip(all_outputs, check_generated_policies(policies, rulebase, vdom)):
+            output["shadow_check"] = check
+        response["vdom"] = vdom
+        response["rulebase_analyzed_at"] = rulebase['analyzed_at']
+    generate_logger.debug("Returning response with all outputs")
     return jsonify(response)
 
+# Read an uploaded config file as text
+def read_uploaded_config(file):
+    # Decoded straight from the upload stream (with the same newline translation as a
+    # text-mode read); saving under the client's file name raced between concurrent
+    # uploads of equally named files and let the name escape the temp directory
+    content = io.TextIOWrapper(file.stream, encoding='utf-8').read()
+    parse_logger.debug("Config file content length: %d bytes", len(content))
+    return content
+
+# Parsed configs are stored per device: explicit name, then hostname, then file name
+def detect_device_name(content, filename, explicit=''):
+    device = (explicit or '').strip()
+    if not device:
+        hostname_match = re.search(r'^\s*set hostname\s+"?([^"\n]+?)"?\s*$', content, re.MULTILINE)
+        device = hostname_match.group(1) if hostname_match else os.path.splitext(filename or '')[0] or 'default'
+    return device
+
 @app.route('/parse_config', methods=['POST'])
 def parse_config():
-    logger.debug("Received request to parse config")
+    parse_logger.debug("Received request to parse config")
+    if 'config_file' not in request.files:
+        parse_logger.error("No file loaded")
+        return jsonify({"error": "No file uploaded"}), 400
+
+    file = request.files['config_file']
+    content = read_uploaded_config(file)
+    device = detect_device_name(content, file.filename, request.form.get('device', ''))
+    parse_logger.debug("Parsing config for device: %s", device)
+
+    timings = {}
+    response = parse_config_content(content, timings=timings)
+    record_parse_metrics(len(content), timings, response)
+    save_device_config(device, response)
+    schedule_drift_check(device)
+    schedule_backup_snapshot(device, content)
+    response["device"] = device
+
+    payload_logger.debug("Returning parsed config response: %s", response)
+    return jsonify(response)
+
+# Streaming reader of FortiOS config blocks. Lines are consumed one at a time with a
+# stack of open `config` sections and `edit` entries, so memory stays bounded by the
+# nesting depth plus the entry being read. Object tables (and `config vdom` entries)
+# are only recognised at the top level of the backup or of a VDOM.
+_CONFIG_TOKEN = re.compile(r'"((?:[^"\\]|\\.)*)"|(\S+)')
+_CONFIG_ESCAPE = re.compile(r'\\(.)')
+
+def config_tokens(value):
+    if '\\' not in value:
+        return [quoted or bare for quoted, bare in _CONFIG_TOKEN.findall(value)]
+    return [_CONFIG_ESCAPE.sub(r'\1', quoted) if quoted or not bare else bare
+            for quoted, bare in _CONFIG_TOKEN.findall(value)]
+
+# Object tables whose names decide how a policy's srcaddr/dstaddr/service entries map
+# onto the template fields
+POLICY_OBJECT_SECTIONS = {
+    'firewall addrgrp': 'address_groups',
+    'firewall vip': 'vips',
+    'firewall vipgrp': 'vips',
+    'firewall service group': 'service_groups'
+}
+SERVICE_DEFINITION_KEYS = ('protocol', 'protocol-number', 'tcp-portrange', 'udp-portrange', 'sctp-portrange',
+                           'icmptype', 'iprange', 'fqdn')
+POLICY_IMPORT_SECTIONS = {'firewall policy': None, 'firewall service custom': SERVICE_DEFINITION_KEYS,
+                          **{section: () for section in POLICY_OBJECT_SECTIONS}}
+
+def _top_level_section(stack):
+    if len(stack) < 2 or stack[-1][0] != 'edit' or stack[-2][0] != 'config':
+        return None
+    depth = len(stack) - 2
+    if depth == 0 or (depth == 2 and stack[0] == ('config', 'vdom')):
+        return stack[-2][1]
+    return None
+
+# Yield (vdom, section, name, {setting: [values]}) for every top-level entry of the
+# tables in `sections`, which maps a table to the settings to keep (None: all of them,
+# an empty tuple: just the name); `meta` is filled with the hostname as it streams past
+def iter_config_entries(lines, sections, meta):
+    stack = []
+    vdom = 'root'
+    entry = None
+    for raw in lines:
+        line = raw.strip()
+        if not line or line.startswith('#'):
+            continue
+        keyword, _, rest = line.partition(' ')
+        if keyword == 'config':
+            stack.append(('config', rest.strip()))
+        elif keyword == 'edit':
+            stack.append(('edit', ''))
+            section = _top_level_section(stack)
+            vdom_entry = len(stack) == 2 and stack[0] == ('config', 'vdom')
+            # Most entries are objects nobody asked about; only tokenize the names that matter
+            if not (vdom_entry or section in sections):
+                continue
+            name = first_value({'edit': config_tokens(rest)}, 'edit')
+            stack[-1] = ('edit', name)
+            if vdom_entry:
+                vdom = name
+            else:
+                entry = (section, name, {}, sections[section], len(stack))
+        elif keyword in ('next', 'end'):
+            # `next` closes the current entry; `end` closes any open entries and their section
+            while stack and stack[-1][0] == 'edit':
+                if entry is not None and len(stack) == entry[4]:
+                    yield vdom, entry[0], entry[1], entry[2]
+                    entry = None
+                stack.pop()
+                if keyword == 'next':
+                    break
+            if keyword == 'end' and stack:
+                stack.pop()
+        elif keyword == 'set':
+            if entry is not None and len(stack) == entry[4]:
+                key, _, value = rest.partition(' ')
+                if entry[3] is None or key in entry[3]:
+                    entry[2][key] = config_tokens(value)
+            elif stack[-1:] == [('config', 'system global')] and rest.startswith('hostname '):
+                meta.setdefault('hostname', first_value({'hostname': config_tokens(rest[9:])}, 'hostname'))
+
+# Map one policy's settings onto the template policy schema used by save_template.
+# Addresses, VIPs and groups share srcaddr/dstaddr in FortiOS and are told apart by the
+# object tables of the policy's VDOM. Services in KNOWN_SERVICES stay template services;
+# other custom services of the VDOM become custom entries with their protocol and port
+# when they cover a single protocol, and are referenced by name otherwise.
+def first_value(settings, key, default=''):
+    return (settings.get(key) or [default])[0]
+
+def policy_from_config(settings, vdom_objects):
+    def values(key):
+        return settings.get(key, [])
+
+    def first(key, default=''):
+        return first_value(settings, key, default)
+
+    address_groups = vdom_objects.get('address_groups', set())
+    vips = vdom_objects.get('vips', set())
+    service_groups = vdom_objects.get('service_groups', set())
+    custom_services = vdom_objects.get('custom_services', {})
+
+    def service(name):
+        if name in service_groups:
+            return {'type': 'group', 'name': name}
+        if name not in KNOWN_SERVICES and name in custom_services:
+            svc = catalog_service(name, custom_services[name])
+            if svc['protocol'] in KNOWN_SERVICE_PROTOCOLS:
+                return {'type': 'custom', 'name': name, 'protocol': svc['protocol'], 'port': svc['port']}
+        return {'type': 'template', 'name': name}
+
+    def split_addresses(names):
+        return ([name for name in names if name not in address_groups and name not in vips],
+                [name for name in names if name in address_groups],
+                [name for name in names if name in vips])
+
+    src_addresses, src_address_groups, src_vips = split_addresses(values('srcaddr'))
+    dst_addresses, dst_address_groups, dst_vips = split_addresses(values('dstaddr'))
+    action = first('action', 'deny')
+    policy = {
+        'policy_name': first('name'),
+        'policy_comment': first('comments'),
+        'src_interfaces': values('srcintf'),
+        'dst_interfaces': values('dstintf'),
+        'src_addresses': src_addresses,
+        'src_address_groups': src_address_groups,
+        'src_internet_services': values('internet-service-src-name') or values('internet-service-src-id'),
+        'src_vips': src_vips,
+        'dst_addresses': dst_addresses,
+        'dst_address_groups': dst_address_groups,
+        'dst_internet_services': values('internet-service-name') or values('internet-service-id'),
+        'dst_vips': dst_vips,
+        'services': [service(name) for name in values('service')],
+        'action': action,
+        'inspection_mode': first('inspection-mode', 'flow'),
+        'ssl_ssh_profile': first('ssl-ssh-profile'),
+        'logtraffic': first('logtraffic', 'utm'),
+        'logtraffic_start': first('logtraffic-start', 'disable'),
+        'auto_asic_offload': first('auto-asic-offload', 'enable'),
+        'nat': first('nat', 'disable'),
+        'ip_pool': first('poolname'),
+        'users': values('users'),
+        'groups': values('groups')
+    }
+    for field, enabled, key in (('webfilter_profile', 'webfilter_enabled', 'webfilter-profile'),
+                                ('av_profile', 'av_enabled', 'av-profile'),
+                                ('application_list', 'application_list_enabled', 'application-list'),
+                                ('ips_sensor', 'ips_sensor_enabled', 'ips-sensor')):
+        policy[field] = first(key)
+        policy[enabled] = bool(policy[field])
+    return normalize_imported_policy(policy)
+
+# Import every firewall policy of an uploaded backup into templates named
+# {prefix}-{vdom}-NNN, POLICY_IMPORT_CHUNK policies each in rule order. The templates
+# are written together in one transaction, so a failed import leaves none of them behind.
+@app.route('/import_policies', methods=['POST'])
+def import_policies():
+    logger.debug("Received request to import firewall policies")
     if 'config_file' not in request.files:
         logger.error("No file loaded")
         return jsonify({"error": "No file uploaded"}), 400
+    on_conflict = request.form.get('on_conflict', 'replace')
+    if on_conflict not in ('replace', 'skip'):
+        return jsonify({"error": "on_conflict must be 'replace' or 'skip'"}), 400
+    include_disabled = request.form.get('include_disabled', '').lower() in ('1', 'true', 'yes')
+    try:
+        chunk_size = min(max(int(request.form.get('policies_per_template', app.config['POLICY_IMPORT_CHUNK'])), 1), 10000)
+    except ValueError:
+        return jsonify({"error": "policies_per_template must be an integer"}), 400
 
     file = request.files['config_file']
-    temp_dir = tempfile.gettempdir()
-    temp_path = os.path.join(temp_dir, file.filename)
-    file.save(temp_path)
+    explicit_prefix = request.form.get('template_prefix', '').strip()
+    started = time.perf_counter()
+    objects = {}
+    meta = {}
+    templates = []
+    prepared = []
+    chunk = {'vdom': None, 'policies': [], 'number': 0}
+    counts = {'policies': 0, 'disabled_skipped': 0}
 
-    with open(temp_path, 'r', encoding='utf-8') as f:
-        content = f.read()
+    def flush():
+        if not chunk['policies']:
+            return
+        prefix = explicit_prefix or meta.get('hostname') or os.path.splitext(file.filename or '')[0] or 'imported'
+        chunk['number'] += 1
+        name = f"{prefix}-{chunk['vdom']}-{chunk['number']:03d}"
+        prepared.append((name, {'policies': chunk['policies']}))
+        templates.append({"name": name, "vdom": chunk['vdom'], "policies": len(chunk['policies'])})
+        chunk['policies'] = []
 
+    lines = io.TextIOWrapper(file.stream, encoding='utf-8', errors='replace')
+    for vdom, section, policy_id, settings in iter_config_entries(lines, POLICY_IMPORT_SECTIONS, meta):
+        if section == 'firewall service custom':
+            objects.setdefault(vdom, {}).setdefault('custom_services', {})[policy_id] = settings
+            continue
+        if section != 'firewall policy':
+            objects.setdefault(vdom, {}).setdefault(POLICY_OBJECT_SECTIONS[section], set()).add(policy_id)
+            continue
+        if first_value(settings, 'status') == 'disable' and not include_disabled:
+            counts['disabled_skipped'] += 1
+            continue
+        if vdom != chunk['vdom']:
+            flush()
+            chunk.update(vdom=vdom, number=0)
+        try:
+            chunk['policies'].append(policy_from_config(settings, objects.get(vdom, {})))
+        except ValueError as e:
+            logger.warning("Skipping policy %s in VDOM '%s': %s", policy_id, vdom, e)
+            continue
+        counts['policies'] += 1
+        if len(chunk['policies']) >= chunk_size:
+            flush()
+    flush()
+
+    if not counts['policies']:
+        logger.error("No firewall policies found in uploaded config")
+        return jsonify({"error": "No firewall policies found", **counts}), 400
     try:
-        os.remove(temp_path)
-        logger.debug(f"Temporary config file {temp_path} deleted")
-    except Exception as e:
-        logger.warning(f"Failed to delete temp file {temp_path}: {e}")
-    logger.debug("Config file content length: %d bytes", len(content))
+        written = bulk_save_templates(prepared, replace=on_conflict == 'replace')
+    except sqlite3.Error as e:
+        logger.error("Failed to save imported policies: %s", e)
+        return jsonify({"error": "Failed to save imported policies"}), 500
+    for template in templates:
+        template['status'] = written[template['name']]
+    took_ms = round(1000 * (time.perf_counter() - started), 2)
+    logger.info("Imported %d firewall policies into %d templates in %.0f ms", counts['policies'], len(templates), took_ms)
+    return jsonify({"status": "success", **counts, "templates": templates, "took_ms": took_ms})
+
+# (vdom, section, name, settings) for the entries of the given top-level tables of a
+# backup, `sections` mapping each table to the settings to keep as in iter_config_entries.
+# Each table is cut out of the backup whole (it ends at the `end` indented like its
+# `config` line) and fed through the streaming entry reader, so the rest is never
+# tokenized. A table belongs to the scope last opened before it by `config vdom` + `edit`
+# or by `config global` ('global'), and to 'root' in backups without VDOMs.
+_CONFIG_SCOPE = re.compile(r'^config (?:vdom[ \t]*\n[ \t]*edit[ \t]+(.+?)|(global))[ \t]*$', re.MULTILINE)
+
+def iter_config_tables(content, sections):
+    scope_starts = []
+    scopes = []
+    for match in _CONFIG_SCOPE.finditer(content):
+        scope_starts.append(match.start())
+        scopes.append(match.group(2) or first_value({'edit': config_tokens(match.group(1))}, 'edit'))
+    pattern = re.compile(r'^([ \t]*)config (' + '|'.join(re.escape(section) for section in sections) +
+                         r')[ \t]*\n(.*?)^\1end[ \t]*$', re.MULTILINE | re.DOTALL)
+    for match in pattern.finditer(content):
+        i = bisect.bisect_right(scope_starts, match.start()) - 1
+        vdom = scopes[i] if i >= 0 else 'root'
+        lines = itertools.chain((f'config {match.group(2)}',), match.group(3).splitlines(), ('end',))
+        for _, section, name, settings in iter_config_entries(lines, sections, {}):
+            yield vdom, section, name, settings
+
+# Group membership of a backup: {'address_group_members': {group: [members]},
+# 'service_groups': {group: [members]}}
+GROUP_MEMBER_SECTIONS = {'firewall addrgrp': 'address_group_members', 'firewall service group': 'service_groups'}
+
+def extract_group_members(content):
+    members = {key: {} for key in GROUP_MEMBER_SECTIONS.values()}
+    sections = {section: ('member',) for section in GROUP_MEMBER_SECTIONS}
+    for _, section, name, settings in iter_config_tables(content, sections):
+        members[GROUP_MEMBER_SECTIONS[section]][name] = settings.get('member', [])
+    return members
+
+# Transitive closure of nested groups over {group: [members]}: expand(name) is the set
+# of non-group names a group contains at any depth. Closures are computed on first use
+# with an iterative Tarjan pass over the groups reachable from the name, so every group
+# of a cycle shares one closure and deep nesting cannot hit the recursion limit; each
+# closure is then kept, making later lookups a dict hit. Groups that are part of a
+# cycle are collected in `cyclic`.
+class GroupExpander:
+    def __init__(self, members):
+        self.members = members
+        self.cyclic = set()
+        self._closures = {}
+        self._lock = threading.Lock()
+
+    def is_group(self, name):
+        return name in self.members
+
+    def expand(self, name):
+        closure = self._closures.get(name)
+        if closure is None:
+            if name not in self.members:
+                return frozenset((name,))
+            with self._lock:
+                if name not in self._closures:
+                    self._compute(name)
+            closure = self._closures[name]
+        return closure
+
+    def _compute(self, root):
+        members, closures = self.members, self._closures
+        index = {root: 0}
+        low = {root: 0}
+        stack = [root]
+        on_stack = {root}
+        work = [(root, iter(members[root]))]
+        while work:
+            group, children = work[-1]
+            for child in children:
+                if child not in members or child in closures:
+                    continue
+                if child not in index:
+                    index[child] = low[child] = len(index)
+                    stack.append(child)
+                    on_stack.add(child)
+                    work.append((child, iter(members[child])))
+                    break
+                if child in on_stack:
+                    low[group] = min(low[group], index[child])
+            else:
+                work.pop()
+                if work:
+                    parent = work[-1][0]
+                    low[parent] = min(low[parent], low[group])
+                if low[group] != index[group]:
+                    continue
+                # `group` roots a strongly connected component; everything it reaches
+                # outside the component already has its closure
+                component = set()
+                while True:
+                    node = stack.pop()
+                    on_stack.discard(node)
+                    component.add(node)
+                    if node == group:
+                        break
+                leaves = set()
+                for node in component:
+                    for member in members[node]:
+                        if member not in members:
+                            leaves.add(member)
+                        elif member not in component:
+                            leaves.update(closures[member])
+                closure = frozenset(leaves)
+                for node in component:
+                    closures[node] = closure
+                if len(component) > 1 or group in members[group]:
+                    self.cyclic.update(component)
+
+# Structures derived from a device's parsed config (or the most recent import's), rebuilt
+# when that config changes. Two kinds per device, for as many devices as the config snapshots.
+_device_derived = OrderedDict()
+
+def get_device_derived(device, kind, build):
+    version_key = f'device:{device}' if device else 'last_config'
+    version = _current_state_versions().get(version_key, 0)
+    with _snapshot_lock:
+        cached = _device_derived.get((version_key, kind))
+        if cached and cached[0] == version:
+            _device_derived.move_to_end((version_key, kind))
+            return cached[1]
+    config = resolve_device_config(device)
+    if config is None:
+        return None
+    value = build(config)
+    with _snapshot_lock:
+        _device_derived[(version_key, kind)] = (version, value)
+        _device_derived.move_to_end((version_key, kind))
+        while len(_device_derived) > 2 * app.config['DEVICE_CACHE_SIZE']:
+            _device_derived.popitem(last=False)
+    return value
+
+def get_group_expanders(device=None):
+    return get_device_derived(device, 'group_expanders', lambda config: {
+        'address': GroupExpander(config.get('address_group_members', {})),
+        'service': GroupExpander(config.get('service_groups', {}))
+    })
+
+# Everything an address or service group contains, nested groups resolved
+@app.route('/expand_group', methods=['GET'])
+def expand_group():
+    name = request.args.get('name', '')
+    kind = request.args.get('kind', 'address')
+    device = request.args.get('device') or None
+    if not name:
+        return jsonify({"error": "name is required"}), 400
+    if kind not in ('address', 'service'):
+        return jsonify({"error": "kind must be 'address' or 'service'"}), 400
+    etag = f"groups-{catalog_version_tag(device)}"
+    if not_modified(etag):
+        return not_modified_response(etag)
+    expanders = get_group_expanders(device)
+    if expanders is None:
+        logger.error("No parsed config for device '%s'", device)
+        return jsonify({"error": "Device not found"}), 404
+    expander = expanders[kind]
+    if not expander.is_group(name):
+        return jsonify({"error": f"No {kind} group named '{name}'"}), 404
+    members = expander.expand(name)
+    return with_validators(jsonify({
+        "status": "success",
+        "name": name,
+        "kind": kind,
+        "members": sorted(members),
+        "count": len(members),
+        "cyclic": name in expander.cyclic
+    }), etag)
+
+# Shadowed and redundant rule analysis. Each policy is reduced to what it matches:
+# interface sets (None for "any"), IPv4 source and destination addresses as merged
+# integer intervals and services as (protocol, port intervals) pairs, with protocol 0
+# standing for every protocol. A rule whose match is fully contained in that of one
+# earlier rule never sees traffic: it is shadowed when the earlier rule takes the other
+# action and redundant when it takes the same one. Coverage by a union of several
+# earlier rules is not detected.
+#
+# Policies match conservatively. `src`, `dst` and `services` are what a rule may match,
+# None when some of it cannot be resolved from the backup (FQDN and geography
+# addresses, internet services, IPv6 addresses, exclusion groups, negation); `cover`
+# is what it certainly matches, or None when it is restricted in ways the analysis does
+# not model (users, schedules) and so must not be taken to shadow anything.
+PolicyRule = namedtuple('PolicyRule', 'position policyid name action srcintf dstintf src dst services cover')
+
+IPV4_MAX = 2 ** 32 - 1
+PORT_RANGE = (0, 65535)
+ICMP_TYPES = (0, 255)
+SERVICE_PORT_PROTOCOLS = {'tcp-portrange': 6, 'udp-portrange': 17, 'sctp-portrange': 132}
+KNOWN_SERVICE_PROTOCOLS = {'TCP': 6, 'UDP': 17, 'SCTP': 132, 'ICMP': 1, 'ICMP6': 58}
+BUILTIN_ADDRESS_RANGES = {'all': (((0, IPV4_MAX),), True), 'none': ((), True)}
+BUILTIN_SERVICE_RANGES = {'ALL': (((0, (PORT_RANGE,)),), True)}
+POLICY_ANALYSIS_SECTIONS = {
+    'firewall address': ('type', 'subnet', 'start-ip', 'end-ip'),
+    'firewall addrgrp': ('member', 'exclude'),
+    'firewall vip': ('extip', 'portforward'),
+    'firewall vipgrp': ('member',),
+    'firewall service custom': SERVICE_DEFINITION_KEYS,
+    'firewall service group': ('member',),
+    'firewall policy': ('name', 'status', 'action', 'schedule', 'srcintf', 'dstintf', 'srcaddr', 'dstaddr', 'service',
+                        'srcaddr6', 'dstaddr6', 'srcaddr-negate', 'dstaddr-negate', 'service-negate',
+                        'internet-service', 'internet-service-src', 'users', 'groups', 'fsso-groups')
+}
+ADDRESS_GROUP_SECTIONS = ('firewall addrgrp', 'firewall vipgrp')
+
+def merge_intervals(intervals):
+    merged = []
+    for lo, hi in sorted(intervals):
+        if merged and lo <= merged[-1][1] + 1:
+            if hi > merged[-1][1]:
+                merged[-1] = (merged[-1][0], hi)
+        else:
+            merged.append((lo, hi))
+    return tuple(merged)
+
+def merge_addresses(interval_lists):
+    if len(interval_lists) == 1:
+        return interval_lists[0]
+    return merge_intervals(iv for intervals in interval_lists for iv in intervals)
+
+# Both sides merged and sorted, so every inner interval must sit inside one outer interval
+def intervals_cover(outer, inner):
+    i = 0
+    for lo, hi in inner:
+        while i < len(outer) and outer[i][1] < lo:
+            i += 1
+        if i == len(outer) or outer[i][0] > lo or outer[i][1] < hi:
+            return False
+    return True
+
+def merge_services(service_lists):
+    if len(service_lists) == 1:
+        return service_lists[0]
+    by_protocol = {}
+    for services in service_lists:
+        for protocol, ports in services:
+            by_protocol.setdefault(protocol, []).extend(ports)
+    if 0 in by_protocol:
+        return ((0, (PORT_RANGE,)),)
+    return tuple((protocol, merge_intervals(ports)) for protocol, ports in sorted(by_protocol.items()))
+
+def services_cover(outer, inner):
+    outer_ports = dict(outer)
+    if 0 in outer_ports:
+        return True
+    return all(protocol in outer_ports and intervals_cover(outer_ports[protocol], ports) for protocol, ports in inner)
+
+# Dotted quads to integers; ipaddress is several times slower for the 100k addresses of a big backup
+def ipv4_value(text):
+    octets = text.split('.')
+    if len(octets) != 4:
+        raise ValueError(f"Invalid IPv4 address: {text}")
+    value = 0
+    for octet in octets:
+        number = int(octet)
+        if not 0 <= number <= 255:
+            raise ValueError(f"Invalid IPv4 address: {text}")
+        value = value << 8 | number
+    return value
+
+def ipv4_subnet_range(tokens):
+    address, _, prefix = tokens[0].partition('/')
+    if prefix:
+        mask = IPV4_MAX ^ (IPV4_MAX >> int(prefix)) if 0 <= int(prefix) <= 32 else None
+    else:
+        mask = ipv4_value(tokens[1]) if len(tokens) > 1 else None
+    if mask is None:
+        raise ValueError(f"Invalid subnet: {' '.join(tokens)}")
+    network = ipv4_value(address) & mask
+    return network, network | (IPV4_MAX ^ mask)
+
+# Port ranges as FortiOS writes them: "80", "8000-8080" or "53:1024-65535" with the
+# source ports after the colon. Returns (intervals, whether any source ports are limited).
+def parse_port_ranges(specs):
+    intervals = []
+    source_limited = False
+    for spec in specs:
+        dst, _, src = spec.partition(':')
+        lo, _, hi = dst.partition('-')
+        lo, hi = int(lo), int(hi or lo)
+        intervals.append((min(lo, hi), max(lo, hi)))
+        source_limited = source_limited or src not in ('', '0-65535', '1-65535')
+    return merge_intervals(intervals), source_limited
+
+# (services, exact) for a protocol/port pair as held by KNOWN_SERVICES and custom template services
+def service_from_port_spec(protocol, port):
+    protocol = (protocol or '').upper()
+    number = KNOWN_SERVICE_PROTOCOLS.get(protocol)
+    if number is None:
+        return None
+    if number in (1, 58):
+        return ((number, (ICMP_TYPES,)),), True
+    try:
+        ports, _ = parse_port_ranges(str(port).split())
+    except ValueError:
+        return None
+    return (((number, ports),), True) if ports else None
+
+def service_from_config(settings):
+    protocol = first_value(settings, 'protocol', 'TCP/UDP/SCTP').upper()
+    # A service limited to destination addresses matches less than its ports suggest
+    exact = first_value(settings, 'iprange', '0.0.0.0') == '0.0.0.0' and not first_value(settings, 'fqdn')
+    if protocol.startswith('TCP/UDP'):
+        services = []
+        for key, number in SERVICE_PORT_PROTOCOLS.items():
+            if settings.get(key):
+                ports, source_limited = parse_port_ranges(settings[key])
+                services.append((number, ports))
+                exact = exact and not source_limited
+        return (tuple(services), exact) if services else None
+    if protocol in ('ICMP', 'ICMP6'):
+        icmptype = first_value(settings, 'icmptype')
+        types = (int(icmptype), int(icmptype)) if icmptype else ICMP_TYPES
+        return ((KNOWN_SERVICE_PROTOCOLS[protocol], (types,)),), exact
+    if protocol == 'IP':
+        return ((int(first_value(settings, 'protocol-number', '0')), (PORT_RANGE,)),), exact
+    if protocol == 'ALL':
+        return ((0, (PORT_RANGE,)),), exact
+    return None
+
+def service_ranges_document(service):
+    return [[number, [list(iv) for iv in ports]] for number, ports in service[0]] if service else []
+
+# A custom service for the catalog: the protocol and port strings shown so far, plus its
+# complete definition as [[protocol number, [[low, high], ...]], ...] (protocol 0: any)
+# and whether that definition is exact (no source port or destination restrictions).
+# `vdom` is the VDOM defining it; None for predefined services, which every VDOM has.
+def catalog_service(name, settings, vdom=None):
+    protocol = first_value(settings, 'protocol', 'TCP/UDP/SCTP').upper()
+    try:
+        service = service_from_config(settings)
+    except ValueError:
+        service = None
+    if protocol.startswith('TCP/UDP'):
+        keys = [key for key in SERVICE_PORT_PROTOCOLS if settings.get(key)]
+        if len(keys) == 1:
+            protocol = keys[0].split('-')[0].upper()
+        port = ' '.join(spec for key in keys for spec in settings[key]) or '0'
+    elif protocol in ('ICMP', 'ICMP6'):
+        port = first_value(settings, 'icmptype', '0')
+    elif protocol == 'IP':
+        port = first_value(settings, 'protocol-number', '0')
+    else:
+        port = '0'
+    return {"name": name, "protocol": protocol, "port": port, "ranges": service_ranges_document(service),
+            "exact": bool(service and service[1]), "vdom": vdom}
+
+def address_from_config(section, settings):
+    if section == 'firewall vip':
+        extip = first_value(settings, 'extip')
+        if not extip:
+            return None
+        start, _, end = extip.partition('-')
+        # Port forwarding VIPs only take their external port
+        return ((ipv4_value(start), ipv4_value(end or start)),), first_value(settings, 'portforward') != 'enable'
+    kind = first_value(settings, 'type', 'ipmask')
+    if kind in ('ipmask', 'interface-subnet'):
+        return (ipv4_subnet_range(settings.get('subnet') or ['0.0.0.0', '0.0.0.0']),), True
+    if kind == 'iprange':
+        start, end = ipv4_value(first_value(settings, 'start-ip')), ipv4_value(first_value(settings, 'end-ip'))
+        return ((min(start, end), max(start, end)),), True
+    return None
+
+# Address and service definitions of one VDOM, resolved on first use to
+# (intervals or services, exact) or None. Groups resolve through the leaves their
+# GroupExpander gives; exclusion groups and groups that contain themselves resolve to None.
+class RulebaseObjects:
+    def __init__(self):
+        self.definitions = {'address': {}, 'service': {}}
+        self.groups = {'address': {}, 'service': {}}
+        self.resolved = {'address': {}, 'service': {}}
+        self._expanders = {}
+
+    def add(self, section, name, settings):
+        kind = 'service' if section.startswith('firewall service') else 'address'
+        self.definitions[kind][name] = (section, settings)
+        if (section in ADDRESS_GROUP_SECTIONS or section == 'firewall service group') and \
+                first_value(settings, 'exclude') != 'enable':
+            self.groups[kind][name] = settings.get('member', [])
+            self._expanders.pop(kind, None)
+
+    def address(self, name):
+        return self._resolve('address', name)
+
+    def service(self, name):
+        return self._resolve('service', name)
+
+    def expander(self, kind):
+        if kind not in self._expanders:
+            self._expanders[kind] = GroupExpander(self.groups[kind])
+        return self._expanders[kind]
+
+    def _resolve(self, kind, name):
+        resolved = self.resolved[kind]
+        if name in resolved:
+            return resolved[name]
+        definition = self.definitions[kind].get(name)
+        if definition is None:
+            if kind == 'address':
+                return BUILTIN_ADDRESS_RANGES.get(name)
+            known = KNOWN_SERVICES.get(name)
+            return BUILTIN_SERVICE_RANGES.get(name) or (service_from_port_spec(**known) if known else None)
+        section, settings = definition
+        if name in self.groups[kind]:
+            expander = self.expander(kind)
+            leaves = [self._resolve(kind, leaf) for leaf in expander.expand(name)]
+            if not leaves or None in leaves or name in expander.cyclic:
+                value = None
+            else:
+                merge = merge_services if kind == 'service' else merge_addresses
+                value = merge([leaf[0] for leaf in leaves]), all(leaf[1] for leaf in leaves)
+        elif section in ADDRESS_GROUP_SECTIONS:
+            value = None
+        else:
+            try:
+                value = service_from_config(settings) if kind == 'service' else address_from_config(section, settings)
+            except ValueError:
+                value = None
+        resolved[name] = value
+        return value
+
+    # Every defined name with its resolution, for storage next to the rules
+    def resolved_table(self, kind):
+        return {name: self._resolve(kind, name) for name in self.definitions[kind]}
+
+def _item_bounds(items, merge):
+    known = [item for item in items if item is not None]
+    if items and len(known) == len(items) and all(exact for _, exact in known):
+        merged = merge([value for value, _ in known])
+        return merged, merged
+    certain = merge([value for value, exact in known if exact])
+    possible = merge([value for value, _ in known]) if items and len(known) == len(items) else None
+    return possible, certain
+
+def _interface_set(names):
+    return None if 'any' in names else frozenset(names)
+
+def build_policy_rule(position, policyid, name, action, srcintf, dstintf, src_items, dst_items, service_items,
+                      restricted=False):
+    src, src_certain = _item_bounds(src_items, merge_addresses)
+    dst, dst_certain = _item_bounds(dst_items, merge_addresses)
+    services, services_certain = _item_bounds(service_items, merge_services)
+    if not srcintf or not dstintf:
+        return PolicyRule(position, policyid, name, action, None, None, None, None, None, None)
+    cover = None
+    if not restricted and src_certain and dst_certain and services_certain:
+        cover = (src_certain, dst_certain, services_certain)
+    return PolicyRule(position, policyid, name, action, _interface_set(srcintf), _interface_set(dstintf),
+                      src, dst, services, cover)
+
+def rule_from_config(position, policyid, settings, objects):
+    if 'enable' in (first_value(settings, 'srcaddr-negate'), first_value(settings, 'dstaddr-negate'),
+                    first_value(settings, 'service-negate')):
+        return PolicyRule(position, policyid, first_value(settings, 'name'), first_value(settings, 'action', 'deny'),
+                          None, None, None, None, None, None)
+    src_items = [objects.address(name) for name in settings.get('srcaddr', ())]
+    dst_items = [objects.address(name) for name in settings.get('dstaddr', ())]
+    # Unknown parts: they widen what the rule may match but add nothing it certainly matches
+    if first_value(settings, 'internet-service-src') == 'enable' or settings.get('srcaddr6'):
+        src_items.append(None)
+    if first_value(settings, 'internet-service') == 'enable' or settings.get('dstaddr6'):
+        dst_items.append(None)
+    restricted = bool(settings.get('users') or settings.get('groups') or settings.get('fsso-groups')) or \
+        first_value(settings, 'schedule', 'always') != 'always'
+    return build_policy_rule(position, policyid, first_value(settings, 'name'), first_value(settings, 'action', 'deny'),
+                             settings.get('srcintf', []), settings.get('dstintf', []), src_items, dst_items,
+                             [objects.service(name) for name in settings.get('service', ())], restricted)
+
+# A template policy as generate_policy would emit it, against a stored VDOM rulebase
+def rule_from_template_policy(policy, position, rulebase):
+    def addresses(side):
+        names = policy.get(f'{side}_addresses', []) + policy.get(f'{side}_address_groups', []) + policy.get(f'{side}_vips', [])
+        items = [rulebase['addresses'].get(name, BUILTIN_ADDRESS_RANGES.get(name)) for name in names if name]
+        return items + [None] if policy.get(f'{side}_internet_services') else items
+
+    def service(svc):
+        if svc.get('type') == 'custom':
+            return service_from_port_spec(svc.get('protocol'), svc.get('port'))
+        name = svc.get('name', '')
+        if name in rulebase['services']:
+            return rulebase['services'][name]
+        known = KNOWN_SERVICES.get(name)
+        return BUILTIN_SERVICE_RANGES.get(name) or (service_from_port_spec(**known) if known else None)
+
+    return build_policy_rule(position, None, policy.get('policy_name', ''), policy.get('action', 'accept'),
+                             [name for name in policy.get('src_interfaces', []) if name],
+                             [name for name in policy.get('dst_interfaces', []) if name],
+                             addresses('src'), addresses('dst'), [service(svc) for svc in policy.get('services', [])])
+
+def rule_covers(outer, inner):
+    src, dst, services = outer.cover
+    return ((outer.srcintf is None or (inner.srcintf is not None and inner.srcintf <= outer.srcintf))
+            and (outer.dstintf is None or (inner.dstintf is not None and inner.dstintf <= outer.dstintf))
+            and intervals_cover(src, inner.src) and intervals_cover(dst, inner.dst)
+            and services_cover(services, inner.services))
+
+# Offline interval stabbing: for each probe (lo, hi, key), the values of the entries
+# (lo, hi, value) that contain it. Entries and probes are both swept in order of their
+# start; entries enter a list kept sorted by their end once they start at or before the
+# probe and leave it once they end before it, so each probe takes the tail of entries
+# ending at or after its end rather than scanning every entry overlapping its start.
+def stab_intervals(entries, probes):
+    entries = sorted(entries)
+    active = []
+    hits = {}
+    position = 0
+    for lo, hi, key in sorted(probes):
+        while position < len(entries) and entries[position][0] <= lo:
+            bisect.insort(active, (entries[position][1], entries[position][2]))
+            position += 1
+        del active[:bisect.bisect_left(active, (lo,))]
+        hits[key] = {value for end, value in active[bisect.bisect_left(active, (hi,)):]}
+    return hits
+
+# For each query rule, the earliest rule of `rules` before it (by position) whose
+# certain match covers the query's possible match, or None. Candidates are the rules
+# with one address interval containing the widest source interval of the query and
+# one containing its widest destination interval; rules matching every address
+# ("all") are kept out of the sweep and joined in by set lookups.
+def find_covering_rules(rules, queries):
+    full = ((0, IPV4_MAX),)
+    covering_rules = [rule for rule in rules if rule.cover]
+    any_src = {rule.position for rule in covering_rules if rule.cover[0] == full}
+    any_dst = {rule.position for rule in covering_rules if rule.cover[1] == full}
+    any_both = sorted(any_src & any_dst)
+    by_position = {rule.position: rule for rule in covering_rules}
+
+    def widest(intervals):
+        return max(intervals, key=lambda iv: iv[1] - iv[0])
+
+    checked = [(i, query) for i, query in enumerate(queries) if query.src and query.dst and query.services]
+    src_hits = stab_intervals(
+        [(lo, hi, rule.position) for rule in covering_rules if rule.position not in any_src for lo, hi in rule.cover[0]],
+        [widest(query.src) + (i,) for i, query in checked])
+    dst_hits = stab_intervals(
+        [(lo, hi, rule.position) for rule in covering_rules if rule.position not in any_dst for lo, hi in rule.cover[1]],
+        [widest(query.dst) + (i,) for i, query in checked])
+
+    results = [None] * len(queries)
+    for i, query in checked:
+        src_candidates, dst_candidates = src_hits[i], dst_hits[i]
+        candidates = {p for p in src_candidates if p in dst_candidates or p in any_dst}
+        candidates.update(p for p in dst_candidates if p in any_src)
+        earlier = sorted(p for p in candidates if p < query.position)
+        for position in heapq.merge(earlier, any_both[:bisect.bisect_left(any_both, query.position)]):
+            if rule_covers(by_position[position], query):
+                results[i] = by_position[position]
+                break
+    return results
+
+def _rule_summary(rule):
+    return {"policyid": rule.policyid, "name": rule.name, "action": rule.action}
+
+# Shadowed and redundant policies of one VDOM's rulebase, in rule order
+def analyze_rulebase(rules):
+    report = {'policies': len(rules), 'unresolved': 0, 'shadowed': [], 'redundant': []}
+    for rule, covering in zip(rules, find_covering_rules(rules, rules)):
+        if not (rule.src and rule.dst and rule.services):
+            report['unresolved'] += 1
+        elif covering is not None:
+            kind = 'redundant' if covering.action == rule.action else 'shadowed'
+            report[kind].append({**_rule_summary(rule), "position": rule.position + 1, "by": _rule_summary(covering)})
+    return report
+
+def _intervals_from_document(value):
+    return tuple(tuple(iv) for iv in value) if value is not None else None
+
+def _services_from_document(value):
+    return tuple((protocol, _intervals_from_document(ports)) for protocol, ports in value) if value is not None else None
+
+def _rule_document(rule):
+    return [rule.position, rule.policyid, rule.name, rule.action,
+            sorted(rule.srcintf) if rule.srcintf is not None else None,
+            sorted(rule.dstintf) if rule.dstintf is not None else None,
+            rule.src, rule.dst, rule.services, rule.cover]
+
+def _rule_from_document(values):
+    position, policyid, name, action, srcintf, dstintf, src, dst, services, cover = values
+    if cover is not None:
+        cover = (_intervals_from_document(cover[0]), _intervals_from_document(cover[1]), _services_from_document(cover[2]))
+    return PolicyRule(position, policyid, name, action,
+                      frozenset(srcintf) if srcintf is not None else None,
+                      frozenset(dstintf) if dstintf is not None else None,
+                      _intervals_from_document(src), _intervals_from_document(dst), _services_from_document(services), cover)
+
+@timed_query
+def save_policy_analysis(device, rulebase, report):
+    conn = sqlite3.connect(app.config['DB_PATH'])
+    cursor = conn.cursor()
+    cursor.execute('''
+        INSERT INTO policy_analyses (device, rulebase, report, created_at) VALUES (?, ?, ?, ?)
+        ON CONFLICT(device) DO UPDATE SET rulebase = excluded.rulebase, report = excluded.report,
+            created_at = excluded.created_at
+    ''', (device, encode_document(rulebase), encode_document(report), report['analyzed_at']))
+    bump_state_version(cursor, f'rulebase:{device}')
+    conn.commit()
+    conn.close()
+    invalidate_state_versions()
+
+@timed_query
+def load_policy_analysis(device, column):
+    conn = sqlite3.connect(app.config['DB_PATH'])
+    cursor = conn.cursor()
+    cursor.execute(f'SELECT {column} FROM policy_analyses WHERE device = ?', (device,))
+    row = cursor.fetchone()
+    conn.close()
+    return decode_document(row[0]) if row else None
+
+def load_rulebase(device):
+    stored = load_policy_analysis(device, 'rulebase')
+    if stored is None:
+        return None
+    vdoms = {}
+    for vdom, data in stored['vdoms'].items():
+        vdoms[vdom] = {
+            'rules': [_rule_from_document(values) for values in data['rules']],
+            'addresses': {name: (_intervals_from_document(value[0]), value[1]) if value is not None else None
+                          for name, value in data['addresses'].items()},
+            'services': {name: (_services_from_document(value[0]), value[1]) if value is not None else None
+                         for name, value in data['services'].items()}
+        }
+    return {'analyzed_at': stored['analyzed_at'], 'vdoms': vdoms}
+
+def get_rulebase_snapshot(device):
+    return get_snapshot(f'rulebase:{device}', lambda: load_rulebase(device))
+
+# Whether each template policy, appended to the end of the device's stored rulebase as
+# generate_policy's `edit 0` does, would be shadowed by (or redundant with) an existing rule
+def check_generated_policies(policies, rulebase, vdom):
+    data = rulebase['vdoms'][vdom]
+    rules = data['rules']
+    queries = [rule_from_template_policy(policy, len(rules), data) for policy in policies]
+    checks = []
+    for query, covering in zip(queries, find_covering_rules(rules, queries)):
+        if not (query.src and query.dst and query.services):
+            checks.append({"status": "unresolved"})
+        elif covering is None:
+            checks.append({"status": "clear"})
+        else:
+            checks.append({"status": "redundant" if covering.action == query.action else "shadowed",
+                           "by": _rule_summary(covering)})
+    return checks
+
+# Analyze the rulebase of an uploaded backup for shadowed and redundant policies. The
+# backup is streamed once; objects precede the policies that use them, so every policy
+# is reduced to its intervals as it is read. The rulebase is stored for the device so
+# generate_policy can check new policies against it.
+@app.route('/analyze_policies', methods=['POST'])
+def analyze_policies():
+    logger.debug("Received request to analyze firewall policies")
+    if 'config_file' not in request.files:
+        logger.error("No file loaded")
+        return jsonify({"error": "No file uploaded"}), 400
+    file = request.files['config_file']
+    started = time.perf_counter()
+    objects = {}
+    rules = {}
+    meta = {}
+    disabled = {}
+    lines = io.TextIOWrapper(file.stream, encoding='utf-8', errors='replace')
+    for vdom, section, name, settings in iter_config_entries(lines, POLICY_ANALYSIS_SECTIONS, meta):
+        vdom_objects = objects.setdefault(vdom, RulebaseObjects())
+        if section != 'firewall policy':
+            vdom_objects.add(section, name, settings)
+        elif first_value(settings, 'status') == 'disable':
+            disabled[vdom] = disabled.get(vdom, 0) + 1
+        else:
+            vdom_rules = rules.setdefault(vdom, [])
+            vdom_rules.append(rule_from_config(len(vdom_rules), name, settings, vdom_objects))
+    if not rules:
+        logger.error("No firewall policies found in uploaded config")
+        return jsonify({"error": "No firewall policies found"}), 400
+    parsed_ms = round(1000 * (time.perf_counter() - started), 2)
+
+    device = (request.form.get('device') or '').strip() or meta.get('hostname') or \
+        os.path.splitext(file.filename or '')[0] or 'default'
+    report = {
+        'device': device,
+        'analyzed_at': datetime.now(timezone.utc).isoformat(),
+        'vdoms': {vdom: {**analyze_rulebase(vdom_rules), 'disabled': disabled.get(vdom, 0)}
+                  for vdom, vdom_rules in rules.items()}
+    }
+    report['took_ms'] = round(1000 * (time.perf_counter() - started), 2)
+    report['parse_ms'] = parsed_ms
+    rulebase = {
+        'analyzed_at': report['analyzed_at'],
+        'vdoms': {vdom: {'rules': [_rule_document(rule) for rule in vdom_rules],
+                         'addresses': objects[vdom].resolved_table('address'),
+                         'services': objects[vdom].resolved_table('service')}
+                  for vdom, vdom_rules in rules.items()}
+    }
+    try:
+        save_policy_analysis(device, rulebase, report)
+    except sqlite3.Error as e:
+        logger.error("Failed to save policy analysis for device '%s': %s", device, e)
+        return jsonify({"error": "Failed to save policy analysis"}), 500
+    logger.info("Analyzed %d policies of device '%s': %d shadowed, %d redundant (%.0f ms)",
+                sum(len(vdom_rules) for vdom_rules in rules.values()), device,
+                sum(len(vdom['shadowed']) for vdom in report['vdoms'].values()),
+                sum(len(vdom['redundant']) for vdom in report['vdoms'].values()), report['took_ms'])
+    return jsonify({"status": "success", **report})
+
+@app.route('/policy_analysis/<device>', methods=['GET'])
+def policy_analysis(device):
+    report = load_policy_analysis(device, 'report')
+    if report is None:
+        logger.error("No policy analysis for device '%s'", device)
+        return jsonify({"error": "No policy analysis for this device"}), 404
+    return jsonify({"status": "success", **report})
+
+# Port interval index over a catalog's services. Per protocol, the port space is cut at
+# every range boundary into elementary segments, each holding the services that cover
+# all of it; a lookup is a bisect to the first segment plus an intersection over the
+# segments a port range spans. Services matching any protocol answer every lookup.
+# Groups are found through a reverse map of each group's expanded members.
+class ServicePortIndex:
+    def __init__(self, services, group_expander):
+        self.any_protocol = []
+        self.definitions = {}
+        intervals = {}
+        for svc in services:
+            ranges = tuple((number, tuple(tuple(iv) for iv in ports)) for number, ports in svc.get('ranges') or ())
+            for number, ports in ranges:
+                if number == 0:
+                    self.any_protocol.append(svc['name'])
+                else:
+                    intervals.setdefault(number, []).extend((lo, hi, svc['name']) for lo, hi in ports)
+            # Identical definitions resolve to the first service defined
+            if ranges and svc.get('exact'):
+                self.definitions.setdefault(ranges, svc['name'])
+        self.segments = {number: self._segments(entries) for number, entries in intervals.items()}
+        self.groups_of = {}
+        for group in group_expander.members:
+            for member in group_expander.expand(group):
+                self.groups_of.setdefault(member, set()).add(group)
+
+    @staticmethod
+    def _segments(entries):
+        events = sorted([(lo, 1, name) for lo, _, name in entries] + [(hi + 1, -1, name) for _, hi, name in entries])
+        starts = []
+        covering = []
+        active = {}
+        for i, (point, change, name) in enumerate(events):
+            active[name] = active.get(name, 0) + change
+            if not active[name]:
+                del active[name]
+            if i + 1 == len(events) or events[i + 1][0] != point:
+                starts.append(point)
+                covering.append(frozenset(active))
+        return starts, covering
+
+    # Services whose ports include all of lo-hi for the protocol number
+    def services_covering(self, number, lo, hi=None):
+        hi = lo if hi is None else hi
+        found = set()
+        if number in self.segments:
+            starts, covering = self.segments[number]
+            i = bisect.bisect_right(starts, lo) - 1
+            if i >= 0:
+                found = set(covering[i])
+                while found and i + 1 < len(starts) and starts[i + 1] <= hi:
+                    i += 1
+                    found &= covering[i]
+        return sorted(found) + self.any_protocol
+
+    def groups_containing(self, services):
+        return sorted(set().union(*(self.groups_of.get(name, ()) for name in services)))
+
+    # Name of an existing service defined exactly as (services, exact), e.g. from service_from_port_spec
+    def find_definition(self, service):
+        return self.definitions.get(service[0]) if service else None
+
+# Port index over the services usable in one VDOM: its own custom services plus the
+# predefined ones. Without a VDOM, every service of the catalog is indexed.
+def get_service_port_index(device=None, vdom=None):
+    return get_device_derived(device, f'service_port_index:{vdom or ""}', lambda config: ServicePortIndex(
+        [svc for svc in config.get('services', ()) if vdom is None or svc.get('vdom') in (None, vdom)],
+        get_group_expanders(device)['service']))
+
+SERVICE_PROTOCOL_NUMBERS = {'tcp': 6, 'udp': 17, 'sctp': 132, 'icmp': 1, 'icmp6': 58}
+
+# Which services and service groups of a device cover a port or port range, e.g.
+# /services_for_port?protocol=tcp&port=8443 or port=8000-8080; with `vdom`, only the services
+# usable in that VDOM
+@app.route('/services_for_port', methods=['GET'])
+def services_for_port():
+    protocol = request.args.get('protocol', 'tcp').lower()
+    device = request.args.get('device') or None
+    vdom = request.args.get('vdom') or None
+    number = SERVICE_PROTOCOL_NUMBERS.get(protocol)
+    if number is None and protocol.isdigit():
+        number = int(protocol)
+    if number is None:
+        return jsonify({"error": f"protocol must be a number or one of: {', '.join(SERVICE_PROTOCOL_NUMBERS)}"}), 400
+    try:
+        ((lo, hi),), _ = parse_port_ranges([request.args.get('port', '')])
+    except ValueError:
+        return jsonify({"error": "port must be a port or a low-high range"}), 400
+    etag = f"ports-{vdom or ''}-{catalog_version_tag(device)}"
+    if not_modified(etag):
+        return not_modified_response(etag)
+    started = time.perf_counter()
+    index = get_service_port_index(device, vdom)
+    if index is None:
+        logger.error("No parsed config for device '%s'", device)
+        return jsonify({"error": "Device not found"}), 404
+    services = index.services_covering(number, lo, hi)
+    return with_validators(jsonify({
+        "status": "success",
+        "protocol": protocol,
+        "ports": [lo, hi],
+        "services": services,
+        "groups": index.groups_containing(services),
+        "took_ms": round(1000 * (time.perf_counter() - started), 2)
+    }), etag)
+
+# Parse a FortiGate config backup into the object catalog. progress, if given, is called
+# with {'stage', 'bytes_processed', 'bytes_total', 'sections_processed'} as parsing advances.
+# timings, if given, is filled with the seconds spent in each stage.
+def parse_config_content(content, progress=None, timings=None):
+    bytes_total = len(content)
+    current_stage = None
+    stage_started = time.perf_counter()
+
+    def report(stage, bytes_processed=0, sections_processed=0):
+        nonlocal current_stage, stage_started
+        if timings is not None and stage != current_stage:
+            now = time.perf_counter()
+            if current_stage is not None:
+                timings[current_stage] = timings.get(current_stage, 0) + now - stage_started
+            current_stage, stage_started = stage, now
+        if progress:
+            progress({'stage': stage, 'bytes_processed': bytes_processed, 'bytes_total': bytes_total,
+                      'sections_processed': sections_processed})
 
     interfaces = []
     addresses = []
@@ -1080,7 +4216,6 @@ def parse_config():
     vips = []
     ip_pools = []
     services = []
-    service_groups = {}
     ssl_ssh_profiles = []
     webfilter_profiles = []
     av_profiles = []
@@ -1089,14 +4224,15 @@ def parse_config():
     users = []
     groups = []
 
+    report('interfaces')
     interface_pattern = re.compile(r'config system interface\s+edit\s+"([^"]+)"\s*(?:.*?\n)*(?=\s*(?:edit\s+"[^"]+"|end))', re.DOTALL)
     for match in interface_pattern.finditer(content):
         interface_name = match.group(1)
         interfaces.append(interface_name)
-        logger.debug("Found interface: %s", interface_name)
+        object_logger.debug("Found interface: %s", interface_name)
 
     if not interfaces or len(interfaces) == 1:
-        logger.debug("Falling back to line-by-line interface parsing")
+        parse_logger.debug("Falling back to line-by-line interface parsing")
         lines = content.splitlines()
         inside_interface_section = False
         for line in lines:
@@ -1113,13 +4249,14 @@ def parse_config():
                     interface_name = match.group(1)
                     if interface_name not in interfaces:
                         interfaces.append(interface_name)
-                        logger.debug("Found interface (fallback): %s", interface_name)
+                        object_logger.debug("Found interface (fallback): %s", interface_name)
 
+    report('addresses')
     address_pattern = re.compile(r'config firewall address\s+edit\s+"([^"]+)"\s*(?:.*?\n)*(?=\s*(?:edit\s+"[^"]+"|end))', re.DOTALL)
     for match in address_pattern.finditer(content):
         address_name = match.group(1)
         addresses.append(address_name)
-        logger.debug("Found address: %s", address_name)
+        object_logger.debug("Found address: %s", address_name)
 
     addrgrp_pattern = re.compile(r'config firewall addrgrp\s+edit\s+"([^"]+)"\s*(?:.*?\n)*(?=\s*(?:edit\s+"[^"]+"|end))', re.DOTALL)
     for match in addrgrp_pattern.finditer(content):
@@ -1127,10 +4264,10 @@ def parse_config():
         if addrgrp_name not in addresses:
             addresses.append(addrgrp_name)
             address_groups.append(addrgrp_name)
-            logger.debug("Found address group: %s", addrgrp_name)
+            object_logger.debug("Found address group: %s", addrgrp_name)
 
     if not addresses or len(addresses) == 1:
-        logger.debug("Falling back to line-by-line address and address group parsing")
+        parse_logger.debug("Falling back to line-by-line address and address group parsing")
         lines = content.splitlines()
         inside_address_section = False
         inside_addrgrp_section = False
@@ -1154,7 +4291,7 @@ def parse_config():
                         addresses.append(address_name)
                         if inside_addrgrp_section:
                             address_groups.append(address_name)
-                        logger.debug("Found %s (fallback): %s", "address group" if inside_addrgrp_section else "address", address_name)
+                        object_logger.debug("Found %s (fallback): %s", "address group" if inside_addrgrp_section else "address", address_name)
 
     policy_addr_pattern = re.compile(r'set (?:srcaddr|dstaddr)\s+((?:"[^"]+"\s*)+)', re.DOTALL)
     for match in policy_addr_pattern.finditer(content):
@@ -1162,13 +4299,14 @@ def parse_config():
         for addr in addr_list:
             if addr not in addresses:
                 addresses.append(addr)
-                logger.debug("Found address from policy: %s", addr)
+                object_logger.debug("Found address from policy: %s", addr)
 
+    report('internet_services')
     internet_service_pattern = re.compile(r'config firewall internet-service-name\s+edit\s+"([^"]+)"\s*(?:.*?\n)*(?=\s*(?:edit\s+"[^"]+"|end))', re.DOTALL)
     for match in internet_service_pattern.finditer(content):
         isdb_name = match.group(1)
         internet_services.append(isdb_name)
-        logger.debug("Found internet service: %s", isdb_name)
+        object_logger.debug("Found internet service: %s", isdb_name)
 
     policy_isdb_pattern = re.compile(r'set internet-service-id\s+((?:"[^"]+"\s*)+)', re.DOTALL)
     for match in policy_isdb_pattern.finditer(content):
@@ -1176,14 +4314,15 @@ def parse_config():
         for isdb in isdb_list:
             if isdb not in internet_services:
                 internet_services.append(isdb)
-                logger.debug("Found internet service from policy: %s", isdb)
+                object_logger.debug("Found internet service from policy: %s", isdb)
 
+    report('vips')
     vip_pattern = re.compile(r'config firewall vip\s+edit\s+"([^"]+)"\s*(?:.*?\n)*(?=\s*(?:edit\s+"[^"]+"|end))', re.DOTALL)
     for match in vip_pattern.finditer(content):
         vip_name = match.group(1)
         vips.append(vip_name)
         addresses.append(vip_name)
-        logger.debug("Found virtual IP: %s", vip_name)
+        object_logger.debug("Found virtual IP: %s", vip_name)
 
     policy_vip_pattern = re.compile(r'set (?:srcaddr|dstaddr)\s+((?:"[^"]+"\s*)+)', re.DOTALL)
     for match in policy_vip_pattern.finditer(content):
@@ -1191,13 +4330,14 @@ def parse_config():
         for vip in vip_list:
             if vip not in vips and vip in addresses:
                 vips.append(vip)
-                logger.debug("Found virtual IP from policy: %s", vip)
+                object_logger.debug("Found virtual IP from policy: %s", vip)
 
+    report('ip_pools')
     ip_pool_pattern = re.compile(r'config firewall ippool\s+edit\s+"([^"]+)"\s*(?:.*?\n)*(?=\s*(?:edit\s+"[^"]+"|end))', re.DOTALL)
     for match in ip_pool_pattern.finditer(content):
         pool_name = match.group(1)
         ip_pools.append(pool_name)
-        logger.debug("Found IP pool: %s", pool_name)
+        object_logger.debug("Found IP pool: %s", pool_name)
 
     policy_ip_pool_pattern = re.compile(r'set poolname\s+((?:"[^"]+"\s*)+)', re.DOTALL)
     for match in policy_ip_pool_pattern.finditer(content):
@@ -1205,103 +4345,90 @@ def parse_config():
         for pool in pool_list:
             if pool not in ip_pools:
                 ip_pools.append(pool)
-                logger.debug("Found IP pool from policy: %s", pool)
-
-    service_pattern = re.compile(
-        r'config firewall service custom\s+edit\s+"([^"]+)"\s+((?:set\s+[^\n]+\n)*)\s+next',
-        re.DOTALL
-    )
-    for match in service_pattern.finditer(content):
-        service_name = match.group(1)
-        service_config = match.group(2)
-        protocol = 'TCP'
-        port = '0'
+                object_logger.debug("Found IP pool from policy: %s", pool)
 
-        protocol_match = re.search(r'set\s+(\w+)\s+([^\n]+)', service_config)
-        if protocol_match:
-            protocol = protocol_match.group(1).upper()
-            port = protocol_match.group(2).strip()
-        else:
-            if 'tcp' in service_config.lower():
-                protocol = 'TCP'
-            elif 'udp' in service_config.lower():
-                protocol = 'UDP'
-            port_match = re.search(r'\b\d+\b', service_config)
-            if port_match:
-                port = port_match.group(0)
+    # Group membership first, so services named by policies are not mistaken for groups
+    report('service_groups')
+    group_members = extract_group_members(content)
+    service_groups = group_members['service_groups']
+    address_group_members = group_members['address_group_members']
+    object_logger.debug("Found %d service groups and %d address groups with members",
+                        len(service_groups), len(address_group_members))
 
-        services.append({"name": service_name, "protocol": protocol, "port": port})
-        logger.debug("Found service: %s (protocol: %s, port: %s)", service_name, protocol, port)
+    report('services')
+    for vdom, _, service_name, settings in iter_config_tables(content, {'firewall service custom': SERVICE_DEFINITION_KEYS}):
+        service = catalog_service(service_name, settings, vdom)
+        services.append(service)
+        object_logger.debug("Found service: %s (protocol: %s, port: %s)", service_name, service['protocol'], service['port'])
 
+    service_names = {svc['name'] for svc in services}
     policy_service_pattern = re.compile(r'set service\s+((?:"[^"]+"\s*)+)', re.DOTALL)
     for match in policy_service_pattern.finditer(content):
         svc_list = [svc.strip('"') for svc in match.group(1).split()]
         for svc in svc_list:
-            if svc not in [s['name'] for s in services] and svc not in service_groups:
+            if svc not in service_names and svc not in service_groups:
                 svc_info = KNOWN_SERVICES.get(svc, {"protocol": "TCP", "port": "0"})
-                services.append({"name": svc, "protocol": svc_info["protocol"], "port": svc_info["port"]})
-                logger.debug("Found service from policy: %s (protocol: %s, port: %s)", svc, svc_info["protocol"], svc_info["port"])
-
-    service_group_pattern = re.compile(r'config firewall service group\s+edit\s+"([^"]+)"\s+set member\s+([^\n]+)\s+next', re.DOTALL)
-    for match in service_group_pattern.finditer(content):
-        group_name = match.group(1)
-        members = [m.strip('"') for m in match.group(2).split()]
-        service_groups[group_name] = members
-        logger.debug("Found service group: %s with members: %s", group_name, members)
+                known = service_from_port_spec(**svc_info) if svc in KNOWN_SERVICES else None
+                services.append({"name": svc, "protocol": svc_info["protocol"], "port": svc_info["port"],
+                                 "ranges": service_ranges_document(known), "exact": bool(known), "vdom": None})
+                service_names.add(svc)
+                object_logger.debug("Found service from policy: %s (protocol: %s, port: %s)", svc, svc_info["protocol"], svc_info["port"])
 
+    report('users')
     user_pattern = re.compile(r'config user local\s+edit\s+"([^"]+)"\s*(?:.*?\n)*(?=\s*(?:edit\s+"[^"]+"|end))', re.DOTALL)
     for match in user_pattern.finditer(content):
         user_name = match.group(1)
         if user_name not in users:
             users.append(user_name)
-            logger.debug("Found user: %s", user_name)
+            object_logger.debug("Found user: %s", user_name)
 
     group_pattern = re.compile(r'config user group\s+edit\s+"([^"]+)"\s*(?:.*?\n)*(?=\s*(?:edit\s+"[^"]+"|end))', re.DOTALL)
     for match in group_pattern.finditer(content):
         group_name = match.group(1)
         if group_name not in groups:
             groups.append(group_name)
-            logger.debug("Found user group: %s", group_name)
+            object_logger.debug("Found user group: %s", group_name)
 
+    report('profiles')
     ssl_ssh_pattern = re.compile(r'config firewall ssl-ssh-profile\s+edit\s+"([^"]+)"\s*(?:.*?\n)*(?=\s*(?:edit\s+"[^"]+"|end))', re.DOTALL)
     for match in ssl_ssh_pattern.finditer(content):
         profile_name = match.group(1)
         if profile_name not in ssl_ssh_profiles:
             ssl_ssh_profiles.append(profile_name)
-            logger.debug("Found SSL/SSH profile: %s", profile_name)
-    logger.debug("Total SSL/SSH profiles found via regex: %d", len(ssl_ssh_profiles))
+            object_logger.debug("Found SSL/SSH profile: %s", profile_name)
+    parse_logger.debug("Total SSL/SSH profiles found via regex: %d", len(ssl_ssh_profiles))
 
     webfilter_pattern = re.compile(r'config webfilter profile\s+edit\s+"([^"]+)"\s*(?:.*?\n)*(?=\s*(?:edit\s+"[^"]+"|end))', re.DOTALL)
     for match in webfilter_pattern.finditer(content):
         profile_name = match.group(1)
         if profile_name not in webfilter_profiles:
             webfilter_profiles.append(profile_name)
-            logger.debug("Found webfilter profile: %s", profile_name)
-    logger.debug("Total webfilter profiles found via regex: %d", len(webfilter_profiles))
+            object_logger.debug("Found webfilter profile: %s", profile_name)
+    parse_logger.debug("Total webfilter profiles found via regex: %d", len(webfilter_profiles))
 
     av_pattern = re.compile(r'config antivirus profile\s+edit\s+"([^"]+)"\s*(?:.*?\n)*(?=\s*(?:edit\s+"[^"]+"|end))', re.DOTALL)
     for match in av_pattern.finditer(content):
         profile_name = match.group(1)
         if profile_name not in av_profiles:
             av_profiles.append(profile_name)
-            logger.debug("Found antivirus profile: %s", profile_name)
-    logger.debug("Total antivirus profiles found via regex: %d", len(av_profiles))
+            object_logger.debug("Found antivirus profile: %s", profile_name)
+    parse_logger.debug("Total antivirus profiles found via regex: %d", len(av_profiles))
 
     application_pattern = re.compile(r'config application list\s+edit\s+"([^"]+)"\s*(?:.*?\n)*(?=\s*(?:edit\s+"[^"]+"|end))', re.DOTALL)
     for match in application_pattern.finditer(content):
         list_name = match.group(1)
         if list_name not in application_lists:
             application_lists.append(list_name)
-            logger.debug("Found application list: %s", list_name)
-    logger.debug("Total application lists found via regex: %d", len(application_lists))
+            object_logger.debug("Found application list: %s", list_name)
+    parse_logger.debug("Total application lists found via regex: %d", len(application_lists))
 
     ips_pattern = re.compile(r'config ips sensor\s+edit\s+"([^"]+)"\s*(?:.*?\n)*(?=\s*(?:edit\s+"[^"]+"|end))', re.DOTALL)
     for match in ips_pattern.finditer(content):
         sensor_name = match.group(1)
         if sensor_name not in ips_sensors:
             ips_sensors.append(sensor_name)
-            logger.debug("Found IPS sensor: %s", sensor_name)
-    logger.debug("Total IPS sensors found via regex: %d", len(ips_sensors))
+            object_logger.debug("Found IPS sensor: %s", sensor_name)
+    parse_logger.debug("Total IPS sensors found via regex: %d", len(ips_sensors))
 
     lines = content.splitlines()
     inside_interface_section = False
@@ -1320,124 +4447,135 @@ def parse_config():
     inside_application_section = False
     inside_ips_section = False
     nested_level = 0
+    bytes_processed = 0
+    sections_processed = 0
+    report('sections')
+    # The per-line events below are the hottest log calls; skip even the call when disabled
+    log_lines = object_logger.isEnabledFor(logging.DEBUG)
     for i, line in enumerate(lines):
+        bytes_processed += len(line) + 1
+        if i % 10000 == 0:
+            report('sections', bytes_processed, sections_processed)
         line = line.strip()
-        logger.debug("Processing line %d: %s", i, line)
+        if line.startswith('config '):
+            sections_processed += 1
+        if log_lines:
+            object_logger.debug("Processing line %d: %s", i, line)
         if line.startswith('config system interface'):
             inside_interface_section = True
-            logger.debug("Entered config system interface section")
+            object_logger.debug("Entered config system interface section")
             continue
         if line.startswith('config firewall address'):
             inside_address_section = True
-            logger.debug("Entered config firewall address section")
+            object_logger.debug("Entered config firewall address section")
             continue
         if line.startswith('config firewall addrgrp'):
             inside_addrgrp_section = True
-            logger.debug("Entered config firewall addrgrp section")
+            object_logger.debug("Entered config firewall addrgrp section")
             continue
         if line.startswith('config firewall internet-service-name'):
             inside_internet_service_section = True
-            logger.debug("Entered config firewall internet-service-name section")
+            object_logger.debug("Entered config firewall internet-service-name section")
             continue
         if line.startswith('config firewall vip'):
             inside_vip_section = True
-            logger.debug("Entered config firewall vip section")
+            object_logger.debug("Entered config firewall vip section")
             continue
         if line.startswith('config firewall ippool'):
             inside_ip_pool_section = True
-            logger.debug("Entered config firewall ippool section")
+            object_logger.debug("Entered config firewall ippool section")
             continue
         if line.startswith('config firewall service custom'):
             inside_service_section = True
-            logger.debug("Entered config firewall service custom section")
+            object_logger.debug("Entered config firewall service custom section")
             continue
         if line.startswith('config firewall service group'):
             inside_service_group_section = True
-            logger.debug("Entered config firewall service group section")
+            object_logger.debug("Entered config firewall service group section")
             continue
         if line.startswith('config user local'):
             inside_user_section = True
-            logger.debug("Entered config user local section")
+            object_logger.debug("Entered config user local section")
             continue
         if line.startswith('config user group'):
             inside_group_section = True
-            logger.debug("Entered config user group section")
+            object_logger.debug("Entered config user group section")
             continue
         if line.startswith('config firewall ssl-ssh-profile'):
             inside_ssl_ssh_section = True
-            logger.debug("Entered config firewall ssl-ssh-profile section")
+            object_logger.debug("Entered config firewall ssl-ssh-profile section")
             continue
         if line.startswith('config webfilter profile'):
             inside_webfilter_section = True
             nested_level = 0
-            logger.debug("Entered config webfilter profile section")
+            object_logger.debug("Entered config webfilter profile section")
             continue
         if line.startswith('config antivirus profile'):
             inside_av_section = True
             nested_level = 0
-            logger.debug("Entered config antivirus profile section")
+            object_logger.debug("Entered config antivirus profile section")
             continue
         if line.startswith('config application list'):
             inside_application_section = True
-            logger.debug("Entered config application list section")
+            object_logger.debug("Entered config application list section")
             continue
         if line.startswith('config ips sensor'):
             inside_ips_section = True
-            logger.debug("Entered config ips sensor section")
+            object_logger.debug("Entered config ips sensor section")
             continue
         if line.startswith('config '):
             nested_level += 1
-            logger.debug("Entered nested config section, level: %d", nested_level)
+            object_logger.debug("Entered nested config section, level: %d", nested_level)
             continue
         if line.startswith('end'):
             if nested_level > 0:
                 nested_level -= 1
-                logger.debug("Exited nested config section, level: %d", nested_level)
+                object_logger.debug("Exited nested config section, level: %d", nested_level)
             elif inside_interface_section:
                 inside_interface_section = False
-                logger.debug("Exited config system interface section")
+                object_logger.debug("Exited config system interface section")
             elif inside_address_section:
                 inside_address_section = False
-                logger.debug("Exited config firewall address section")
+                object_logger.debug("Exited config firewall address section")
             elif inside_addrgrp_section:
                 inside_addrgrp_section = False
-                logger.debug("Exited config firewall addrgrp section")
+                object_logger.debug("Exited config firewall addrgrp section")
             elif inside_internet_service_section:
                 inside_internet_service_section = False
-                logger.debug("Exited config firewall internet-service-name section")
+                object_logger.debug("Exited config firewall internet-service-name section")
             elif inside_vip_section:
                 inside_vip_section = False
-                logger.debug("Exited config firewall vip section")
+                object_logger.debug("Exited config firewall vip section")
             elif inside_ip_pool_section:
                 inside_ip_pool_section = False
-                logger.debug("Exited config firewall ippool section")
+                object_logger.debug("Exited config firewall ippool section")
             elif inside_service_section:
                 inside_service_section = False
-                logger.debug("Exited config firewall service custom section")
+                object_logger.debug("Exited config firewall service custom section")
             elif inside_service_group_section:
                 inside_service_group_section = False
-                logger.debug("Exited config firewall service group section")
+                object_logger.debug("Exited config firewall service group section")
             elif inside_user_section:
                 inside_user_section = False
-                logger.debug("Exited config user local section")
+                object_logger.debug("Exited config user local section")
             elif inside_group_section:
                 inside_group_section = False
-                logger.debug("Exited config user group section")
+                object_logger.debug("Exited config user group section")
             elif inside_ssl_ssh_section:
                 inside_ssl_ssh_section = False
-                logger.debug("Exited config firewall ssl-ssh-profile section")
+                object_logger.debug("Exited config firewall ssl-ssh-profile section")
             elif inside_webfilter_section:
                 inside_webfilter_section = False
-                logger.debug("Exited config webfilter profile section")
+                object_logger.debug("Exited config webfilter profile section")
             elif inside_av_section:
                 inside_av_section = False
-                logger.debug("Exited config antivirus profile section")
+                object_logger.debug("Exited config antivirus profile section")
             elif inside_application_section:
                 inside_application_section = False
-                logger.debug("Exited config application list section")
+                object_logger.debug("Exited config application list section")
             elif inside_ips_section:
                 inside_ips_section = False
-                logger.debug("Exited config ips sensor section")
+                object_logger.debug("Exited config ips sensor section")
             continue
         if line.startswith('edit ') and (
             inside_interface_section or
@@ -1456,74 +4594,76 @@ def parse_config():
             inside_application_section or
             inside_ips_section
         ):
-            logger.debug("Processing edit line: %s", line)
+            if log_lines:
+                object_logger.debug("Processing edit line: %s", line)
             match = re.match(r'edit\s+"([^"]+)"', line)
             if match:
                 name = match.group(1)
                 if inside_interface_section and name not in interfaces:
                     interfaces.append(name)
-                    logger.debug("Found interface (fallback): %s", name)
+                    object_logger.debug("Found interface (fallback): %s", name)
                 elif inside_address_section and name not in addresses:
                     addresses.append(name)
-                    logger.debug("Found address (fallback): %s", name)
+                    object_logger.debug("Found address (fallback): %s", name)
                 elif inside_addrgrp_section and name not in addresses:
                     addresses.append(name)
                     address_groups.append(name)
-                    logger.debug("Found address group (fallback): %s", name)
+                    object_logger.debug("Found address group (fallback): %s", name)
                 elif inside_internet_service_section and name not in internet_services:
                     internet_services.append(name)
-                    logger.debug("Found internet service (fallback): %s", name)
+                    object_logger.debug("Found internet service (fallback): %s", name)
                 elif inside_vip_section and name not in vips:
                     vips.append(name)
                     addresses.append(name)
-                    logger.debug("Found virtual IP (fallback): %s", name)
+                    object_logger.debug("Found virtual IP (fallback): %s", name)
                 elif inside_ip_pool_section and name not in ip_pools:
                     ip_pools.append(name)
-                    logger.debug("Found IP pool (fallback): %s", name)
+                    object_logger.debug("Found IP pool (fallback): %s", name)
                 elif inside_user_section and name not in users:
                     users.append(name)
-                    logger.debug("Found user (fallback): %s", name)
+                    object_logger.debug("Found user (fallback): %s", name)
                 elif inside_group_section and name not in groups:
                     groups.append(name)
-                    logger.debug("Found user group (fallback): %s", name)
+                    object_logger.debug("Found user group (fallback): %s", name)
                 elif inside_ssl_ssh_section and name not in ssl_ssh_profiles:
                     ssl_ssh_profiles.append(name)
-                    logger.debug("Found SSL/SSH profile (fallback): %s", name)
+                    object_logger.debug("Found SSL/SSH profile (fallback): %s", name)
                 elif inside_webfilter_section and name not in webfilter_profiles:
                     webfilter_profiles.append(name)
-                    logger.debug("Found webfilter profile (fallback): %s", name)
+                    object_logger.debug("Found webfilter profile (fallback): %s", name)
                 elif inside_av_section and name not in av_profiles:
                     av_profiles.append(name)
-                    logger.debug("Found antivirus profile (fallback): %s", name)
+                    object_logger.debug("Found antivirus profile (fallback): %s", name)
                 elif inside_application_section and name not in application_lists:
                     application_lists.append(name)
-                    logger.debug("Found application list (fallback): %s", name)
+                    object_logger.debug("Found application list (fallback): %s", name)
                 elif inside_ips_section and name not in ips_sensors:
                     ips_sensors.append(name)
-                    logger.debug("Found IPS sensor (fallback): %s", name)
+                    object_logger.debug("Found IPS sensor (fallback): %s", name)
             else:
-                logger.debug("Edit line did not match regex: %s", line)
-
-    logger.debug("Final total interfaces found: %d", len(interfaces))
-    logger.debug("Final total addresses found: %d", len(addresses))
-    logger.debug("Final total address groups found: %d", len(address_groups))
-    logger.debug("Final total internet services found: %d", len(internet_services))
-    logger.debug("Final total virtual IPs found: %d", len(vips))
-    logger.debug("Final total IP pools found: %d", len(ip_pools))
-    logger.debug("Final total services found: %d", len(services))
-    logger.debug("Final total service groups found: %d", len(service_groups))
-    logger.debug("Final total users found: %d", len(users))
-    logger.debug("Final total user groups found: %d", len(groups))
-    logger.debug("Final total SSL/SSH profiles found: %d", len(ssl_ssh_profiles))
-    logger.debug("Final total webfilter profiles found: %d", len(webfilter_profiles))
-    logger.debug("Final total antivirus profiles found: %d", len(av_profiles))
-    logger.debug("Final total application lists found: %d", len(application_lists))
-    logger.debug("Final total IPS sensors found: %d", len(ips_sensors))
+                object_logger.debug("Edit line did not match regex: %s", line)
+
+    parse_logger.debug("Final total interfaces found: %d", len(interfaces))
+    parse_logger.debug("Final total addresses found: %d", len(addresses))
+    parse_logger.debug("Final total address groups found: %d", len(address_groups))
+    parse_logger.debug("Final total internet services found: %d", len(internet_services))
+    parse_logger.debug("Final total virtual IPs found: %d", len(vips))
+    parse_logger.debug("Final total IP pools found: %d", len(ip_pools))
+    parse_logger.debug("Final total services found: %d", len(services))
+    parse_logger.debug("Final total service groups found: %d", len(service_groups))
+    parse_logger.debug("Final total users found: %d", len(users))
+    parse_logger.debug("Final total user groups found: %d", len(groups))
+    parse_logger.debug("Final total SSL/SSH profiles found: %d", len(ssl_ssh_profiles))
+    parse_logger.debug("Final total webfilter profiles found: %d", len(webfilter_profiles))
+    parse_logger.debug("Final total antivirus profiles found: %d", len(av_profiles))
+    parse_logger.debug("Final total application lists found: %d", len(application_lists))
+    parse_logger.debug("Final total IPS sensors found: %d", len(ips_sensors))
 
     response = {
         "interfaces": interfaces,
         "addresses": addresses,
         "address_groups": address_groups,
+        "address_group_members": address_group_members,
         "internet_services": internet_services,
         "vips": vips,
         "ip_pools": ip_pools,
@@ -1538,11 +4678,781 @@ def parse_config():
         "groups": groups
     }
     
-    save_last_config(response)
-    
-    logger.debug("Returning parsed config response: %s", response)
-    return jsonify(response)
+    report('done', bytes_total)
+    return response
+
+# Parse timings are measured wherever parsing ran (possibly a pool worker) and recorded here
+def record_parse_metrics(bytes_total, timings, response):
+    observe('fgc_parse_input_bytes', bytes_total)
+    for section, seconds in timings.items():
+        observe('fgc_parse_section_duration_seconds', seconds, (section,))
+    for kind, objects in response.items():
+        inc_counter('fgc_parse_objects_total', (kind,), len(objects))
+
+# Drift check: which templates reference objects a device's parsed catalog no longer
+# has. Referenced names per kind come from the reference index (DISTINCT over its
+# primary key), so the check is a set difference per kind plus one join for the
+# policies that use the missing names; no template is decoded.
+DRIFT_CATALOG_KEYS = {
+    'interface': 'interfaces', 'address': 'addresses', 'address_group': 'address_groups', 'vip': 'vips',
+    'ip_pool': 'ip_pools', 'service': 'services', 'service_group': 'service_groups',
+    'ssl_ssh_profile': 'ssl_ssh_profiles', 'webfilter_profile': 'webfilter_profiles', 'av_profile': 'av_profiles',
+    'application_list': 'application_lists', 'ips_sensor': 'ips_sensors', 'user': 'users', 'group': 'groups'
+}
+# Present on every FortiGate whether or not a backup lists them, including the predefined
+# services templates pick from. Internet services come from the FortiGuard database
+# rather than the config and custom services are created by the generated CLI, so
+# neither kind is checked.
+DRIFT_BUILTIN_OBJECTS = {'interface': {'any'}, 'address': {'all', 'none'}, 'service': {'ALL', *KNOWN_SERVICES}}
+
+def catalog_name_sets(config):
+    names = {}
+    for kind, key in DRIFT_CATALOG_KEYS.items():
+        values = config.get(key) or ()
+        if key == 'services':
+            names[kind] = {svc['name'] for svc in values}
+        else:
+            names[kind] = set(values)
+        names[kind] |= DRIFT_BUILTIN_OBJECTS.get(kind, set())
+    return names
+
+@timed_query
+def find_drifted_references(catalog):
+    conn = sqlite3.connect(app.config['DB_PATH'])
+    cursor = conn.cursor()
+    cursor.execute(f'''
+        SELECT DISTINCT name, kind FROM template_references
+        WHERE kind IN ({','.join('?' * len(catalog))})
+    ''', list(catalog))
+    missing = [(name, kind) for name, kind in cursor.fetchall() if name not in catalog[kind]]
+    rows = []
+    if missing:
+        cursor.execute('CREATE TEMP TABLE drift_missing (name TEXT NOT NULL, kind TEXT NOT NULL)')
+        cursor.executemany('INSERT INTO drift_missing (name, kind) VALUES (?, ?)', missing)
+        cursor.execute('''
+            SELECT r.template_name, r.policy_id, r.policy_name, r.kind, r.name, r.field
+            FROM drift_missing m JOIN template_references r ON r.name = m.name AND r.kind = m.kind
+            ORDER BY r.template_name, r.policy_id, r.kind, r.name
+        ''')
+        rows = cursor.fetchall()
+    cursor.execute('SELECT COUNT(*) FROM templates')
+    template_count = cursor.fetchone()[0]
+    conn.close()
+    return rows, template_count
+
+# Compare every template against the device's stored catalog and store the report
+def run_drift_check(device):
+    config = get_device_config_snapshot(device)
+    if config is None:
+        return None
+    started = time.perf_counter()
+    templates_version = _current_state_versions().get('templates', 0)
+    rows, template_count = find_drifted_references(catalog_name_sets(config))
+
+    templates = {}
+    missing_objects = {}
+    for template_name, policy_id, policy_name, kind, name, field in rows:
+        entry = templates.setdefault(template_name, {'missing': {}, 'policies': {}})
+        if name not in entry['missing'].setdefault(kind, []):
+            entry['missing'][kind].append(name)
+        policy = entry['policies'].setdefault(policy_id, {'policy_name': policy_name, 'missing': []})
+        policy['missing'].append({'kind': kind, 'name': name, 'field': field})
+        missing_objects.setdefault(kind, set()).add(name)
+    report = {
+        'device': device,
+        'checked_at': datetime.now(timezone.utc).isoformat(),
+        'templates_version': templates_version,
+        'templates_checked': template_count,
+        'templates_with_drift': len(templates),
+        'missing_objects': {kind: sorted(names) for kind, names in sorted(missing_objects.items())},
+        'templates': templates,
+        'took_ms': round(1000 * (time.perf_counter() - started), 2)
+    }
+    save_drift_report(device, report)
+    logger.info("Drift check for device '%s': %d of %d templates reference missing objects (%.0f ms)",
+                device, len(templates), template_count, report['took_ms'])
+    return report
+
+@timed_query
+def save_drift_report(device, report):
+    conn = sqlite3.connect(app.config['DB_PATH'])
+    cursor = conn.cursor()
+    cursor.execute('''
+        INSERT INTO drift_reports (device, report, created_at) VALUES (?, ?, ?)
+        ON CONFLICT(device) DO UPDATE SET report = excluded.report, created_at = excluded.created_at
+    ''', (device, encode_document(report), report['checked_at']))
+    conn.commit()
+    conn.close()
+
+@timed_query
+def load_drift_report(device):
+    conn = sqlite3.connect(app.config['DB_PATH'])
+    cursor = conn.cursor()
+    cursor.execute('SELECT report FROM drift_reports WHERE device = ?', (device,))
+    row = cursor.fetchone()
+    conn.close()
+    return decode_document(row[0]) if row else None
+
+# Drift checks and backup snapshots after a parse run on one background thread, off the
+# request path
+_background_executor = {'executor': None}
+
+def _get_background_executor():
+    with _parse_pool_lock:
+        if _background_executor['executor'] is None:
+            _background_executor['executor'] = ThreadPoolExecutor(max_workers=1, thread_name_prefix='after-parse')
+        return _background_executor['executor']
+
+def schedule_drift_check(device):
+    def check():
+        try:
+            run_drift_check(device)
+        except Exception as e:
+            logger.error("Drift check for device '%s' failed: %s", device, e, exc_info=True)
+    _get_background_executor().submit(check)
+
+# Latest drift report of a device; `stale` is set once templates changed after the check.
+# POST runs a new check first.
+@app.route('/drift_report/<device>', methods=['GET', 'POST'])
+def drift_report(device):
+    if request.method == 'POST':
+        report = run_drift_check(device)
+        if report is None:
+            logger.error("Device '%s' not found for drift check", device)
+            return jsonify({"error": "Device not found"}), 404
+    else:
+        report = load_drift_report(device)
+        if report is None:
+            logger.error("No drift report for device '%s'", device)
+            return jsonify({"error": "No drift report for this device"}), 404
+    report['stale'] = report['templates_version'] != _current_state_versions().get('templates', 0)
+    return jsonify({"status": "success", **report})
+
+# Stored backups as Merkle trees of content-addressed nodes, shared by every backup:
+#   root     [[scope, section, section hash], ...]   scope is 'root', 'global' or a VDOM
+#   section  {'buckets': [[bucket, bucket hash], ...], 'order': hash of the entry names}
+#   bucket   [[entry name, entry hash], ...]         entries spread by a hash of their name
+#   entry    the lines of one `edit` block, nested config included
+# A table's own settings outside any `edit` form the entry named ''. Entry order is only
+# kept for policy tables, where it changes what the table does. Since a node's hash covers
+# everything below it, a backup is stored by walking down from its root and writing only
+# the nodes that are not there yet, and two backups are compared by descending only into
+# nodes whose hashes differ, so both cost in proportion to what changed.
+BACKUP_BUCKETS = 256
+BACKUP_NODE_BATCH = 500
+ORDERED_SECTION = re.compile(r'policy\d*$')
+PROFILE_SECTION = re.compile(r'(?:profile\S*|sensor|application list)$')
+BACKUP_OBJECT_KINDS = {
+    'firewall address': 'addresses', 'firewall address6': 'addresses', 'firewall multicast-address': 'addresses',
+    'firewall vip': 'addresses', 'firewall vip6': 'addresses',
+    'firewall addrgrp': 'groups', 'firewall addrgrp6': 'groups', 'firewall vipgrp': 'groups',
+    'firewall service group': 'groups', 'user group': 'groups',
+    'firewall service custom': 'services'
+}
+
+def backup_object_kind(section):
+    if section in BACKUP_OBJECT_KINDS:
+        return BACKUP_OBJECT_KINDS[section]
+    if ORDERED_SECTION.search(section):
+        return 'policies'
+    if PROFILE_SECTION.search(section):
+        return 'profiles'
+    return 'other'
+
+# Group a backup's lines into {(scope, section): {entry name: [lines]}}. Top-level tables
+# are those at the outermost level, directly inside a `config vdom` edit or inside
+# `config global`.
+def backup_sections(lines):
+    sections = OrderedDict()
+    containers = []
+    scope = 'root'
+    entries = entry = None
+    nested = 0
+    for line in lines:
+        line = line.strip()
+        if not line or line.startswith('#'):
+            continue
+        keyword, _, rest = line.partition(' ')
+        if entries is not None:
+            if nested == 0:
+                if keyword == 'edit' and entry is None:
+                    entry = entries.setdefault(first_value({'edit': config_tokens(rest)}, 'edit'), [])
+                    continue
+                if keyword == 'next' and entry is not None:
+                    entry = None
+                    continue
+                if keyword == 'end':
+                    entries = entry = None
+                    continue
+            if keyword == 'config':
+                nested += 1
+            elif keyword == 'end':
+                nested -= 1
+            (entry if entry is not None else entries.setdefault('', [])).append(line)
+        elif keyword == 'config':
+            name = rest.strip()
+            if not containers and name in ('vdom', 'global'):
+                containers.append(name)
+                if name == 'global':
+                    scope = 'global'
+            elif not containers or containers in (['vdom', 'edit'], ['global']):
+                entries = sections.setdefault((scope, name), OrderedDict())
+                nested = 0
+        elif keyword == 'edit' and containers == ['vdom']:
+            containers.append('edit')
+            scope = first_value({'edit': config_tokens(rest)}, 'edit')
+        elif keyword in ('next', 'end') and containers:
+            if keyword == 'end' and containers[-1] == 'edit':
+                containers.pop()
+            containers.pop()
+            if not containers:
+                scope = 'root'
+    return sections
+
+def backup_bucket(name):
+    return zlib.crc32(name.encode('utf-8')) % BACKUP_BUCKETS
+
+# Hash tree of a backup: (root hash, {hash: (payload, child hashes)})
+def build_backup_tree(sections):
+    nodes = {}
+
+    def put(value, children=()):
+        payload = json.dumps(value, separators=(',', ':')).encode('utf-8')
+        digest = hashlib.blake2b(payload, digest_size=16).hexdigest()
+        nodes[digest] = (payload, children)
+        return digest
+
+    root = []
+    for (scope, section), entries in sections.items():
+        buckets = {}
+        for name, block in entries.items():
+            buckets.setdefault(backup_bucket(name), []).append([name, put(block)])
+        bucket_nodes = []
+        for bucket, items in sorted(buckets.items()):
+            items.sort()
+            bucket_nodes.append([bucket, put(items, [digest for _, digest in items])])
+        node = {'buckets': bucket_nodes}
+        children = [digest for _, digest in bucket_nodes]
+        if ORDERED_SECTION.search(section):
+            node['order'] = put(list(entries))
+            children.append(node['order'])
+        root.append([scope, section, put(node, children)])
+    root.sort()
+    return put(root, [digest for _, _, digest in root]), nodes
+
+def _backup_summary(row):
+    backup_id, device, root, lines, objects, size, created_at = row
+    return {'backup_id': backup_id, 'device': device, 'root': root, 'lines': lines, 'objects': objects,
+            'bytes': size, 'created_at': created_at}
+
+# Store a backup of a device. Nodes are written level by level from the root, skipping
+# every subtree whose root node is already stored. A backup identical to the device's
+# latest one is not stored again; that one is returned with `unchanged` set.
+@timed_query
+def save_backup(device, content):
+    lines = content.splitlines()
+    sections = backup_sections(lines)
+    root, nodes = build_backup_tree(sections)
+    objects = sum(len(entries) for entries in sections.values())
+    conn = sqlite3.connect(app.config['DB_PATH'])
+    cursor = conn.cursor()
+    try:
+        # Concurrent snapshots (an upload and an after-parse thread) share nodes; taking
+        # the write lock first keeps their existence checks and inserts consistent
+        cursor.execute('BEGIN IMMEDIATE')
+        cursor.execute('''
+            SELECT backup_id, device, root, lines, objects, bytes, created_at FROM device_backups
+            WHERE device = ? ORDER BY backup_id DESC LIMIT 1
+        ''', (device,))
+        latest = cursor.fetchone()
+        if latest and latest[2] == root:
+            conn.rollback()
+            return {**_backup_summary(latest), 'unchanged': True, 'nodes_written': 0}
+
+        written = 0
+        level = [root]
+        while level:
+            stored = set()
+            for start in range(0, len(level), BACKUP_NODE_BATCH):
+                batch = level[start:start + BACKUP_NODE_BATCH]
+                cursor.execute(f"SELECT hash FROM backup_nodes WHERE hash IN ({','.join('?' * len(batch))})", batch)
+                stored.update(digest for digest, in cursor.fetchall())
+            new = [digest for digest in dict.fromkeys(level) if digest not in stored]
+            cursor.executemany('INSERT OR IGNORE INTO backup_nodes (hash, data) VALUES (?, ?)',
+                               ((digest, zlib.compress(nodes[digest][0], 6)) for digest in new))
+            written += len(new)
+            level = [child for digest in new for child in nodes[digest][1]]
+
+        created_at = datetime.now(timezone.utc).isoformat()
+        cursor.execute('''
+            INSERT INTO device_backups (device, root, lines, objects, bytes, created_at) VALUES (?, ?, ?, ?, ?, ?)
+        ''', (device, root, len(lines), objects, len(content), created_at))
+        backup_id = cursor.lastrowid
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+    logger.info("Stored backup %d of device '%s': %d objects, %d new nodes", backup_id, device, objects, written)
+    return {'backup_id': backup_id, 'device': device, 'root': root, 'lines': len(lines), 'objects': objects,
+            'bytes': len(content), 'created_at': created_at, 'unchanged': False, 'nodes_written': written}
+
+@timed_query
+def list_backups(device):
+    conn = sqlite3.connect(app.config['DB_PATH'])
+    cursor = conn.cursor()
+    cursor.execute('''
+        SELECT backup_id, device, root, lines, objects, bytes, created_at FROM device_backups
+        WHERE device = ? ORDER BY backup_id DESC
+    ''', (device,))
+    backups = [_backup_summary(row) for row in cursor.fetchall()]
+    conn.close()
+    return backups
+
+@timed_query
+def load_backup(backup_id):
+    conn = sqlite3.connect(app.config['DB_PATH'])
+    cursor = conn.cursor()
+    cursor.execute('''
+        SELECT backup_id, device, root, lines, objects, bytes, created_at FROM device_backups WHERE backup_id = ?
+    ''', (backup_id,))
+    row = cursor.fetchone()
+    conn.close()
+    return _backup_summary(row) if row else None
+
+@timed_query
+def load_backup_nodes(hashes):
+    hashes = list(dict.fromkeys(hashes))
+    nodes = {}
+    conn = sqlite3.connect(app.config['DB_PATH'])
+    cursor = conn.cursor()
+    for start in range(0, len(hashes), BACKUP_NODE_BATCH):
+        batch = hashes[start:start + BACKUP_NODE_BATCH]
+        cursor.execute(f"SELECT hash, data FROM backup_nodes WHERE hash IN ({','.join('?' * len(batch))})", batch)
+        nodes.update((digest, json.loads(zlib.decompress(data))) for digest, data in cursor.fetchall())
+    conn.close()
+    return nodes
+
+# Settings of an entry keyed by their path through nested tables, e.g. 'realservers/1/ip';
+# unset settings map to None
+def flatten_backup_entry(lines):
+    values = {}
+    path = []
+    for line in lines:
+        keyword, _, rest = line.partition(' ')
+        if keyword in ('config', 'edit'):
+            path.append(first_value({keyword: config_tokens(rest)}, keyword))
+        elif keyword in ('next', 'end'):
+            if path:
+                path.pop()
+        elif keyword in ('set', 'unset'):
+            key, _, value = rest.partition(' ')
+            values['/'.join(path + [key])] = value if keyword == 'set' else None
+    return values
+
+def diff_backup_entry(old_lines, new_lines):
+    old, new = flatten_backup_entry(old_lines), flatten_backup_entry(new_lines)
+    return {key: [old.get(key), new.get(key)] for key in sorted(old.keys() | new.keys())
+            if old.get(key) != new.get(key)}
+
+def _moved_entries(old_order, new_order):
+    common = set(old_order) & set(new_order)
+    old = [name for name in old_order if name in common]
+    new = [name for name in new_order if name in common]
+    if old == new:
+        return []
+    matcher = difflib.SequenceMatcher(None, old, new, autojunk=False)
+    return [name for tag, _, _, j1, j2 in matcher.get_opcodes() if tag != 'equal' for name in new[j1:j2]]
+
+# Object-level difference between two stored backups. Each level loads only the nodes
+# under hashes that differ, in one batch: changed sections, then their changed buckets,
+# then the changed entries and the order of reordered policy tables.
+def diff_backups(old_root, new_root):
+    stats = {'sections': 0, 'buckets': 0, 'entries': 0}
+    if old_root == new_root:
+        return [], stats
+    roots = load_backup_nodes([old_root, new_root])
+    old_sections = {(scope, section): digest for scope, section, digest in roots[old_root]}
+    new_sections = {(scope, section): digest for scope, section, digest in roots[new_root]}
+    changed = [key for key in sorted(old_sections.keys() | new_sections.keys())
+               if old_sections.get(key) != new_sections.get(key)]
+    section_nodes = load_backup_nodes([sections[key] for key in changed
+                                       for sections in (old_sections, new_sections) if key in sections])
+    stats['sections'] = len(changed)
+
+    empty = {'buckets': []}
+    pending = []
+    for key in changed:
+        old = section_nodes[old_sections[key]] if key in old_sections else empty
+        new = section_nodes[new_sections[key]] if key in new_sections else empty
+        old_buckets, new_buckets = dict(old['buckets']), dict(new['buckets'])
+        buckets = [(old_buckets.get(bucket), new_buckets.get(bucket))
+                   for bucket in sorted(old_buckets.keys() | new_buckets.keys())
+                   if old_buckets.get(bucket) != new_buckets.get(bucket)]
+        pending.append((key, old.get('order'), new.get('order'), buckets))
+    bucket_nodes = load_backup_nodes([digest for *_, buckets in pending for pair in buckets for digest in pair if digest])
+    stats['buckets'] = len(bucket_nodes)
+
+    results = []
+    for (scope, section), old_order, new_order, buckets in pending:
+        result = {'vdom': scope, 'section': section, 'kind': backup_object_kind(section),
+                  'added': [], 'removed': [], 'changed': []}
+        for old_bucket, new_bucket in buckets:
+            old_entries = dict(bucket_nodes[old_bucket]) if old_bucket else {}
+            new_entries = dict(bucket_nodes[new_bucket]) if new_bucket else {}
+            result['added'].extend(name for name in new_entries if name not in old_entries)
+            result['removed'].extend(name for name in old_entries if name not in new_entries)
+            result['changed'].extend((name, old_entries[name], new_entries[name]) for name in old_entries
+                                     if name in new_entries and old_entries[name] != new_entries[name])
+        if old_order and new_order and old_order != new_order:
+            result['order'] = (old_order, new_order)
+        results.append(result)
+
+    detail = load_backup_nodes([digest for result in results for _, old, new in result['changed'] for digest in (old, new)] +
+                               [digest for result in results for digest in result.get('order', ())])
+    stats['entries'] = sum(len(result['changed']) for result in results)
+    for result in results:
+        result['added'].sort()
+        result['removed'].sort()
+        result['changed'] = [{'name': name, 'settings': diff_backup_entry(detail[old], detail[new])}
+                             for name, old, new in sorted(result['changed'])]
+        order = result.pop('order', None)
+        result['moved'] = _moved_entries(detail[order[0]], detail[order[1]]) if order else []
+    return results, stats
+
+def schedule_backup_snapshot(device, content):
+    def snapshot():
+        try:
+            save_backup(device, content)
+        except Exception as e:
+            logger.error("Storing backup of device '%s' failed: %s", device, e, exc_info=True)
+    _get_background_executor().submit(snapshot)
+
+# Store an uploaded backup without parsing it
+@app.route('/backups', methods=['POST'])
+def upload_backup():
+    if 'config_file' not in request.files:
+        logger.error("No file loaded")
+        return jsonify({"error": "No file uploaded"}), 400
+    file = request.files['config_file']
+    content = read_uploaded_config(file)
+    device = detect_device_name(content, file.filename, request.form.get('device', ''))
+    try:
+        backup = save_backup(device, content)
+    except sqlite3.OperationalError as e:
+        logger.error("Storing backup of device '%s' failed: %s", device, e)
+        return jsonify({"error": "Database is busy, try again later"}), 503, {'Retry-After': '5'}
+    except Exception as e:
+        logger.error("Storing backup of device '%s' failed: %s", device, e, exc_info=True)
+        return jsonify({"error": "Failed to store backup"}), 500
+    return jsonify({"status": "success", **backup})
+
+@app.route('/backups/<device>', methods=['GET'])
+def backups_endpoint(device):
+    return jsonify({"status": "success", "device": device, "backups": list_backups(device)})
+
+# Added, removed and changed objects between two stored backups: those with the `from`
+# and `to` backup ids, or else the two latest backups of `device`
+@app.route('/diff_backups', methods=['GET'])
+def diff_backups_endpoint():
+    device = request.args.get('device', '')
+    from_arg, to_arg = request.args.get('from'), request.args.get('to')
+    if (from_arg is None) != (to_arg is None):
+        return jsonify({"error": "from and to must be given together"}), 400
+    if from_arg is not None:
+        try:
+            from_id, to_id = int(from_arg), int(to_arg)
+        except ValueError:
+            return jsonify({"error": "from and to must be backup ids"}), 400
+    else:
+        if not device:
+            return jsonify({"error": "from and to, or device, are required"}), 400
+        backups = list_backups(device)
+        if len(backups) < 2:
+            logger.error("Device '%s' has fewer than two stored backups", device)
+            return jsonify({"error": "Device has fewer than two stored backups"}), 404
+        from_id, to_id = backups[1]['backup_id'], backups[0]['backup_id']
+    old, new = load_backup(from_id), load_backup(to_id)
+    if old is None or new is None:
+        logger.error("Backup %s or %s not found", from_id, to_id)
+        return jsonify({"error": "Backup not found"}), 404
+
+    etag = f"backup-diff-{old['root']}-{new['root']}"
+    if not_modified(etag):
+        return not_modified_response(etag)
+    started = time.perf_counter()
+    sections, compared = diff_backups(old['root'], new['root'])
+    summary = {}
+    for section in sections:
+        counts = summary.setdefault(section['kind'], {'added': 0, 'removed': 0, 'changed': 0, 'moved': 0})
+        for key in counts:
+            counts[key] += len(section[key])
+    return with_validators(jsonify({
+        "status": "success",
+        "from": old,
+        "to": new,
+        "identical": old['root'] == new['root'],
+        "summary": summary,
+        "sections": sections,
+        "compared": compared,
+        "took_ms": round(1000 * (time.perf_counter() - started), 2)
+    }), etag)
+
+# Background parse jobs. Parsing is CPU-bound regex work that holds the GIL, so jobs run
+# in a small process pool; workers send progress over a queue that a thread in this
+# process drains into the parse_jobs table, where every app worker can read it.
+_parse_pool = {'executor': None, 'queue': None, 'pending': 0}
+_parse_pool_lock = threading.Lock()
+_worker_progress_queue = None
+
+def _parse_worker_init(progress_queue):
+    global _worker_progress_queue
+    _worker_progress_queue = progress_queue
+
+def _run_parse_job(job_id, content):
+    last_sent = [0.0]
+
+    def progress(update):
+        now = time.monotonic()
+        if now - last_sent[0] >= PARSE_PROGRESS_INTERVAL:
+            last_sent[0] = now
+            _worker_progress_queue.put((job_id, update))
+
+    timings = {}
+    response = parse_config_content(content, progress, timings)
+    return response, timings
+
+def _drain_parse_progress(progress_queue):
+    while True:
+        item = progress_queue.get()
+        # None: the pool owning this queue was replaced
+        if item is None:
+            return
+        job_id, progress = item
+        try:
+            update_parse_job(job_id, 'running', progress=progress)
+        except Exception as e:
+            parse_logger.warning("Failed to record progress for parse job %s: %s", job_id, e)
+
+def _get_parse_executor():
+    with _parse_pool_lock:
+        if _parse_pool['executor'] is None:
+            start_method = 'fork' if 'fork' in multiprocessing.get_all_start_methods() else 'spawn'
+            context = multiprocessing.get_context(start_method)
+            _parse_pool['queue'] = context.Queue()
+            _parse_pool['executor'] = ProcessPoolExecutor(max_workers=app.config['PARSE_WORKERS'], mp_context=context,
+                                                          initializer=_parse_worker_init,
+                                                          initargs=(_parse_pool['queue'],))
+            threading.Thread(target=_drain_parse_progress, args=(_parse_pool['queue'],),
+                             name='parse-progress', daemon=True).start()
+            parse_logger.info("Started parse pool with %d %s workers", app.config['PARSE_WORKERS'], start_method)
+        return _parse_pool['executor']
+
+# A worker that dies (e.g. killed for memory) breaks the whole pool, and every later
+# submit would fail; drop it so the next submit starts a new one
+def _discard_parse_executor(executor):
+    with _parse_pool_lock:
+        if _parse_pool['executor'] is not executor:
+            return
+        _parse_pool['executor'] = None
+        _parse_pool['queue'].put(None)
+        _parse_pool['queue'] = None
+    parse_logger.warning("Parse pool is broken; a new one starts with the next job")
+    executor.shutdown(wait=False, cancel_futures=True)
+
+# (executor, future) of a parse job
+def _submit_parse_work(job_id, content):
+    executor = _get_parse_executor()
+    try:
+        return executor, executor.submit(_run_parse_job, job_id, content)
+    except BrokenProcessPool:
+        _discard_parse_executor(executor)
+        executor = _get_parse_executor()
+        return executor, executor.submit(_run_parse_job, job_id, content)
+
+@timed_query
+def create_parse_job(job_id, device, bytes_total):
+    now = datetime.now(timezone.utc).isoformat()
+    progress = {'stage': 'queued', 'bytes_processed': 0, 'bytes_total': bytes_total, 'sections_processed': 0}
+    conn = sqlite3.connect(app.config['DB_PATH'])
+    cursor = conn.cursor()
+    cursor.execute('''
+        INSERT INTO parse_jobs (job_id, device, status, progress, created_at, updated_at)
+        VALUES (?, ?, 'queued', ?, ?, ?)
+    ''', (job_id, device, json.dumps(progress), now, now))
+    conn.commit()
+    conn.close()
+
+@timed_query
+def update_parse_job(job_id, status, progress=None, result=None, error=None):
+    conn = sqlite3.connect(app.config['DB_PATH'])
+    cursor = conn.cursor()
+    if status == 'running':
+        # Progress arrives asynchronously; never let a late update undo completion
+        cursor.execute('''
+            UPDATE parse_jobs SET status = ?, progress = ?, updated_at = ?
+            WHERE job_id = ? AND status IN ('queued', 'running')
+        ''', (status, json.dumps(progress), datetime.now(timezone.utc).isoformat(), job_id))
+    else:
+        cursor.execute('''
+            UPDATE parse_jobs SET status = ?, progress = COALESCE(?, progress), result = ?, error = ?, updated_at = ?
+            WHERE job_id = ?
+        ''', (status, json.dumps(progress) if progress is not None else None,
+              json.dumps(result) if result is not None else None, error,
+              datetime.now(timezone.utc).isoformat(), job_id))
+    conn.commit()
+    conn.close()
+
+# Jobs left queued or running by an earlier process can never finish. Skipped while this
+# process has jobs of its own in flight, as when create_app is called again.
+@timed_query
+def fail_interrupted_parse_jobs():
+    with _parse_pool_lock:
+        if _parse_pool['pending']:
+            return
+    conn = sqlite3.connect(app.config['DB_PATH'])
+    cursor = conn.cursor()
+    cursor.execute('''
+        UPDATE parse_jobs SET status = 'failed', error = 'Interrupted by a restart', updated_at = ?
+        WHERE status IN ('queued', 'running')
+    ''', (datetime.now(timezone.utc).isoformat(),))
+    failed = cursor.rowcount
+    conn.commit()
+    conn.close()
+    if failed:
+        parse_logger.warning("Marked %d interrupted parse jobs as failed", failed)
+
+# Fail a queued or running job that has not been updated since `updated_at`, which a
+# live job would have done long before PARSE_JOB_STALE_SECONDS passed
+@timed_query
+def fail_stale_parse_job(job_id, updated_at):
+    conn = sqlite3.connect(app.config['DB_PATH'])
+    cursor = conn.cursor()
+    cursor.execute('''
+        UPDATE parse_jobs SET status = 'failed', error = 'Parse job stalled', updated_at = ?
+        WHERE job_id = ? AND status IN ('queued', 'running') AND updated_at = ?
+    ''', (datetime.now(timezone.utc).isoformat(), job_id, updated_at))
+    conn.commit()
+    conn.close()
+
+@timed_query
+def load_parse_job(job_id):
+    conn = sqlite3.connect(app.config['DB_PATH'])
+    cursor = conn.cursor()
+    cursor.execute('''
+        SELECT job_id, device, status, progress, result, error, created_at, updated_at
+        FROM parse_jobs WHERE job_id = ?
+    ''', (job_id,))
+    row = cursor.fetchone()
+    conn.close()
+    if not row:
+        return None
+    job_id, device, status, progress, result, error, created_at, updated_at = row
+    return {
+        'job_id': job_id,
+        'device': device,
+        'status': status,
+        'progress': json.loads(progress) if progress else None,
+        'result': json.loads(result) if result else None,
+        'error': error,
+        'created_at': created_at,
+        'updated_at': updated_at
+    }
+
+def _finish_parse_job(job_id, device, content, executor, future):
+    bytes_total = len(content)
+    with _parse_pool_lock:
+        _parse_pool['pending'] -= 1
+    try:
+        response, timings = future.result()
+        record_parse_metrics(bytes_total, timings, response)
+        save_device_config(device, response)
+        schedule_drift_check(device)
+        schedule_backup_snapshot(device, content)
+        update_parse_job(job_id, 'done',
+                         progress={'stage': 'done', 'bytes_processed': bytes_total, 'bytes_total': bytes_total,
+                                   'sections_processed': None},
+                         result={'device': device, 'counts': {key: len(value) for key, value in response.items()}})
+        parse_logger.debug("Parse job %s for device '%s' finished", job_id, device)
+    except BrokenProcessPool as e:
+        parse_logger.error("Parse job %s for device '%s' lost its worker: %s", job_id, device, e)
+        update_parse_job(job_id, 'failed', error='Parse worker stopped unexpectedly')
+        _discard_parse_executor(executor)
+    except Exception as e:
+        parse_logger.error("Parse job %s for device '%s' failed: %s", job_id, device, e, exc_info=True)
+        update_parse_job(job_id, 'failed', error=str(e))
+
+@app.route('/parse_jobs', methods=['POST'])
+def submit_parse_job():
+    parse_logger.debug("Received request to submit parse job")
+    if 'config_file' not in request.files:
+        parse_logger.error("No file loaded")
+        return jsonify({"error": "No file uploaded"}), 400
+
+    with _parse_pool_lock:
+        if _parse_pool['pending'] >= app.config['PARSE_WORKERS'] + app.config['PARSE_QUEUE_LIMIT']:
+            parse_logger.warning("Parse queue is full (%d jobs pending)", _parse_pool['pending'])
+            return jsonify({"error": "Parse queue is full, try again later"}), 503
+        _parse_pool['pending'] += 1
+
+    try:
+        file = request.files['config_file']
+        content = read_uploaded_config(file)
+        device = detect_device_name(content, file.filename, request.form.get('device', ''))
+        job_id = uuid.uuid4().hex
+        create_parse_job(job_id, device, len(content))
+        executor, future = _submit_parse_work(job_id, content)
+    except Exception:
+        with _parse_pool_lock:
+            _parse_pool['pending'] -= 1
+        raise
+    future.add_done_callback(lambda f: _finish_parse_job(job_id, device, content, executor, f))
+    parse_logger.debug("Queued parse job %s for device '%s'", job_id, device)
+    return jsonify({
+        "status": "queued",
+        "job_id": job_id,
+        "device": device,
+        "status_url": f"/parse_jobs/{job_id}",
+        "events_url": f"/parse_jobs/{job_id}/events"
+    }), 202
+
+@app.route('/parse_jobs/<job_id>', methods=['GET'])
+def get_parse_job(job_id):
+    job = load_parse_job(job_id)
+    if not job:
+        parse_logger.error("Parse job '%s' not found", job_id)
+        return jsonify({"error": "Parse job not found"}), 404
+    return jsonify(job)
+
+# Server-sent events stream of a job's state, ending once the job is done or failed; a job
+# not updated for PARSE_JOB_STALE_SECONDS is marked failed first
+@app.route('/parse_jobs/<job_id>/events', methods=['GET'])
+def stream_parse_job(job_id):
+    if not load_parse_job(job_id):
+        parse_logger.error("Parse job '%s' not found", job_id)
+        return jsonify({"error": "Parse job not found"}), 404
+
+    def events():
+        last_update = None
+        while True:
+            job = load_parse_job(job_id)
+            if job['updated_at'] != last_update:
+                last_update = job['updated_at']
+                yield f"data: {json.dumps(job)}\n\n"
+            if job['status'] in ('done', 'failed'):
+                return
+            idle = datetime.now(timezone.utc) - datetime.fromisoformat(job['updated_at'])
+            if idle.total_seconds() > app.config['PARSE_JOB_STALE_SECONDS']:
+                parse_logger.warning("Parse job %s not updated for %.0f s; marking it failed", job_id, idle.total_seconds())
+                fail_stale_parse_job(job_id, job['updated_at'])
+                continue
+            time.sleep(PARSE_PROGRESS_INTERVAL)
+
+    return Response(events(), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
 
 if __name__ == '__main__':
+    create_app()
     logger.info("Starting Flask application on host 0.0.0.0, port 5000")
     app.run(host='0.0.0.0', port=5000, debug=False)
\ No newline at end of file
@@ -0,0 +1,112 @@
+# bench_logging.py
+# Compares parse_config and generate_policy throughput with logging off (the INFO default),
+# with every component at DEBUG (per-object events sampled), and at DEBUG without sampling,
+# which is roughly how the app used to run. Log output is discarded, but the time taken to
+# drain the log queue is included.
+#
+# Usage: python benchmarks/bench_logging.py --objects 5000 --policies 200
+import argparse
+import json
+import logging
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('TRUSTED_DOMAIN', 'example.com')
+os.environ['DB_PATH'] = os.path.join(tempfile.mkdtemp(prefix='fgt-bench-'), 'database.db')
+
+import app  # noqa: E402
+from bench_revisions import make_policy  # noqa: E402
+
+MODES = {
+    'off': (logging.INFO, app.LOG_SAMPLE_EVERY),
+    'debug_sampled': (logging.DEBUG, app.LOG_SAMPLE_EVERY),
+    'debug_unsampled': (logging.DEBUG, 1)
+}
+
+
+def make_config_text(objects):
+    lines = ['config system global', '    set hostname "FGT-BENCH"', 'end', 'config system interface']
+    for i in range(8):
+        lines += [f'    edit "port{i}"', '        set vdom "root"', '    next']
+    lines += ['end', 'config firewall address']
+    for i in range(objects):
+        lines += [f'    edit "host-{i}"', f'        set subnet 10.{i // 65536 % 256}.{i // 256 % 256}.{i % 256} 255.255.255.255', '    next']
+    lines += ['end', 'config firewall service custom']
+    for i in range(objects // 10):
+        lines += [f'    edit "svc-{i}"', f'        set tcp-portrange {1024 + i % 60000}', '    next']
+    lines += ['end', 'config firewall policy']
+    for i in range(objects // 10):
+        lines += [f'    edit {i + 1}', f'        set srcaddr "host-{i}"', '        set dstaddr "all"',
+                  f'        set service "svc-{i}"', '    next']
+    lines.append('end')
+    return '\n'.join(lines) + '\n'
+
+
+def set_mode(mode):
+    level, sample_every = MODES[mode]
+    logging.getLogger('fgc').setLevel(level)
+    for name in ('fgc.http', 'fgc.parse', 'fgc.parse.objects', 'fgc.generate', 'fgc.payload', 'fgc.frontend'):
+        logging.getLogger(name).setLevel(logging.NOTSET)
+    for log_filter in app.object_logger.filters:
+        if isinstance(log_filter, app.SamplingFilter):
+            log_filter.every = sample_every
+
+
+def drain_log_queue():
+    while not app._log_state['queue'].empty():
+        time.sleep(0.001)
+
+
+def timed(func, repeat):
+    times = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        drain_log_queue()
+        times.append(time.perf_counter() - started)
+    return min(times)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Logging overhead benchmark')
+    parser.add_argument('--objects', type=int, default=5000)
+    parser.add_argument('--policies', type=int, default=200)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    app.create_app()
+    # Discard log output; formatting and queueing still happen
+    for handler in app._log_state['listener'].handlers:
+        handler.setStream(open(os.devnull, 'w'))
+
+    content = make_config_text(args.objects)
+    line_count = content.count('\n')
+    policies = json.dumps([make_policy(i) for i in range(args.policies)])
+    client = app.app.test_client()
+
+    def generate():
+        response = client.post('/generate_policy', data={'policies': policies})
+        assert response.status_code == 200, response.status_code
+
+    result = {'config_lines': line_count, 'policies': args.policies}
+    for mode in MODES:
+        set_mode(mode)
+        parse_seconds = timed(lambda: app.parse_config_content(content), args.repeat)
+        generate_seconds = timed(generate, args.repeat)
+        result[mode] = {
+            'parse_ms': round(1000 * parse_seconds, 1),
+            'parse_lines_per_s': round(line_count / parse_seconds),
+            'generate_ms': round(1000 * generate_seconds, 1),
+            'generate_policies_per_s': round(args.policies / generate_seconds, 1)
+        }
+    set_mode('off')
+    result['parse_speedup_vs_unsampled'] = round(result['debug_unsampled']['parse_ms'] / result['off']['parse_ms'], 1)
+    result['generate_speedup_vs_unsampled'] = round(result['debug_unsampled']['generate_ms'] / result['off']['generate_ms'], 1)
+    print(json.dumps(result, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,108 @@
+# bench_revisions.py
+# Measures database growth and reconstruction latency of template revision history.
+#
+# Usage: python benchmarks/bench_revisions.py --policies 2000 --revisions 50
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+import uuid
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('TRUSTED_DOMAIN', 'example.com')
+os.environ['DB_PATH'] = os.path.join(tempfile.mkdtemp(prefix='fgt-bench-'), 'database.db')
+
+import app  # noqa: E402
+
+
+def make_policy(index):
+    return {
+        'policy_id': str(uuid.uuid4()),
+        'policy_name': f'policy-{index}',
+        'policy_comment': f'synthetic policy {index}',
+        'src_interfaces': [f'port{index % 8}'],
+        'dst_interfaces': ['wan1'],
+        'src_addresses': [f'net-{index}', f'net-{index + 1}'],
+        'src_address_groups': [],
+        'src_internet_services': [],
+        'src_vips': [],
+        'dst_addresses': ['all'],
+        'dst_address_groups': [f'grp-{index % 50}'],
+        'dst_internet_services': [],
+        'dst_vips': [],
+        'services': [{'type': 'template', 'name': 'HTTPS'}, {'type': 'custom', 'name': f'app{index}', 'protocol': 'TCP', 'port': str(8000 + index % 1000)}],
+        'action': 'accept',
+        'inspection_mode': 'flow',
+        'ssl_ssh_profile': 'certificate-inspection',
+        'webfilter_profile': 'default',
+        'webfilter_enabled': True,
+        'av_profile': '',
+        'av_enabled': False,
+        'application_list': 'default',
+        'application_list_enabled': True,
+        'ips_sensor': 'default',
+        'ips_sensor_enabled': True,
+        'logtraffic': 'all',
+        'logtraffic_start': 'enable',
+        'auto_asic_offload': 'enable',
+        'nat': 'disable',
+        'ip_pool': '',
+        'users': [],
+        'groups': []
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Template revision history benchmark')
+    parser.add_argument('--policies', type=int, default=2000)
+    parser.add_argument('--revisions', type=int, default=50)
+    parser.add_argument('--edits', type=int, default=3, help='policies changed per revision')
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    app.init_db()
+    template = {'policies': [make_policy(i) for i in range(args.policies)]}
+    full_copy_bytes = 0
+
+    save_times = []
+    for rev in range(args.revisions):
+        for _ in range(args.edits):
+            policy = random.choice(template['policies'])
+            policy['policy_comment'] = f'edited in revision {rev}'
+        if rev % 10 == 5:
+            template['policies'].append(make_policy(args.policies + rev))
+        full_copy_bytes += len(json.dumps(template))
+        started = time.perf_counter()
+        app.save_template_to_db('bench', template)
+        save_times.append(time.perf_counter() - started)
+
+    revisions = app.list_template_revisions('bench')
+    stored_bytes = sum(r['stored_bytes'] for r in revisions)
+
+    reconstruct_times = []
+    for r in revisions:
+        started = time.perf_counter()
+        app.load_template_revision('bench', r['revision'])
+        reconstruct_times.append(time.perf_counter() - started)
+
+    result = {
+        'policies': args.policies,
+        'revisions': len(revisions),
+        'full_revisions': sum(1 for r in revisions if r['kind'] == 'full'),
+        'full_copy_bytes': full_copy_bytes,
+        'stored_revision_bytes': stored_bytes,
+        'compression_ratio': round(full_copy_bytes / stored_bytes, 1) if stored_bytes else None,
+        'db_file_bytes': os.path.getsize(app.app.config['DB_PATH']),
+        'save_ms_avg': round(1000 * sum(save_times) / len(save_times), 2),
+        'reconstruct_ms_avg': round(1000 * sum(reconstruct_times) / len(reconstruct_times), 2),
+        'reconstruct_ms_max': round(1000 * max(reconstruct_times), 2)
+    }
+    print(json.dumps(result, indent=2))
+
+
+if __name__ == '__main__':
+    main()
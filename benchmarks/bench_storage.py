@@ -0,0 +1,98 @@
+# bench_storage.py
+# Compares on-disk size and decode time of the compact storage encoding against plain JSON
+# for a large template and a large parsed config.
+#
+# Usage: python benchmarks/bench_storage.py --policies 5000 --objects 50000
+import argparse
+import json
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('TRUSTED_DOMAIN', 'example.com')
+os.environ['DB_PATH'] = os.path.join(tempfile.mkdtemp(prefix='fgt-bench-'), 'database.db')
+
+import app  # noqa: E402
+from bench_revisions import make_policy  # noqa: E402
+
+
+def make_parsed_config(objects):
+    return {
+        'interfaces': [f'port{i}' for i in range(max(objects // 500, 4))],
+        'addresses': [f'host-10.{i // 65536 % 256}.{i // 256 % 256}.{i % 256}' for i in range(objects)],
+        'address_groups': [f'grp-{i}' for i in range(objects // 20)],
+        'internet_services': [f'Service-{i}' for i in range(objects // 50)],
+        'vips': [f'vip-{i}' for i in range(objects // 100)],
+        'ip_pools': [f'pool-{i}' for i in range(objects // 1000 + 1)],
+        'services': [{'name': f'svc-{i}', 'protocol': 'TCP', 'port': str(1024 + i % 60000)} for i in range(objects // 10)],
+        'service_groups': {f'sgrp-{i}': [f'svc-{i}', f'svc-{i + 1}'] for i in range(objects // 100)},
+        'ssl_ssh_profiles': ['certificate-inspection', 'deep-inspection'],
+        'webfilter_profiles': ['default'],
+        'av_profiles': ['default'],
+        'application_lists': ['default'],
+        'ips_sensors': ['default'],
+        'users': [f'user{i}' for i in range(objects // 100)],
+        'groups': [f'group{i}' for i in range(objects // 1000 + 1)]
+    }
+
+
+def measure(document, repeat):
+    legacy = json.dumps(document)
+    compact = app.encode_document(document)
+    assert app.decode_document(compact) == document
+
+    def timed(fn, value):
+        started = time.perf_counter()
+        for _ in range(repeat):
+            fn(value)
+        return round(1000 * (time.perf_counter() - started) / repeat, 2)
+
+    def store(value):
+        path = os.path.join(tempfile.mkdtemp(prefix='fgt-bench-'), 'size.db')
+        conn = sqlite3.connect(path)
+        conn.execute('CREATE TABLE t (data TEXT NOT NULL)')
+        conn.execute('INSERT INTO t (data) VALUES (?)', (value,))
+        conn.commit()
+        conn.close()
+        return path
+
+    def read_and_decode(path, decode):
+        conn = sqlite3.connect(path)
+        decode(conn.execute('SELECT data FROM t').fetchone()[0])
+        conn.close()
+
+    legacy_path = store(legacy)
+    compact_path = store(compact)
+    return {
+        'json_bytes': len(legacy.encode('utf-8')),
+        'compact_bytes': len(compact),
+        'json_db_file_bytes': os.path.getsize(legacy_path),
+        'compact_db_file_bytes': os.path.getsize(compact_path),
+        'json_decode_ms': timed(json.loads, legacy),
+        'compact_decode_ms': timed(app.decode_document, compact),
+        'json_db_read_decode_ms': timed(lambda path: read_and_decode(path, json.loads), legacy_path),
+        'compact_db_read_decode_ms': timed(lambda path: read_and_decode(path, app.decode_document), compact_path),
+        'json_encode_ms': timed(json.dumps, document),
+        'compact_encode_ms': timed(app.encode_document, document)
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Storage encoding benchmark')
+    parser.add_argument('--policies', type=int, default=5000)
+    parser.add_argument('--objects', type=int, default=50000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    result = {
+        'template': dict(policies=args.policies, **measure({'policies': [make_policy(i) for i in range(args.policies)]}, args.repeat)),
+        'parsed_config': dict(objects=args.objects, **measure(make_parsed_config(args.objects), args.repeat))
+    }
+    print(json.dumps(result, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,217 @@
+# bench_suite.py
+# Reproducible benchmark suite over synthetic FortiOS configs: parse_config (function and
+# endpoint), generate_policy (a batch of policies and the cartesian output3 case), template
+# CRUD and short URL redirects. Results are JSON; pass --baseline with an earlier result
+# file to add the relative change of every timing.
+#
+# Usage: python benchmarks/bench_suite.py --sizes 1000,10000,100000 --vdoms 2 --output results.json
+#        python benchmarks/bench_suite.py --sizes 1000000 --only parse
+import argparse
+import io
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# The test client talks to http://localhost/, which short URLs must belong to
+os.environ['TRUSTED_DOMAIN'] = 'localhost'
+os.environ['DB_PATH'] = os.path.join(tempfile.mkdtemp(prefix='fgt-bench-'), 'database.db')
+
+import app  # noqa: E402
+from bench_revisions import make_policy  # noqa: E402
+from fortigate_config import generate_config  # noqa: E402
+
+BENCHMARKS = ('parse', 'generate', 'crud', 'short_urls')
+
+
+def summarize(seconds):
+    ordered = sorted(seconds)
+    return {
+        'runs': len(ordered),
+        'min_ms': round(1000 * ordered[0], 2),
+        'p50_ms': round(1000 * ordered[len(ordered) // 2], 2),
+        'p95_ms': round(1000 * ordered[min(int(len(ordered) * 0.95), len(ordered) - 1)], 2),
+        'mean_ms': round(1000 * sum(ordered) / len(ordered), 2)
+    }
+
+
+def timed(func):
+    started = time.perf_counter()
+    result = func()
+    return time.perf_counter() - started, result
+
+
+def bench_parse(client, sizes, vdoms, repeat):
+    results = {}
+    for size in sizes:
+        content = generate_config(size, vdoms)
+        lines = content.count('\n')
+        parse_times = [timed(lambda: app.parse_config_content(content))[0] for _ in range(repeat)]
+        response_times = []
+        for _ in range(repeat):
+            upload = {'config_file': (io.BytesIO(content.encode('utf-8')), 'bench.conf')}
+            elapsed, response = timed(lambda: client.post('/parse_config', data=upload))
+            assert response.status_code == 200, response.status_code
+            response_times.append(elapsed)
+        results[str(size)] = {
+            'lines': lines,
+            'bytes': len(content),
+            'objects': sum(len(value) for value in response.json.values() if isinstance(value, (list, dict))),
+            'function': summarize(parse_times),
+            'endpoint': summarize(response_times),
+            'lines_per_s': round(lines / min(parse_times))
+        }
+    return results
+
+
+def cartesian_policy(interfaces, services):
+    policy = make_policy(0)
+    policy['src_interfaces'] = [f'port{i}' for i in range(interfaces)]
+    policy['dst_interfaces'] = [f'wan{i}' for i in range(interfaces)]
+    policy['services'] = [{'type': 'template', 'name': f'SVC{i}'} for i in range(services)]
+    return policy
+
+
+def bench_generate(client, policies, cartesian, repeat):
+    results = {}
+    cases = {
+        'batch': [make_policy(i) for i in range(policies)],
+        'cartesian': [cartesian_policy(cartesian, cartesian)]
+    }
+    for case, payload in cases.items():
+        form = {'policies': json.dumps(payload)}
+        times = []
+        for _ in range(repeat):
+            elapsed, response = timed(lambda: client.post('/generate_policy', data=form))
+            assert response.status_code == 200, response.status_code
+            times.append(elapsed)
+        outputs = response.json['outputs']
+        results[case] = {
+            'policies': len(payload),
+            'output3_policies': sum(output['output3'].count('edit 0') for output in outputs),
+            'output_bytes': sum(len(output[key]) for output in outputs for key in ('output1', 'output2', 'output3')),
+            **summarize(times)
+        }
+    return results
+
+
+def bench_crud(client, templates, policies):
+    times = {op: [] for op in ('save', 'load_list', 'get', 'revalidate', 'update', 'rename', 'clone', 'delete')}
+    policy_list = json.dumps([make_policy(i) for i in range(policies)])
+    names = [f'bench-{i}' for i in range(templates)]
+
+    def record(op, func, expected=200):
+        elapsed, response = timed(func)
+        assert response.status_code == expected, (op, response.status_code)
+        times[op].append(elapsed)
+        return response
+
+    for name in names:
+        record('save', lambda: client.post('/save_template', data={'template_name': name, 'policies': policy_list}))
+    for name in names:
+        record('load_list', lambda: client.get('/load_templates'))
+        etag = record('get', lambda: client.get(f'/get_template/{name}')).headers['ETag']
+        record('revalidate', lambda: client.get(f'/get_template/{name}', headers={'If-None-Match': etag}), 304)
+        record('update', lambda: client.post('/save_template', data={'template_name': name, 'policies': policy_list}))
+    for i, name in enumerate(names):
+        record('rename', lambda: client.post('/rename_template', json={'old_name': name, 'new_name': f'renamed-{i}'}))
+        names[i] = f'renamed-{i}'
+    clones = [record('clone', lambda: client.post(f'/clone_template/{name}')).json['new_template_name'] for name in names]
+    for name in names + clones:
+        record('delete', lambda: client.delete(f'/delete_template/{name}'))
+    return {'templates': templates, 'policies_per_template': policies,
+            **{op: summarize(op_times) for op, op_times in times.items()}}
+
+
+def bench_short_urls(client, count, redirects):
+    policy_list = json.dumps([make_policy(0)])
+    shorten_times = []
+    codes = []
+    for i in range(count):
+        client.post('/save_template', data={'template_name': f'short-{i}', 'policies': policy_list})
+        elapsed, response = timed(lambda: client.post('/shorten_url', json={'url': f'/get_template/short-{i}'}))
+        assert response.status_code == 200, response.status_code
+        shorten_times.append(elapsed)
+        codes.append(response.json['short_code'])
+    redirect_times = []
+    for i in range(redirects):
+        elapsed, response = timed(lambda: client.get(f'/s/{codes[i % len(codes)]}'))
+        assert response.status_code == 200, response.status_code
+        redirect_times.append(elapsed)
+    return {'short_urls': count, 'shorten': summarize(shorten_times), 'redirect': summarize(redirect_times)}
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__)), check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+# Relative change of every *_ms timing against the same path in a baseline result
+def compare(result, baseline, path=''):
+    changes = {}
+    for key, value in result.items():
+        other = baseline.get(key) if isinstance(baseline, dict) else None
+        if isinstance(value, dict):
+            changes.update(compare(value, other, f'{path}{key}.'))
+        elif key.endswith('_ms') and isinstance(other, (int, float)) and other:
+            changes[f'{path}{key}'] = f'{100 * (value - other) / other:+.1f}%'
+    return changes
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark suite')
+    parser.add_argument('--sizes', default='1000,10000,100000', help='config sizes in lines')
+    parser.add_argument('--vdoms', type=int, default=1)
+    parser.add_argument('--policies', type=int, default=200, help='policies in the generate batch and templates')
+    parser.add_argument('--cartesian', type=int, default=16, help='src/dst interfaces and services of the output3 case')
+    parser.add_argument('--templates', type=int, default=50)
+    parser.add_argument('--short-urls', type=int, default=200)
+    parser.add_argument('--redirects', type=int, default=1000)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--only', default=','.join(BENCHMARKS), help='comma separated subset of ' + ', '.join(BENCHMARKS))
+    parser.add_argument('--output', help='write results to this file instead of stdout')
+    parser.add_argument('--baseline', help='earlier result file to compare against')
+    args = parser.parse_args()
+
+    app.create_app()
+    client = app.app.test_client()
+    selected = [name for name in args.only.split(',') if name]
+    result = {
+        'meta': {
+            'timestamp': datetime.now(timezone.utc).isoformat(),
+            'commit': git_commit(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'args': vars(args)
+        }
+    }
+    if 'parse' in selected:
+        result['parse'] = bench_parse(client, [int(size) for size in args.sizes.split(',')], args.vdoms, args.repeat)
+    if 'generate' in selected:
+        result['generate'] = bench_generate(client, args.policies, args.cartesian, args.repeat)
+    if 'crud' in selected:
+        result['crud'] = bench_crud(client, args.templates, args.policies)
+    if 'short_urls' in selected:
+        result['short_urls'] = bench_short_urls(client, args.short_urls, args.redirects)
+    if args.baseline:
+        with open(args.baseline) as f:
+            result['change_vs_baseline'] = compare(result, json.load(f))
+
+    output = json.dumps(result, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output + '\n')
+    else:
+        print(output)
+
+
+if __name__ == '__main__':
+    main()
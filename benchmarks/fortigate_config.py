@@ -0,0 +1,180 @@
+# fortigate_config.py
+# Deterministic generator of synthetic FortiOS configuration backups for benchmarks.
+# The same (lines, vdoms, seed) always produces byte-identical output.
+#
+# Usage: python benchmarks/fortigate_config.py --lines 100000 --vdoms 3 > bench.conf
+import argparse
+import random
+import sys
+
+# Share of the line budget spent on each object table, and the lines one object takes
+SECTION_SHARES = {
+    'address': (0.30, 5),
+    'addrgrp': (0.06, 4),
+    'vip': (0.04, 6),
+    'ippool': (0.01, 5),
+    'service': (0.08, 5),
+    'service_group': (0.03, 3),
+    'user': (0.02, 5),
+    'user_group': (0.01, 3),
+    'policy': (0.45, 18)
+}
+PROFILES = {
+    'firewall ssl-ssh-profile': ['certificate-inspection', 'deep-inspection', 'no-inspection'],
+    'webfilter profile': ['default', 'monitor-all', 'strict'],
+    'antivirus profile': ['default', 'wifi-default'],
+    'application list': ['default', 'block-high-risk', 'monitor-all'],
+    'ips sensor': ['default', 'high_security', 'protect_client']
+}
+INTERFACES_PER_VDOM = 8
+VDOM_BASE_LINES = 60
+
+
+def _ip(index, base=10):
+    return f'{base}.{index // 65536 % 256}.{index // 256 % 256}.{index % 256}'
+
+
+def _quoted(names):
+    return ' '.join(f'"{name}"' for name in names)
+
+
+def object_counts(lines, vdoms):
+    budget = max(lines - VDOM_BASE_LINES * vdoms - 20 * INTERFACES_PER_VDOM * vdoms, 0)
+    return {kind: max(int(budget * share / per_object / vdoms), 1) for kind, (share, per_object) in SECTION_SHARES.items()}
+
+
+def _interfaces(vdom_names):
+    out = ['config system interface']
+    for v, vdom in enumerate(vdom_names):
+        for i in range(INTERFACES_PER_VDOM):
+            out += [
+                f'    edit "{vdom}-port{i + 1}"' if v else f'    edit "port{i + 1}"',
+                f'        set vdom "{vdom}"',
+                f'        set ip {_ip(v * 256 + i, 172)} 255.255.255.0',
+                '        set allowaccess ping https ssh',
+                '        set type physical',
+                f'        set alias "{vdom}-link{i + 1}"',
+                '        set role lan' if i else '        set role wan',
+                '    next'
+            ]
+    out.append('end')
+    return out
+
+
+def _vdom_objects(rng, vdom, v, counts, interfaces):
+    prefix = f'{vdom}-' if v else ''
+    addresses = [f'{prefix}host-{_ip(i)}' for i in range(counts['address'])]
+    groups = [f'{prefix}grp-{i}' for i in range(counts['addrgrp'])]
+    vips = [f'{prefix}vip-{i}' for i in range(counts['vip'])]
+    pools = [f'{prefix}pool-{i}' for i in range(counts['ippool'])]
+    services = [f'{prefix}svc-{i}' for i in range(counts['service'])]
+    service_groups = [f'{prefix}svcgrp-{i}' for i in range(counts['service_group'])]
+    users = [f'{prefix}user{i}' for i in range(counts['user'])]
+    user_groups = [f'{prefix}group{i}' for i in range(counts['user_group'])]
+
+    out = ['config firewall address']
+    for i, name in enumerate(addresses):
+        out += [f'    edit "{name}"', f'        set uuid {rng.getrandbits(128):032x}',
+                f'        set subnet {_ip(i)} 255.255.255.255', f'        set comment "synthetic {i}"', '    next']
+    out += ['end', 'config firewall addrgrp']
+    for name in groups:
+        out += [f'    edit "{name}"', f'        set member {_quoted(rng.sample(addresses, min(4, len(addresses))))}',
+                '        set comment "synthetic group"', '    next']
+    out += ['end', 'config firewall vip']
+    for i, name in enumerate(vips):
+        out += [f'    edit "{name}"', f'        set extip {_ip(i, 203)}', f'        set mappedip "{_ip(i, 192)}"',
+                f'        set extintf "{interfaces[0]}"', '        set portforward disable', '    next']
+    out += ['end', 'config firewall ippool']
+    for i, name in enumerate(pools):
+        out += [f'    edit "{name}"', f'        set startip {_ip(i, 198)}', f'        set endip {_ip(i, 198)}',
+                '        set type overload', '    next']
+    out += ['end', 'config firewall service custom']
+    for i, name in enumerate(services):
+        protocol = 'udp' if i % 5 == 0 else 'tcp'
+        out += [f'    edit "{name}"', '        set category "General"',
+                f'        set {protocol}-portrange {1024 + i % 60000}', '        set comment "synthetic service"', '    next']
+    out += ['end', 'config firewall service group']
+    for name in service_groups:
+        out += [f'    edit "{name}"', f'        set member {_quoted(rng.sample(services, min(3, len(services))))}', '    next']
+    out += ['end', 'config user local']
+    for name in users:
+        out += [f'    edit "{name}"', '        set type password',
+                f'        set passwd ENC {rng.getrandbits(256):064x}', '        set status enable', '    next']
+    out += ['end', 'config user group']
+    for name in user_groups:
+        out += [f'    edit "{name}"', f'        set member {_quoted(rng.sample(users, min(5, len(users))))}', '    next']
+    out.append('end')
+
+    for section, names in PROFILES.items():
+        out.append(f'config {section}')
+        for name in names:
+            out += [f'    edit "{name}"', '        set comment "synthetic profile"', '    next']
+        out.append('end')
+
+    out.append('config firewall policy')
+    for i in range(counts['policy']):
+        src, dst = rng.sample(interfaces, 2)
+        nat = i % 7 == 0 and pools
+        out += [
+            f'    edit {i + 1}',
+            f'        set name "{prefix}policy-{i}"',
+            f'        set uuid {rng.getrandbits(128):032x}',
+            f'        set srcintf "{src}"',
+            f'        set dstintf "{dst}"',
+            f'        set srcaddr {_quoted(rng.sample(addresses, min(2, len(addresses))))}',
+            f'        set dstaddr "{rng.choice(groups + vips)}"',
+            '        set action accept',
+            '        set schedule "always"',
+            f'        set service "{rng.choice(services + service_groups)}"',
+            '        set utm-status enable',
+            '        set ssl-ssh-profile "certificate-inspection"',
+            f'        set webfilter-profile "{rng.choice(PROFILES["webfilter profile"])}"',
+            f'        set application-list "{rng.choice(PROFILES["application list"])}"',
+            '        set logtraffic all',
+            '        set nat enable' if nat else '        set nat disable',
+            f'        set poolname "{rng.choice(pools)}"' if nat else f'        set comments "synthetic policy {i}"',
+            '    next'
+        ]
+    out.append('end')
+    return out
+
+
+# Synthetic backup of roughly `lines` lines. With vdoms > 1 it is laid out like a
+# multi-VDOM backup: global settings first, then one `config vdom` block per VDOM.
+def generate_config(lines=10000, vdoms=1, seed=0):
+    rng = random.Random(seed)
+    vdom_names = ['root'] + [f'vdom{v}' for v in range(1, vdoms)]
+    counts = object_counts(lines, vdoms)
+    multi_vdom = vdoms > 1
+
+    out = [f'#config-version=FG100F-7.2.8-FW-build1639-240313:opmode=0:vdom={int(multi_vdom)}:user=admin',
+           '#conf_file_ver=1', '#buildno=1639', '#global_vdom=1']
+    if multi_vdom:
+        out += ['config vdom'] + [line for name in vdom_names for line in (f'edit {name}', 'next')] + ['end', 'config global']
+    out += ['config system global', '    set alias "FG100F"', '    set hostname "FGT-BENCH"',
+            '    set timezone 28', '    set admintimeout 30', 'end']
+    out += _interfaces(vdom_names)
+    if multi_vdom:
+        out.append('end')
+
+    for v, vdom in enumerate(vdom_names):
+        interfaces = [f'{vdom}-port{i + 1}' if v else f'port{i + 1}' for i in range(INTERFACES_PER_VDOM)]
+        if multi_vdom:
+            out += ['config vdom', f'edit {vdom}']
+        out += _vdom_objects(rng, vdom, v, counts, interfaces)
+        if multi_vdom:
+            out.append('end')
+    return '\n'.join(out) + '\n'
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Synthetic FortiOS config generator')
+    parser.add_argument('--lines', type=int, default=10000)
+    parser.add_argument('--vdoms', type=int, default=1)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    sys.stdout.write(generate_config(args.lines, args.vdoms, args.seed))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,266 @@
+# loadtest.py
+# Load-test harness: many concurrent clients replay a weighted mix of requests and the run
+# reports throughput, p50/p95/p99 latency, status codes and error rates per request type.
+# The run fails (exit status 1) if any request got a 5xx response or raised.
+#
+# Targets:
+#   (default)        in-process Flask test clients, one per client thread
+#   --serve          a local threaded werkzeug server started in this process
+#   --url URL        an already running server, e.g. gunicorn with N workers, to size
+#                    worker counts; its TRUSTED_DOMAIN must match the URL's host
+#
+# Usage: python benchmarks/loadtest.py --clients 16 --duration 30 \
+#            --mix index=10,get_template=35,generate=20,parse=5,save=15,redirect=15
+import argparse
+import io
+import json
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timezone
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('TRUSTED_DOMAIN', 'localhost')
+os.environ.setdefault('DB_PATH', os.path.join(tempfile.mkdtemp(prefix='fgt-load-'), 'database.db'))
+
+from bench_revisions import make_policy  # noqa: E402
+from fortigate_config import generate_config  # noqa: E402
+
+DEFAULT_MIX = 'index=10,get_template=35,generate=20,parse=5,save=15,redirect=15'
+
+
+# The same calls over a Flask test client or over HTTP. Each returns (status, JSON body or None).
+class TestClientTarget:
+    def __init__(self, flask_app):
+        self.client = flask_app.test_client()
+
+    def request(self, method, path, form=None, files=None, payload=None):
+        data = dict(form or {})
+        for field, (filename, content) in (files or {}).items():
+            data[field] = (io.BytesIO(content), filename)
+        response = self.client.open(path, method=method, data=data or None, json=payload)
+        body = response.get_json(silent=True)
+        response.close()
+        return response.status_code, body
+
+
+class HttpTarget:
+    def __init__(self, base_url):
+        import requests
+        self.base_url = base_url.rstrip('/')
+        self.session = requests.Session()
+
+    def request(self, method, path, form=None, files=None, payload=None):
+        response = self.session.request(method, self.base_url + path, data=form, files=files, json=payload,
+                                        allow_redirects=False)
+        try:
+            body = response.json()
+        except ValueError:
+            body = None
+        return response.status_code, body
+
+
+def op_index(target, fixtures, rng):
+    return target.request('GET', '/')[0]
+
+
+def op_get_template(target, fixtures, rng):
+    return target.request('GET', f"/get_template/{rng.choice(fixtures['templates'])}")[0]
+
+
+def op_generate(target, fixtures, rng):
+    return target.request('POST', '/generate_policy', form={'policies': fixtures['policies']})[0]
+
+
+def op_parse(target, fixtures, rng):
+    return target.request('POST', '/parse_config', form={'device': 'load-test'},
+                          files={'config_file': ('load.conf', fixtures['config'])})[0]
+
+
+# Writes rotate over a small set of names so concurrent saves contend on the same rows
+def op_save(target, fixtures, rng):
+    name = f"load-write-{rng.randrange(fixtures['write_templates'])}"
+    return target.request('POST', '/save_template', form={'template_name': name, 'policies': fixtures['policies']})[0]
+
+
+def op_redirect(target, fixtures, rng):
+    return target.request('GET', f"/s/{rng.choice(fixtures['short_codes'])}")[0]
+
+
+OPERATIONS = {
+    'index': op_index,
+    'get_template': op_get_template,
+    'generate': op_generate,
+    'parse': op_parse,
+    'save': op_save,
+    'redirect': op_redirect
+}
+
+
+def parse_mix(spec):
+    mix = {}
+    for item in spec.split(','):
+        name, weight = item.split('=')
+        if name not in OPERATIONS:
+            raise SystemExit(f"Unknown operation '{name}'; choose from {', '.join(OPERATIONS)}")
+        mix[name] = float(weight)
+    return mix
+
+
+# Shared fixtures created before the run: templates to read, short codes to follow,
+# policies to generate from and a config to upload
+def seed(target, args):
+    policies = [make_policy(i) for i in range(args.policies)]
+    templates = [f'load-{i}' for i in range(args.templates)]
+    short_codes = []
+    for name in templates:
+        status, _ = target.request('POST', '/save_template', form={'template_name': name, 'policies': json.dumps(policies)})
+        if status != 200:
+            raise SystemExit(f'Seeding template {name} failed with status {status}')
+        status, body = target.request('POST', '/shorten_url', payload={'url': f'/get_template/{name}'})
+        if status == 200:
+            short_codes.append(body['short_code'])
+    return {
+        'templates': templates,
+        'short_codes': short_codes,
+        'write_templates': args.write_templates,
+        'policies': json.dumps(policies[:args.generate_policies]),
+        'config': generate_config(args.config_lines).encode('utf-8')
+    }
+
+
+def percentile(ordered, fraction):
+    return ordered[min(int(len(ordered) * fraction), len(ordered) - 1)]
+
+
+def is_server_error(status):
+    return status == 'exception' or int(status) >= 500
+
+
+def summarize(samples, elapsed):
+    latencies = sorted(latency for latency, _ in samples)
+    statuses = {}
+    for _, status in samples:
+        statuses[str(status)] = statuses.get(str(status), 0) + 1
+    errors = sum(count for status, count in statuses.items() if status == 'exception' or int(status) >= 400)
+    server_errors = sum(count for status, count in statuses.items() if is_server_error(status))
+    return {
+        'requests': len(samples),
+        'throughput_rps': round(len(samples) / elapsed, 1),
+        'p50_ms': round(1000 * percentile(latencies, 0.50), 2),
+        'p95_ms': round(1000 * percentile(latencies, 0.95), 2),
+        'p99_ms': round(1000 * percentile(latencies, 0.99), 2),
+        'max_ms': round(1000 * latencies[-1], 2),
+        'error_rate': round(errors / len(samples), 4),
+        'server_errors': server_errors,
+        'statuses': statuses
+    }
+
+
+def run_client(make_target, fixtures, mix, deadline, request_budget, seed_value, samples, lock):
+    target = make_target()
+    rng = random.Random(seed_value)
+    names = list(mix)
+    weights = [mix[name] for name in names]
+    local = []
+    while time.perf_counter() < deadline:
+        with lock:
+            if request_budget[0] <= 0:
+                break
+            request_budget[0] -= 1
+        name = rng.choices(names, weights)[0]
+        started = time.perf_counter()
+        try:
+            status = OPERATIONS[name](target, fixtures, rng)
+        except Exception:
+            status = 'exception'
+        local.append((name, time.perf_counter() - started, status))
+    with lock:
+        samples.extend(local)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Load-test harness')
+    parser.add_argument('--url', help='drive an already running server instead of the in-process app')
+    parser.add_argument('--serve', action='store_true', help='start a local threaded server and drive it over HTTP')
+    parser.add_argument('--clients', type=int, default=8)
+    parser.add_argument('--duration', type=float, default=20.0, help='seconds to run')
+    parser.add_argument('--requests', type=int, default=0, help='stop after this many requests (0: no limit)')
+    parser.add_argument('--mix', default=DEFAULT_MIX, help='comma separated op=weight pairs')
+    parser.add_argument('--templates', type=int, default=20)
+    parser.add_argument('--write-templates', type=int, default=4, help='templates the save operation rotates over')
+    parser.add_argument('--policies', type=int, default=50, help='policies per seeded template')
+    parser.add_argument('--generate-policies', type=int, default=10, help='policies per generate request')
+    parser.add_argument('--config-lines', type=int, default=5000, help='size of the config uploaded by parse')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--output', help='write results to this file instead of stdout')
+    args = parser.parse_args()
+
+    mix = parse_mix(args.mix)
+    server = None
+    if args.url:
+        base_url = args.url
+        make_target = lambda: HttpTarget(base_url)  # noqa: E731
+    else:
+        import app
+        app.create_app()
+        if args.serve:
+            from werkzeug.serving import make_server
+            server = make_server('127.0.0.1', 0, app.app, threaded=True)
+            # Short URLs must belong to TRUSTED_DOMAIN, which now includes the chosen port
+            app.app.config['TRUSTED_DOMAIN'] = f'127.0.0.1:{server.port}'
+            threading.Thread(target=server.serve_forever, daemon=True).start()
+            base_url = f'http://127.0.0.1:{server.port}'
+            make_target = lambda: HttpTarget(base_url)  # noqa: E731
+        else:
+            make_target = lambda: TestClientTarget(app.app)  # noqa: E731
+
+    fixtures = seed(make_target(), args)
+    if not fixtures['short_codes'] and mix.pop('redirect', None):
+        print('Short URLs could not be created (check TRUSTED_DOMAIN); redirects removed from the mix', file=sys.stderr)
+
+    samples = []
+    lock = threading.Lock()
+    request_budget = [args.requests or float('inf')]
+    started = time.perf_counter()
+    deadline = started + args.duration
+    clients = [threading.Thread(target=run_client, args=(make_target, fixtures, mix, deadline, request_budget,
+                                                         args.seed * 1000 + i, samples, lock))
+               for i in range(args.clients)]
+    for client in clients:
+        client.start()
+    for client in clients:
+        client.join()
+    elapsed = time.perf_counter() - started
+    if server is not None:
+        server.shutdown()
+
+    result = {
+        'meta': {
+            'timestamp': datetime.now(timezone.utc).isoformat(),
+            'target': args.url or ('local server' if args.serve else 'test client'),
+            'args': vars(args)
+        },
+        'elapsed_s': round(elapsed, 2),
+        'overall': summarize([(latency, status) for _, latency, status in samples], elapsed) if samples else None,
+        'operations': {
+            name: summarize([(latency, status) for op, latency, status in samples if op == name], elapsed)
+            for name in mix if any(op == name for op, _, _ in samples)
+        }
+    }
+    output = json.dumps(result, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output + '\n')
+    else:
+        print(output)
+    server_errors = sum(1 for _, _, status in samples if is_server_error(str(status)))
+    if server_errors:
+        raise SystemExit(f'{server_errors} requests failed with a server error or exception')
+
+
+if __name__ == '__main__':
+    main()
@@ -15,6 +15,23 @@ let ipsSensors = [];
 let users = [];
 let groups = [];
 
+// Pickers that query /search instead of rendering every object as an <option> in every
+// row; /catalog sets these and leaves their object lists out once they grow too large
+let remoteSearch = { addresses: false, users: false };
+
+// In remote search mode only the row's current value is rendered as an option
+function visibleOptions(list, selected) {
+    return selected === null ? list : list.filter(value => value === selected);
+}
+
+function searchParams(kinds) {
+    return {
+        kinds,
+        device: window.selectedDevice || '',
+        template: window.loadedTemplate || ''
+    };
+}
+
 function showNotification(message, type = 'success') {
     const container = document.getElementById('notification-container');
     if (!container) {
@@ -38,17 +55,71 @@ function showNotification(message, type = 'success') {
     }, 3000);
 }
 
-// New function to send logs to backend
-function logToBackend(message) {
+// Frontend log lines are buffered and posted to /log in batches: every
+// LOG_FLUSH_INTERVAL ms, as soon as LOG_BATCH_SIZE entries are waiting, and with
+// sendBeacon when the page is hidden. Entries beyond LOG_BUFFER_LIMIT are dropped
+// (oldest first) and only counted, so a failing page cannot flood the server.
+const LOG_FLUSH_INTERVAL = 5000;
+const LOG_BATCH_SIZE = 50;
+const LOG_BUFFER_LIMIT = 200;
+let logBuffer = [];
+let logDropped = 0;
+let logFlushTimer = null;
+let logBackoffUntil = 0;
+
+function logToBackend(message, level = 'debug') {
+    logBuffer.push({ level, message: String(message), time: new Date().toISOString() });
+    if (logBuffer.length > LOG_BUFFER_LIMIT) {
+        logDropped += logBuffer.length - LOG_BUFFER_LIMIT;
+        logBuffer = logBuffer.slice(-LOG_BUFFER_LIMIT);
+    }
+    if (logBuffer.length >= LOG_BATCH_SIZE) {
+        flushLogs();
+    } else if (!logFlushTimer) {
+        logFlushTimer = setTimeout(flushLogs, LOG_FLUSH_INTERVAL);
+    }
+}
+
+function takeLogBatch() {
+    const batch = { entries: logBuffer.splice(0, LOG_BATCH_SIZE), dropped: logDropped };
+    logDropped = 0;
+    return JSON.stringify(batch);
+}
+
+function flushLogs() {
+    clearTimeout(logFlushTimer);
+    logFlushTimer = null;
+    if (!logBuffer.length) {
+        return;
+    }
+    const wait = logBackoffUntil - Date.now();
+    if (wait > 0) {
+        logFlushTimer = setTimeout(flushLogs, wait);
+        return;
+    }
     fetch('/log', {
         method: 'POST',
         headers: { 'Content-Type': 'application/json' },
-        body: JSON.stringify({ message })
+        body: takeLogBatch()
+    }).then(response => {
+        if (response.status === 429) {
+            logBackoffUntil = Date.now() + 1000 * (parseInt(response.headers.get('Retry-After'), 10) || 10);
+        }
     }).catch(error => {
         console.error('Error sending log to backend:', error);
+    }).finally(() => {
+        if (logBuffer.length && !logFlushTimer) {
+            logFlushTimer = setTimeout(flushLogs, LOG_FLUSH_INTERVAL);
+        }
     });
 }
 
+document.addEventListener('visibilitychange', () => {
+    if (document.visibilityState === 'hidden' && logBuffer.length && navigator.sendBeacon) {
+        navigator.sendBeacon('/log', new Blob([takeLogBatch()], { type: 'application/json' }));
+    }
+});
+
 function addPolicy() {
     const policyId = Date.now().toString();
     policies.push({
@@ -247,29 +318,31 @@ function renderAddresses(container, addrItems, addrGroupItems, isdbItems, vipIte
     ];
 
     allItems.forEach((item, index) => {
+        const selectedOf = kind => remoteSearch.addresses ? (item.type === kind ? item.value : undefined) : null;
         const div = document.createElement('div');
         div.className = 'address-item';
         div.innerHTML = `
             <select class="address-select" onchange="updateAddressOrInternetService('${type}', ${index}, this.value)">
                 <option value="">Select Address/ISDB</option>
                 <optgroup label="Addresses">
-                    ${addresses.map(addr => `<option value="address:${addr}" ${item.type === 'address' && item.value === addr ? 'selected' : ''}>${addr}</option>`).join('')}
+                    ${visibleOptions(addresses, selectedOf('address')).map(addr => `<option value="address:${addr}" ${item.type === 'address' && item.value === addr ? 'selected' : ''}>${addr}</option>`).join('')}
                 </optgroup>
                 <optgroup label="Address Groups">
-                    ${addressGroups.map(agrp => `<option value="address_group:${agrp}" ${item.type === 'address_group' && item.value === agrp ? 'selected' : ''}>${agrp}</option>`).join('')}
+                    ${visibleOptions(addressGroups, selectedOf('address_group')).map(agrp => `<option value="address_group:${agrp}" ${item.type === 'address_group' && item.value === agrp ? 'selected' : ''}>${agrp}</option>`).join('')}
                 </optgroup>
                 <optgroup label="Internet Services">
-                    ${internetServices.map(isdb => `<option value="isdb:${isdb}" ${item.type === 'isdb' && item.value === isdb ? 'selected' : ''}>${isdb}</option>`).join('')}
+                    ${visibleOptions(internetServices, selectedOf('isdb')).map(isdb => `<option value="isdb:${isdb}" ${item.type === 'isdb' && item.value === isdb ? 'selected' : ''}>${isdb}</option>`).join('')}
                 </optgroup>
                 <optgroup label="Virtual IPs">
-                    ${vips.map(vip => `<option value="vip:${vip}" ${item.type === 'vip' && item.value === vip ? 'selected' : ''}>${vip}</option>`).join('')}
+                    ${visibleOptions(vips, selectedOf('vip')).map(vip => `<option value="vip:${vip}" ${item.type === 'vip' && item.value === vip ? 'selected' : ''}>${vip}</option>`).join('')}
                 </optgroup>
             </select>
             <button onclick="deleteAddressOrInternetService('${type}', ${index})">Delete</button>
         `;
         container.appendChild(div);
         initSearchableSelect(div.querySelector('.address-select'), {
-            placeholder: 'Select Address/ISDB'
+            placeholder: 'Select Address/ISDB',
+            remote: remoteSearch.addresses ? { url: '/search', params: () => searchParams('address,address_group,isdb,vip') } : null
         });
     });
 }
@@ -321,23 +394,25 @@ function renderUsersGroups(container, userItems, groupItems) {
     container.innerHTML = '';
     [...userItems, ...groupItems].forEach((item, index) => {
         const isUser = userItems.includes(item);
+        const selectedOf = kindIsUser => remoteSearch.users ? (isUser === kindIsUser ? item : undefined) : null;
         const div = document.createElement('div');
         div.className = 'user-group-item';
         div.innerHTML = `
             <select class="user-group-select" onchange="updateUserOrGroup(${index}, this.value)">
                 <option value="">Select User/Group</option>
                 <optgroup label="Users">
-                    ${users.map(user => `<option value="user:${user}" ${isUser && item === user ? 'selected' : ''}>${user}</option>`).join('')}
+                    ${visibleOptions(users, selectedOf(true)).map(user => `<option value="user:${user}" ${isUser && item === user ? 'selected' : ''}>${user}</option>`).join('')}
                 </optgroup>
                 <optgroup label="Groups">
-                    ${groups.map(group => `<option value="group:${group}" ${!isUser && item === group ? 'selected' : ''}>${group}</option>`).join('')}
+                    ${visibleOptions(groups, selectedOf(false)).map(group => `<option value="group:${group}" ${!isUser && item === group ? 'selected' : ''}>${group}</option>`).join('')}
                 </optgroup>
             </select>
             <button onclick="deleteUserOrGroup(${index})">Delete</button>
         `;
         container.appendChild(div);
         initSearchableSelect(div.querySelector('.user-group-select'), {
-            placeholder: 'Select User/Group'
+            placeholder: 'Select User/Group',
+            remote: remoteSearch.users ? { url: '/search', params: () => searchParams('user,group') } : null
         });
     });
 }
@@ -892,7 +967,7 @@ function clonePolicy(button) {
     fetch('/clone_policy', {
         method: 'POST',
         headers: { 'Content-Type': 'application/json' },
-        body: JSON.stringify({ policy_id: policyId })
+        body: JSON.stringify({ policy_id: policyId, template_name: window.loadedTemplate || '' })
     })
     .then(response => response.json())
     .then(data => {
@@ -1146,6 +1221,28 @@ function loadTemplateList() {
     });
 }
 
+function applyCatalog(config) {
+    interfaces = config.interfaces || [];
+    addresses = config.addresses || [];
+    addressGroups = config.address_groups || [];
+    internetServices = config.internet_services || [];
+    vips = config.vips || [];
+    ipPools = config.ip_pools || [];
+    services = config.services || [];
+    serviceGroups = config.service_groups || {};
+    sslSshProfiles = config.ssl_ssh_profiles || [];
+    webfilterProfiles = config.webfilter_profiles || [];
+    applicationLists = config.application_lists || [];
+    avProfiles = config.av_profiles || [];
+    ipsSensors = config.ips_sensors || [];
+    users = config.users || [];
+    groups = config.groups || [];
+    remoteSearch = {
+        addresses: Boolean(config.remote_search && config.remote_search.addresses),
+        users: Boolean(config.remote_search && config.remote_search.users)
+    };
+}
+
 function loadTemplate() {
     const select = document.getElementById('template-select');
     const templateName = select?.value;
@@ -1198,41 +1295,23 @@ function loadTemplate() {
                 groups: p.groups || []
             }));
 
-            interfaces = data.config.interfaces || [];
-            addresses = data.config.addresses || [];
-            addressGroups = data.config.address_groups || [];
-            internetServices = data.config.internet_services || [];
-            vips = data.config.vips || [];
-            ipPools = data.config.ip_pools || [];
-            services = data.config.services || [];
-            serviceGroups = data.config.service_groups || {};
-            sslSshProfiles = data.config.ssl_ssh_profiles || [];
-            webfilterProfiles = data.config.webfilter_profiles || [];
-            applicationLists = data.config.application_lists || [];
-            avProfiles = data.config.av_profiles || [];
-            ipsSensors = data.config.ips_sensors || [];
-            users = data.config.users || [];
-            groups = data.config.groups || [];
+            window.loadedTemplate = templateName;
 
+            // The catalog endpoint merges the template's objects with the stored parsed config
+            const catalogParams = new URLSearchParams({ template: templateName });
+            if (window.selectedDevice) {
+                catalogParams.set('device', window.selectedDevice);
+            }
             try {
-                fetch('/parse_config', { method: 'POST', body: new FormData() })
-                    .then(res => res.json())
+                fetch(`/catalog?${catalogParams.toString()}`)
+                    .then(res => {
+                        if (!res.ok) {
+                            throw new Error(`Catalog request failed with status ${res.status}`);
+                        }
+                        return res.json();
+                    })
                     .then(config => {
-                        interfaces = [...new Set([...interfaces, ...(config.interfaces || [])])];
-                        addresses = [...new Set([...addresses, ...(config.addresses || [])])];
-                        addressGroups = [...new Set([...addressGroups, ...(config.address_groups || [])])];
-                        internetServices = [...new Set([...internetServices, ...(config.internet_services || [])])];
-                        vips = [...new Set([...vips, ...(config.vips || [])])];
-                        ipPools = [...new Set([...ipPools, ...(config.ip_pools || [])])];
-                        services = [...services, ...(config.services || []).filter(s => !services.some(existing => existing.name === s.name))];
-                        serviceGroups = { ...serviceGroups, ...(config.service_groups || {}) };
-                        sslSshProfiles = [...new Set([...sslSshProfiles, ...(config.ssl_ssh_profiles || [])])];
-                        webfilterProfiles = [...new Set([...webfilterProfiles, ...(config.webfilter_profiles || [])])];
-                        applicationLists = [...new Set([...applicationLists, ...(config.application_lists || [])])];
-                        avProfiles = [...new Set([...avProfiles, ...(config.av_profiles || [])])];
-                        ipsSensors = [...new Set([...ipsSensors, ...(config.ips_sensors || [])])];
-                        users = [...new Set([...users, ...(config.users || [])])];
-                        groups = [...new Set([...groups, ...(config.groups || [])])];
+                        applyCatalog(config);
                         updateDropdowns();
                         renderPolicyList();
                         if (policies.length > 0) {
@@ -1245,7 +1324,10 @@ function loadTemplate() {
                         showNotification(`Template '${templateName}' loaded successfully`, 'success');
                         logToBackend(`Template '${templateName}' loaded successfully`);
                     })
-                    .catch(() => {
+                    .catch(error => {
+                        console.error('Error loading catalog, using template objects only:', error);
+                        logToBackend(`Error loading catalog: ${error.message}`);
+                        applyCatalog(data.config);
                         updateDropdowns();
                         renderPolicyList();
                         if (policies.length > 0) {
@@ -1261,6 +1343,7 @@ function loadTemplate() {
             } catch (error) {
                 console.error('Error merging config data:', error);
                 logToBackend(`Error merging config data: ${error.message}`);
+                applyCatalog(data.config);
                 updateDropdowns();
                 renderPolicyList();
                 if (policies.length > 0) {
@@ -1562,28 +1645,36 @@ function importConfig() {
     }
     const formData = new FormData();
     formData.append('config_file', fileInput.files[0]);
+    const deviceName = document.getElementById('device-name')?.value.trim();
+    if (deviceName) {
+        formData.append('device', deviceName);
+    }
 
-    fetch('/parse_config', {
+    // Parsing runs as a background job; progress arrives as server-sent events
+    fetch('/parse_jobs', {
         method: 'POST',
         body: formData
     })
-    .then(response => response.json())
-    .then(data => {
-        interfaces = data.interfaces || [];
-        addresses = data.addresses || [];
-        addressGroups = data.address_groups || [];
-        internetServices = data.internet_services || [];
-        vips = data.vips || [];
-        ipPools = data.ip_pools || [];
-        services = data.services || [];
-        serviceGroups = data.service_groups || {};
-        sslSshProfiles = data.ssl_ssh_profiles || [];
-        webfilterProfiles = data.webfilter_profiles || [];
-        applicationLists = data.application_lists || [];
-        avProfiles = data.av_profiles || [];
-        ipsSensors = data.ips_sensors || [];
-        users = data.users || [];
-        groups = data.groups || [];
+    .then(response => response.json().then(data => ({ ok: response.ok, data })))
+    .then(({ ok, data }) => {
+        if (!ok) {
+            throw new Error(data.error || 'Failed to queue config import');
+        }
+        return waitForParseJob(data.events_url);
+    })
+    .then(job => fetch(`/catalog?device=${encodeURIComponent(job.device)}`)
+        .then(response => response.json())
+        .then(catalog => ({ job, catalog })))
+    .then(({ job, catalog }) => {
+        applyCatalog(catalog);
+        window.selectedDevice = job.device;
+        const deviceSelect = document.getElementById('device-select');
+        if (deviceSelect && !Array.from(deviceSelect.options).some(opt => opt.value === job.device)) {
+            deviceSelect.add(new Option(job.device, job.device));
+        }
+        if (deviceSelect) {
+            deviceSelect.value = job.device;
+        }
         
         updateDropdowns();
         renderPolicyList();
@@ -1597,9 +1688,52 @@ function importConfig() {
         console.error('Error importing config:', error);
         logToBackend(`Error importing config: ${error.message}`);
         showNotification('Error importing config', 'error');
+    })
+    .finally(() => {
+        const progressElement = document.getElementById('parse-progress');
+        if (progressElement) {
+            progressElement.textContent = '';
+        }
     });
 }
 
+function waitForParseJob(eventsUrl) {
+    return new Promise((resolve, reject) => {
+        const progressElement = document.getElementById('parse-progress');
+        const source = new EventSource(eventsUrl);
+        source.onmessage = event => {
+            const job = JSON.parse(event.data);
+            const progress = job.progress || {};
+            if (progressElement && progress.bytes_total) {
+                const percent = Math.round(100 * (progress.bytes_processed || 0) / progress.bytes_total);
+                progressElement.textContent = `Parsing ${job.device}: ${progress.stage} (${percent}%)`;
+            }
+            if (job.status === 'done') {
+                source.close();
+                resolve(job);
+            } else if (job.status === 'failed') {
+                source.close();
+                reject(new Error(job.error || 'Config parsing failed'));
+            }
+        };
+        source.onerror = () => {
+            source.close();
+            reject(new Error('Lost connection to parse job events'));
+        };
+    });
+}
+
+function selectDevice(device) {
+    logToBackend(`Switching to device: ${device || 'most recent import'}`);
+    const url = new URL(window.location.href);
+    if (device) {
+        url.searchParams.set('device', device);
+    } else {
+        url.searchParams.delete('device');
+    }
+    window.location.href = url.toString();
+}
+
 function generatePolicies() {
     if (!policies.length) {
         console.error('No policies to generate');
@@ -1642,6 +1776,9 @@ function generatePolicies() {
         users: p.users,
         groups: p.groups
     }))));
+    if (window.selectedDevice) {
+        formData.append('device', window.selectedDevice);
+    }
 
     fetch('/generate_policy', {
         method: 'POST',
@@ -1712,10 +1849,9 @@ function toggleTheme() {
     toggleButton.textContent = newTheme === 'dark' ? '☀️ Light Mode' : '🌙 Dark Mode';
     toggleButton.setAttribute('aria-label', `Toggle ${newTheme === 'dark' ? 'light' : 'dark'} mode`);
     
-    // Switch logo based on theme with cache-busting
+    // Switch logo based on theme (logo URLs carry a content hash, so no cache-busting is needed)
     if (logo) {
-        const cacheBuster = `?v=${Date.now()}`;
-        const newSrc = (newTheme === 'dark' ? logo.getAttribute('data-dark-src') : logo.getAttribute('data-light-src')) + cacheBuster;
+        const newSrc = newTheme === 'dark' ? logo.getAttribute('data-dark-src') : logo.getAttribute('data-light-src');
         console.log(`Switching logo to: ${newSrc}`);
         logToBackend(`Switching logo to: ${newSrc}`);
         logo.src = newSrc;
@@ -1741,10 +1877,9 @@ document.addEventListener('DOMContentLoaded', () => {
     toggleButton.textContent = initialTheme === 'dark' ? '☀️ Light Mode' : '🌙 Dark Mode';
     toggleButton.setAttribute('aria-label', `Toggle ${initialTheme === 'dark' ? 'light' : 'dark'} mode`);
     
-    // Set initial logo based on theme with cache-busting
+    // Set initial logo based on theme
     if (logo) {
-        const cacheBuster = `?v=${Date.now()}`;
-        const initialSrc = (initialTheme === 'dark' ? logo.getAttribute('data-dark-src') : logo.getAttribute('data-light-src')) + cacheBuster;
+        const initialSrc = initialTheme === 'dark' ? logo.getAttribute('data-dark-src') : logo.getAttribute('data-light-src');
         console.log(`Setting initial logo to: ${initialSrc}`);
         logToBackend(`Setting initial logo to: ${initialSrc}`);
         logo.src = initialSrc;
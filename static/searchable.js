@@ -1,6 +1,11 @@
 // searchable.js (Version 1.3)
+// options.remote = { url, params: () => ({...}), limit, debounce } queries the server-side
+// search endpoint instead of filtering the options present in the select element.
 function initSearchableSelect(selectElement, options = {}) {
     const placeholder = options.placeholder || 'Select an option';
+    const remote = options.remote || null;
+    let searchTimer = null;
+    let searchSequence = 0;
 
     // Create wrapper for the combo box
     const wrapper = document.createElement('div');
@@ -28,12 +33,53 @@ function initSearchableSelect(selectElement, options = {}) {
         optgroup: opt.closest('optgroup') ? opt.closest('optgroup').label : null
     }));
 
+    // Add an option returned by the server to the select element so it can be selected
+    function ensureOption(opt) {
+        if (originalOptions.some(o => o.value === opt.value)) {
+            return;
+        }
+        const group = Array.from(selectElement.querySelectorAll('optgroup')).find(g => g.label === opt.optgroup);
+        (group || selectElement).appendChild(new Option(opt.text, opt.value));
+        originalOptions.push({ ...opt, selected: false });
+    }
+
+    // Query the search endpoint, debounced; responses to superseded queries are dropped
+    function searchRemote(filter) {
+        clearTimeout(searchTimer);
+        searchTimer = setTimeout(() => {
+            const sequence = ++searchSequence;
+            const params = new URLSearchParams({ q: filter, limit: remote.limit || 50 });
+            Object.entries(remote.params ? remote.params() : {}).forEach(([key, value]) => {
+                if (value) params.set(key, value);
+            });
+            fetch(`${remote.url}?${params.toString()}`)
+                .then(response => response.json())
+                .then(data => {
+                    if (sequence !== searchSequence) return;
+                    renderOptions((data.results || []).map(result => ({
+                        value: result.value,
+                        text: result.name,
+                        optgroup: result.label,
+                        selected: result.value === selectElement.value
+                    })));
+                })
+                .catch(error => console.error('Search request failed:', error));
+        }, remote.debounce || 150);
+    }
+
     // Render dropdown options based on filter
     function renderDropdown(filter = '') {
-        dropdown.innerHTML = '';
-        const filteredOptions = originalOptions.filter(opt => 
+        if (remote) {
+            searchRemote(filter);
+            return;
+        }
+        renderOptions(originalOptions.filter(opt =>
             opt.text.toLowerCase().includes(filter.toLowerCase())
-        );
+        ));
+    }
+
+    function renderOptions(filteredOptions) {
+        dropdown.innerHTML = '';
 
         // Group options by optgroup, preserving order
         const optgroupOrder = ['Addresses', 'Address Groups', 'Internet Services', 'Virtual IPs', 'Users', 'Groups'];
@@ -59,6 +105,7 @@ function initSearchableSelect(selectElement, options = {}) {
                     option.textContent = opt.text;
                     option.dataset.value = opt.value;
                     option.addEventListener('click', () => {
+                        if (remote) ensureOption(opt);
                         selectElement.value = opt.value;
                         selectElement.dispatchEvent(new Event('change', { bubbles: true }));
                         comboInput.value = opt.text;